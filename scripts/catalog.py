@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+"""
+Content catalog shared by the migration scripts.
+
+Usage as a library:
+    from catalog import Catalog
+    with Catalog.for_path(posts_dir) as catalog:
+        catalog.refresh(posts_dir)
+        for path in catalog.files(posts_dir, suffixes=(".md",), metadata="broken"):
+            ...
+            catalog.record(path, new_text, "my_script")
+
+Usage as a script, to refresh a site's catalog and summarize it:
+    python3 scripts/catalog.py myblog
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import yaml
+
+CATALOG_NAME = ".nicolino-catalog.sqlite"
+
+# Text formats whose content is hashed and checked for metadata
+TEXT_FORMATS = {
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".rst": "rst",
+    ".txt": "text",
+    ".html": "html",
+    ".htm": "html",
+    ".org": "org",
+    ".textile": "textile",
+    ".adoc": "asciidoc",
+    ".ipynb": "ipynb",
+    ".tex": "latex",
+    ".wiki": "wiki",
+}
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".svg")
+
+# Nikola metadata as convert_metadata.py reads it: ".. key: value" lines,
+# with a value, in the first HTML comment block anywhere in the file
+NIKOLA_COMMENT_RE = re.compile(r"<!--\s*\n(.*?)\n-->", re.DOTALL)
+NIKOLA_LINE_RE = re.compile(r"^\s*\.\. (.*?): (.+)", re.MULTILINE)
+
+# Bumped when metadata_status changes, so existing rows are classified again
+CATALOG_VERSION = 2
+
+# Prefer the C loader; fall back to the pure Python one
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT,
+    format TEXT NOT NULL,
+    metadata TEXT,
+    last_transform TEXT,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_metadata ON files (metadata);
+"""
+
+
+def detect_format(name: str) -> str:
+    suffix = os.path.splitext(name)[1].lower()
+    if suffix in TEXT_FORMATS:
+        return TEXT_FORMATS[suffix]
+    return "image" if suffix in IMAGE_SUFFIXES else "other"
+
+
+def metadata_status(text: str) -> str:
+    """Classify the metadata at the top of a text file.
+
+    "yaml" for YAML frontmatter that parses and has a title, "broken" for a
+    frontmatter block that doesn't, "nikola" for Nikola metadata that
+    convert_metadata.py would convert, and "none" otherwise.
+    """
+    if text.startswith("---\n"):
+        parts = text.split("---\n", 2)
+        if len(parts) < 3:
+            return "broken"
+        try:
+            data = yaml.load(parts[1], Loader=Loader)
+        except yaml.YAMLError:
+            return "broken"
+        return "yaml" if isinstance(data, dict) and data.get("title") else "broken"
+    if text.startswith("---"):
+        # convert_metadata.py leaves these alone
+        return "none"
+    comment = NIKOLA_COMMENT_RE.search(text)
+    if comment and NIKOLA_LINE_RE.search(comment.group(1)):
+        return "nikola"
+    return "none"
+
+
+def analyze(path: Path, data: Optional[bytes] = None):
+    """Hash and metadata status of a text file, reading it if needed."""
+    if data is None:
+        data = path.read_bytes()
+    text = data.decode("utf-8", errors="replace")
+    return hashlib.sha256(data).hexdigest(), metadata_status(text)
+
+
+class Catalog:
+    """The catalog of one site, rooted at its directory."""
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.db = sqlite3.connect(root / CATALOG_NAME)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != CATALOG_VERSION:
+            # Make refresh() read every file again, keeping last_transform
+            self.db.execute("UPDATE files SET mtime_ns = -1")
+            self.db.execute(f"PRAGMA user_version = {CATALOG_VERSION}")
+            self.db.commit()
+
+    @classmethod
+    def for_path(cls, path: Path) -> "Catalog":
+        """Open the catalog of the site a path belongs to.
+
+        The site is the nearest directory (path itself or a parent) with a
+        catalog or a conf.yml, or else the parent of the content directory.
+        """
+        path = Path(path)
+        for candidate in [path, *path.parents]:
+            if (candidate / CATALOG_NAME).exists() or (candidate / "conf.yml").exists():
+                return cls(candidate)
+        if "content" in path.parts:
+            return cls(Path(*path.parts[:path.parts.index("content")]) or Path("."))
+        return cls(path if path.is_dir() else path.parent)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def key(self, path: Path) -> str:
+        return Path(os.path.relpath(path, self.root)).as_posix()
+
+    def scan(self, directory: Path, found: dict):
+        """Stat every file under directory with one scandir per folder."""
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    self.scan(Path(entry.path), found)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    found[self.key(entry.path)] = (entry.path, stat.st_size, stat.st_mtime_ns)
+
+    def refresh(self, under: Optional[Path] = None, transform: Optional[str] = None, jobs: int = 0) -> dict:
+        """Bring the rows under a directory (default: content/) up to date.
+
+        Unchanged files (same size and mtime) are not read. New and changed
+        text files are hashed and classified, in parallel; their
+        last_transform is set to transform. Rows for files that are gone
+        are removed. Returns counts of new, changed, removed and unchanged
+        files.
+        """
+        under = Path(under) if under is not None else self.root / "content"
+        found = {}
+        if under.is_dir():
+            self.scan(under, found)
+
+        prefix = self.key(under)
+        prefix = "" if prefix == "." else prefix + "/"
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.db.execute(
+                "SELECT path, size, mtime_ns FROM files WHERE path >= ? AND path < ?",
+                (prefix, prefix + "\U0010ffff"),
+            )
+        }
+
+        stale = [key for key, (_, size, mtime_ns) in found.items() if known.get(key) != (size, mtime_ns)]
+        removed = [key for key in known if key not in found]
+
+        text = [key for key in stale if detect_format(key) in TEXT_FORMATS.values()]
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            analyzed = dict(zip(text, pool.map(lambda key: analyze(Path(found[key][0])), text)))
+
+        now = time.time()
+        rows = []
+        for key in stale:
+            _, size, mtime_ns = found[key]
+            digest, status = analyzed.get(key, (None, None))
+            rows.append((key, size, mtime_ns, digest, detect_format(key), status, transform, now))
+        self.upsert(rows)
+        self.db.executemany("DELETE FROM files WHERE path = ?", [(key,) for key in removed])
+        self.db.commit()
+
+        new = sum(1 for key in stale if key not in known)
+        return {
+            "new": new,
+            "changed": len(stale) - new,
+            "removed": len(removed),
+            "unchanged": len(found) - len(stale),
+        }
+
+    def upsert(self, rows: Iterable[tuple]):
+        self.db.executemany(
+            """INSERT INTO files (path, size, mtime_ns, hash, format, metadata, last_transform, updated)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (path) DO UPDATE SET
+                   size = excluded.size, mtime_ns = excluded.mtime_ns, hash = excluded.hash,
+                   format = excluded.format, metadata = excluded.metadata,
+                   last_transform = COALESCE(excluded.last_transform, files.last_transform),
+                   updated = excluded.updated""",
+            rows,
+        )
+
+    def record(self, path: Path, text: Optional[str], transform: str):
+        """Record a file a script just wrote, from its text if given."""
+        stat = path.stat()
+        digest, status = None, None
+        fmt = detect_format(path.name)
+        if fmt in TEXT_FORMATS.values():
+            digest, status = analyze(path, text.encode("utf-8") if text is not None else None)
+        self.upsert([(self.key(path), stat.st_size, stat.st_mtime_ns, digest, fmt, status, transform, time.time())])
+
+    def forget(self, path: Path):
+        """Drop the row of a file a script removed or renamed."""
+        self.db.execute("DELETE FROM files WHERE path = ?", (self.key(path),))
+
+    def files(
+        self,
+        under: Path,
+        suffixes: Optional[Iterable[str]] = None,
+        metadata: Optional[Iterable[str]] = None,
+        recursive: bool = True,
+    ) -> List[Path]:
+        """Paths of catalogued files under a directory, sorted, optionally filtered."""
+        prefix = self.key(under)
+        prefix = "" if prefix == "." else prefix + "/"
+        query = "SELECT path FROM files WHERE path >= ? AND path < ?"
+        params = [prefix, prefix + "\U0010ffff"]
+        if not recursive:
+            query += " AND instr(substr(path, ?), '/') = 0"
+            params.append(len(prefix) + 1)
+        if metadata is not None:
+            metadata = list(metadata)
+            query += f" AND metadata IN ({', '.join('?' * len(metadata))})"
+            params.extend(metadata)
+        paths = [row[0] for row in self.db.execute(query + " ORDER BY path", params)]
+        if suffixes is not None:
+            suffixes = tuple(suffixes)
+            paths = [path for path in paths if path.endswith(suffixes)]
+        return [self.root / path for path in paths]
+
+    def counts(self, under: Path, column: str) -> dict:
+        """Number of files under a directory per format or metadata status."""
+        assert column in ("format", "metadata", "last_transform")
+        prefix = self.key(under)
+        prefix = "" if prefix == "." else prefix + "/"
+        return dict(self.db.execute(
+            f"SELECT {column}, COUNT(*) FROM files WHERE path >= ? AND path < ? GROUP BY {column}",
+            (prefix, prefix + "\U0010ffff"),
+        ))
+
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python3 catalog.py <site directory>", file=sys.stderr)
+        sys.exit(1)
+    site = Path(sys.argv[1])
+    with Catalog(site) as catalog:
+        start = time.perf_counter()
+        stats = catalog.refresh()
+        elapsed = time.perf_counter() - start
+        print(f"Refreshed {site / CATALOG_NAME} in {elapsed:.2f}s: "
+              + ", ".join(f"{count} {name}" for name, count in stats.items()))
+        for column in ("format", "metadata", "last_transform"):
+            counts = catalog.counts(site / "content", column)
+            print(f"  {column}: " + ", ".join(f"{name}={count}" for name, count in sorted(counts.items(), key=str)))
+
+
+if __name__ == "__main__":
+    main()
@@ -26,15 +26,47 @@ Usage:
     python scripts/convert_metadata.py content/posts/file.md
     python scripts/convert_metadata.py content/posts/*.md
     python scripts/convert_metadata.py --dry-run content/posts/*.md
+    python scripts/convert_metadata.py --jobs 8 content
 """
 
+import io
+import os
 import re
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+from catalog import Catalog
+
 # From Nikola's NikolaMetadata class
 nikola_re = re.compile(r"^\s*\.\. (.*?): (.*)")
 
+# Nikola's HTML comment metadata wrapper
+comment_re = re.compile(r"<!--\s*\n(.*?)\n-->", re.DOTALL)
+
+# How much of each file is read to look for metadata
+HEAD_SIZE = 8192
+
+# File types converted when a directory is given
+SUFFIXES = (".md", ".rst", ".txt")
+
+# The ruamel.yaml emitter, created once per process (False if unavailable)
+_emitter = None
+
+
+def get_emitter():
+    """Return the shared ruamel.yaml emitter, or None if ruamel.yaml is missing."""
+    global _emitter
+    if _emitter is None:
+        try:
+            from ruamel.yaml import YAML
+
+            _emitter = YAML(typ="safe")
+            _emitter.default_flow_style = False
+        except ImportError:
+            _emitter = False
+    return _emitter or None
+
 
 def extract_nikola_metadata(source_text: str) -> dict:
     """Extract metadata from Nikola format.
@@ -58,19 +90,13 @@ def write_yaml_metadata(metadata: dict) -> str:
     This is adapted from YAMLMetadata.write_metadata()
     https://github.com/getnikola/nikola/blob/master/nikola/metadata_extractors.py
     """
-    try:
-        from ruamel.yaml import YAML
-
-        yaml = YAML(typ="safe")
-        yaml.default_flow_style = False
-
-        import io
-
+    yaml = get_emitter()
+    if yaml is not None:
         stream = io.StringIO()
         yaml.dump(metadata, stream)
         stream.seek(0)
         return "\n".join(("---", stream.read().strip(), "---", ""))
-    except ImportError:
+    else:
         # Fallback if ruamel.yaml is not available
         lines = []
         order = [
@@ -154,7 +180,7 @@ def extract_html_comment_metadata(content: str) -> tuple:
     Actual content here
     """
     # Find HTML comment block
-    comment_match = re.search(r"<!--\s*\n(.*?)\n-->", content, re.DOTALL)
+    comment_match = comment_re.search(content)
     if not comment_match:
         return None, 0
 
@@ -167,43 +193,85 @@ def extract_html_comment_metadata(content: str) -> tuple:
     return metadata, content_start
 
 
-def convert_file(file_path: Path, dry_run: bool = False) -> bool:
-    """Convert a single file from Nikola to Nicolino format."""
-    print(f"Processing: {file_path}")
+def build_content(content: str, metadata: dict, content_start: int) -> str:
+    """Replace everything before content_start with YAML frontmatter."""
+    # Get the actual content (skip blank lines after HTML comment)
+    while content_start < len(content) and content[content_start] in "\n\r\t ":
+        content_start += 1
+
+    actual_content = content[content_start:]
+
+    # Build new content with YAML metadata
+    yaml_metadata = write_yaml_metadata(metadata)
+    return yaml_metadata + "\n" + actual_content
 
-    content = file_path.read_text()
 
-    # Check if already has YAML metadata (starts with ---)
+def convert_content(content: str) -> tuple:
+    """Convert Nikola metadata in content to YAML frontmatter, in memory.
+
+    Returns (new_content, metadata), or (None, {}) if the content already
+    has YAML metadata or has no Nikola metadata.
+    """
     if content.startswith("---"):
-        print(f"  ✓ Already has YAML metadata, skipping")
-        return False
+        return None, {}
 
     # Try to extract Nikola metadata from HTML comment
     metadata, content_start = extract_html_comment_metadata(content)
 
     if not metadata:
-        print(f"  ✗ No Nikola metadata found, skipping")
-        return False
+        return None, {}
 
-    # Get the actual content (skip blank lines after HTML comment)
-    while content_start < len(content) and content[content_start] in "\n\r\t ":
-        content_start += 1
+    return build_content(content, metadata, content_start), metadata
 
-    actual_content = content[content_start:]
 
-    # Build new content with YAML metadata
-    yaml_metadata = write_yaml_metadata(metadata)
-    new_content = yaml_metadata + "\n" + actual_content
+def convert_path(file_path: Path, dry_run: bool = False) -> tuple:
+    """Convert a single file, returning (converted, output_lines).
 
-    if dry_run:
-        print(f"  [DRY RUN] Would convert with {len(metadata)} metadata fields")
-        for k, v in metadata.items():
-            print(f"    {k}: {v}")
-    else:
-        file_path.write_text(new_content)
-        print(f"  ✓ Converted successfully")
+    Only the head of the file is read when it holds the whole metadata
+    comment and the file is not rewritten.
+    """
+    lines = [f"Processing: {file_path}"]
+
+    with file_path.open() as f:
+        content = f.read(HEAD_SIZE)
+        complete = len(content) < HEAD_SIZE
+
+        # Check if already has YAML metadata (starts with ---)
+        if content.startswith("---"):
+            lines.append(f"  ✓ Already has YAML metadata, skipping")
+            return False, lines
+
+        # Try to extract Nikola metadata from HTML comment
+        metadata, content_start = extract_html_comment_metadata(content)
+        if metadata is None and not complete:
+            # The comment starts or ends past the head
+            content += f.read()
+            complete = True
+            metadata, content_start = extract_html_comment_metadata(content)
+
+        if not metadata:
+            lines.append(f"  ✗ No Nikola metadata found, skipping")
+            return False, lines
+
+        if dry_run:
+            lines.append(f"  [DRY RUN] Would convert with {len(metadata)} metadata fields")
+            for k, v in metadata.items():
+                lines.append(f"    {k}: {v}")
+            return True, lines
 
-    return True
+        if not complete:
+            content += f.read()
+
+    file_path.write_text(build_content(content, metadata, content_start))
+    lines.append(f"  ✓ Converted successfully")
+    return True, lines
+
+
+def convert_file(file_path: Path, dry_run: bool = False) -> bool:
+    """Convert a single file from Nikola to Nicolino format."""
+    converted, lines = convert_path(file_path, dry_run)
+    print("\n".join(lines))
+    return converted
 
 
 def main():
@@ -213,40 +281,64 @@ def main():
             "       python convert_metadata.py --dry-run <file> [file2 ...]",
             file=sys.stderr,
         )
+        print(
+            "       python convert_metadata.py --jobs N <file|dir> [...]",
+            file=sys.stderr,
+        )
         sys.exit(1)
 
     dry_run = "--dry-run" in sys.argv
     if dry_run:
         sys.argv.remove("--dry-run")
 
+    jobs = os.cpu_count() or 1
+    if "--jobs" in sys.argv:
+        i = sys.argv.index("--jobs")
+        jobs = max(1, int(sys.argv[i + 1]))
+        del sys.argv[i:i + 2]
+
     files = []
+    catalog = None
+    skipped = 0
     for arg in sys.argv[1:]:
         path = Path(arg)
         if path.is_dir():
-            # Recursively find all markdown, rst, and txt files
-            files.extend(path.glob("**/*.md"))
-            files.extend(path.glob("**/*.rst"))
-            files.extend(path.glob("**/*.txt"))
+            # Markdown, rst and txt files the catalog found Nikola metadata in
+            if catalog is None:
+                catalog = Catalog.for_path(path)
+            catalog.refresh(path)
+            for suffix in SUFFIXES:
+                files.extend(catalog.files(path, suffixes=(suffix,), metadata=("nikola",)))
+            skipped += len(catalog.files(path, suffixes=SUFFIXES, metadata=("yaml", "broken", "none")))
         else:
             files.append(path)
 
-    if not files:
+    if not files and not skipped:
         print("No files found to process", file=sys.stderr)
         sys.exit(1)
 
     print(f"Found {len(files)} file(s) to process\n")
+    if skipped:
+        print(f"Skipping {skipped} file(s) the catalog knows have no Nikola metadata\n")
 
     converted = 0
-    skipped = 0
 
-    for file_path in files:
-        if convert_file(file_path, dry_run):
-            converted += 1
-        else:
-            skipped += 1
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(files) // (jobs * 8))
+        results = pool.map(convert_path, files, [dry_run] * len(files), chunksize=chunksize)
+        for file_path, (was_converted, lines) in zip(files, results):
+            print("\n".join(lines))
+            if was_converted:
+                converted += 1
+                if catalog is not None and not dry_run:
+                    catalog.record(file_path, None, "convert_metadata")
+            else:
+                skipped += 1
+    if catalog is not None:
+        catalog.close()
 
     print(f"\n{'=' * 60}")
-    print(f"Processed {len(files)} file(s):")
+    print(f"Processed {converted + skipped} file(s):")
     print(f"  Converted: {converted}")
     print(f"  Skipped:   {skipped}")
 
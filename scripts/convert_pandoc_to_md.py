@@ -22,6 +22,8 @@ from pathlib import Path
 
 import yaml
 
+from catalog import Catalog
+
 
 def extract_yaml_frontmatter(content):
     """Extract YAML frontmatter from content."""
@@ -37,19 +39,13 @@ def extract_yaml_frontmatter(content):
     return frontmatter, remaining_content
 
 
-def convert_pandoc_to_markdown(input_path, dry_run=False):
-    """Convert a Pandoc file to Markdown."""
-    print(f"Processing: {input_path}")
-
-    content = input_path.read_text()
-
-    # Extract YAML frontmatter
-    frontmatter, body_content = extract_yaml_frontmatter(content)
-
-    if frontmatter is None:
-        print(f"  ✗ No YAML frontmatter found, skipping")
-        return False
+def convert_body(body_content):
+    """Convert an rst body to Markdown with pandoc.
 
+    Returns (markdown_body, warning). If pandoc fails or is missing, the
+    original body is returned with a warning. Raises
+    subprocess.TimeoutExpired if pandoc takes too long.
+    """
     # Try to convert using pandoc, but fall back to keeping original if it fails
     try:
         # Use pandoc to convert from the input format to markdown
@@ -63,19 +59,65 @@ def convert_pandoc_to_markdown(input_path, dry_run=False):
         )
 
         if result.returncode != 0:
-            print(f"  ⚠ Pandoc conversion failed, keeping original content")
-            markdown_body = body_content
-        else:
-            markdown_body = result.stdout
+            return body_content, "Pandoc conversion failed, keeping original content"
+        return result.stdout, None
+    except FileNotFoundError:
+        return body_content, "Pandoc not found in PATH, keeping original content"
+
+
+def convert_content(content):
+    """Convert a file with YAML frontmatter to Markdown, in memory.
+
+    Returns (new_content, warning), or (None, None) if there is no YAML
+    frontmatter. Raises subprocess.TimeoutExpired like convert_body.
+    """
+    # Extract YAML frontmatter
+    frontmatter, body_content = extract_yaml_frontmatter(content)
+
+    if frontmatter is None:
+        return None, None
+
+    markdown_body, warning = convert_body(body_content)
+
+    # Reconstruct with YAML frontmatter
+    return f"---\n{frontmatter}---\n\n{markdown_body}", warning
+
+
+def find_pandoc_extensions(config):
+    """List the file extensions (without dot) that conf.yml hands to Pandoc."""
+    # Get the formats configuration (pandoc_formats in current conf.yml,
+    # options.formats in older ones)
+    formats = config.get("pandoc_formats") or config.get("options", {}).get("formats", {})
+
+    # Find which extensions use Pandoc (rst format)
+    extensions = []
+    for ext, format_name in formats.items():
+        if format_name == "rst":
+            # Remove the leading dot
+            extensions.append(ext.lstrip("."))
+        elif format_name in ["rst", "markdown", "html"]:
+            # Add other pandoc-supported formats if needed
+            extensions.append(ext.lstrip("."))
+    return extensions
+
+
+def convert_pandoc_to_markdown(input_path, dry_run=False, catalog=None):
+    """Convert a Pandoc file to Markdown."""
+    print(f"Processing: {input_path}")
+
+    content = input_path.read_text()
+
+    try:
+        new_content, warning = convert_content(content)
     except subprocess.TimeoutExpired:
         print(f"  ✗ Pandoc conversion timed out")
         return False
-    except FileNotFoundError:
-        print(f"  ⚠ Pandoc not found in PATH, keeping original content")
-        markdown_body = body_content
 
-    # Reconstruct with YAML frontmatter
-    new_content = f"---\n{frontmatter}---\n\n{markdown_body}"
+    if new_content is None:
+        print(f"  ✗ No YAML frontmatter found, skipping")
+        return False
+    if warning:
+        print(f"  ⚠ {warning}")
 
     # Determine output path (.md instead of original extension)
     output_path = input_path.with_suffix(".md")
@@ -90,6 +132,10 @@ def convert_pandoc_to_markdown(input_path, dry_run=False):
         # Remove the original file
         input_path.unlink()
 
+        if catalog is not None:
+            catalog.forget(input_path)
+            catalog.record(output_path, new_content, "pandoc")
+
         print(f"  ✓ Converted to: {output_path}")
 
     return True
@@ -118,18 +164,7 @@ def main():
     with open(config_path, "r") as f:
         config = yaml.safe_load(f)
 
-    # Get the formats configuration
-    formats = config.get("options", {}).get("formats", {})
-
-    # Find which extensions use Pandoc (rst format)
-    pandoc_extensions = []
-    for ext, format_name in formats.items():
-        if format_name == "rst":
-            # Remove the leading dot
-            pandoc_extensions.append(ext.lstrip("."))
-        elif format_name in ["rst", "markdown", "html"]:
-            # Add other pandoc-supported formats if needed
-            pandoc_extensions.append(ext.lstrip("."))
+    pandoc_extensions = find_pandoc_extensions(config)
 
     if not pandoc_extensions:
         print("No Pandoc-configured file extensions found in conf.yml", file=sys.stderr)
@@ -142,12 +177,15 @@ def main():
         print(f"Error: Content directory '{content_dir}' not found", file=sys.stderr)
         sys.exit(1)
 
-    # Find all files with Pandoc extensions
+    # Find all files with Pandoc extensions in the content catalog
+    catalog = Catalog.for_path(content_dir)
+    catalog.refresh(content_dir)
     files_to_convert = []
     for ext in pandoc_extensions:
-        files_to_convert.extend(content_dir.rglob(f"*.{ext}"))
+        files_to_convert.extend(catalog.files(content_dir, suffixes=(f".{ext}",)))
 
     if not files_to_convert:
+        catalog.close()
         print("No files found to convert")
         sys.exit(0)
 
@@ -158,10 +196,11 @@ def main():
     skipped = 0
 
     for file_path in files_to_convert:
-        if convert_pandoc_to_markdown(file_path, args.dry_run):
+        if convert_pandoc_to_markdown(file_path, args.dry_run, catalog):
             converted += 1
         else:
             skipped += 1
+    catalog.close()
 
     print(f"\n{'=' * 60}")
     print(f"Processed {len(files_to_convert)} file(s):")
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Run the post-import conversions in a single pass over the content tree.
+
+Usage (from the Nicolino site directory, where conf.yml is):
+    python ../scripts/convert_pipeline.py
+    python ../scripts/convert_pipeline.py --dry-run
+    python ../scripts/convert_pipeline.py --content-dir content --jobs 8
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import yaml
+
+import convert_metadata
+from catalog import Catalog
+import convert_pandoc_to_md
+import fix_yaml
+import fix_yaml2
+
+
+class Document:
+    """A content file moving through the pipeline."""
+
+    def __init__(self, path: Path, text: str):
+        self.source = path
+        self.path = path
+        self.original = text
+        self.text = text
+        self.applied = []
+        self.warnings = []
+        self.error = None
+
+    @property
+    def changed(self) -> bool:
+        return self.path != self.source or self.text != self.original
+
+
+class Pipeline:
+    """Settings shared by all stages."""
+
+    def __init__(self, content_dir: Path, pandoc_extensions, dry_run: bool = False):
+        self.content_dir = content_dir
+        self.pandoc_suffixes = {f".{ext}" for ext in pandoc_extensions}
+        self.fix_dirs = {content_dir / "posts", content_dir / "es" / "posts"}
+        self.dry_run = dry_run
+        self.stages = [extract_metadata, convert_body, repair_frontmatter]
+
+    def wants(self, path: Path) -> bool:
+        """Whether any stage could apply to a file."""
+        return path.suffix in METADATA_SUFFIXES or path.suffix in self.pandoc_suffixes
+
+    def run(self, path: Path) -> Document:
+        doc = Document(path, path.read_text(encoding="utf-8"))
+        for stage in self.stages:
+            doc = stage(doc, self)
+            if doc.error:
+                return doc
+        return emit(doc, self)
+
+
+# =============================================================================
+# Stages
+# =============================================================================
+
+# Files convert_metadata.py looks at when given a directory
+METADATA_SUFFIXES = {".md", ".rst", ".txt"}
+
+# Files fix_yaml.py and fix_yaml2.py look at
+FIX_SUFFIXES = {".md", ".rst"}
+
+
+def extract_metadata(doc: Document, pipeline: Pipeline) -> Document:
+    """Nikola comment metadata -> YAML frontmatter (convert_metadata.py)."""
+    if doc.path.suffix not in METADATA_SUFFIXES:
+        return doc
+    new_text, _ = convert_metadata.convert_content(doc.text)
+    if new_text is not None:
+        doc.text = new_text
+        doc.applied.append("metadata")
+    return doc
+
+
+def convert_body(doc: Document, pipeline: Pipeline) -> Document:
+    """reStructuredText body -> Markdown, renaming to .md (convert_pandoc_to_md.py)."""
+    if doc.path.suffix not in pipeline.pandoc_suffixes:
+        return doc
+    try:
+        new_text, warning = convert_pandoc_to_md.convert_content(doc.text)
+    except subprocess.TimeoutExpired:
+        doc.error = "Pandoc conversion timed out"
+        return doc
+    if new_text is None:
+        return doc
+    if warning:
+        doc.warnings.append(warning)
+    doc.text = new_text
+    doc.path = doc.path.with_suffix(".md")
+    doc.applied.append("pandoc")
+    return doc
+
+
+def repair_frontmatter(doc: Document, pipeline: Pipeline) -> Document:
+    """Quote repairs on post titles (fix_yaml.py, then fix_yaml2.py)."""
+    if doc.path.parent not in pipeline.fix_dirs or doc.path.suffix not in FIX_SUFFIXES:
+        return doc
+    for name, fix in (("fix_yaml", fix_yaml.fix_content), ("fix_yaml2", fix_yaml2.fix_content)):
+        new_text = fix(doc.text)
+        if new_text != doc.text:
+            doc.text = new_text
+            doc.applied.append(name)
+    return doc
+
+
+def emit(doc: Document, pipeline: Pipeline) -> Document:
+    """Write the document if any stage changed it, removing a renamed source."""
+    if not doc.changed or pipeline.dry_run:
+        return doc
+    doc.path.write_text(doc.text, encoding="utf-8")
+    if doc.path != doc.source:
+        doc.source.unlink()
+    return doc
+
+
+# =============================================================================
+# Main Entry Point
+# =============================================================================
+
+
+def find_files(catalog: Catalog, content_dir: Path, pipeline: Pipeline):
+    """Files some stage would change, according to the content catalog.
+
+    The catalog is refreshed with one walk (reading only new or changed
+    files). Pandoc files are always converted, and every post goes through
+    the frontmatter repair, as in fix_yaml.py and fix_yaml2.py: the quoting
+    they fix also occurs in frontmatter that parses. Of the rest, only
+    files with Nikola metadata need work.
+    """
+    catalog.refresh(content_dir)
+    files = set(catalog.files(content_dir, suffixes=METADATA_SUFFIXES, metadata=("nikola",)))
+    for fix_dir in pipeline.fix_dirs:
+        files.update(catalog.files(fix_dir, suffixes=FIX_SUFFIXES, recursive=False))
+    files.update(catalog.files(content_dir, suffixes=pipeline.pandoc_suffixes))
+    return sorted(files)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert metadata, convert Pandoc bodies and fix YAML in one pass"
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Show what would be done without making changes",
+    )
+    parser.add_argument(
+        "--content-dir", default="content", help="Content directory (default: content)"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of files processed in parallel (default: CPU count)",
+    )
+    args = parser.parse_args()
+
+    # Read configuration
+    config_path = Path("conf.yml")
+    if not config_path.exists():
+        print("Error: conf.yml not found in current directory", file=sys.stderr)
+        sys.exit(1)
+
+    with open(config_path, "r") as f:
+        config = yaml.safe_load(f)
+
+    content_dir = Path(args.content_dir)
+    if not content_dir.exists():
+        print(f"Error: Content directory '{content_dir}' not found", file=sys.stderr)
+        sys.exit(1)
+
+    pipeline = Pipeline(
+        content_dir,
+        convert_pandoc_to_md.find_pandoc_extensions(config),
+        dry_run=args.dry_run,
+    )
+    catalog = Catalog.for_path(content_dir)
+    files = find_files(catalog, content_dir, pipeline)
+    if not files:
+        catalog.close()
+        print("No files found to process")
+        sys.exit(0)
+
+    print(f"Found {len(files)} file(s) to process\n")
+
+    stage_counts = {}
+    written = 0
+    failed = []
+    with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        for doc in pool.map(pipeline.run, files):
+            if doc.error:
+                failed.append(doc)
+                print(f"  ✗ {doc.source}: {doc.error}")
+                continue
+            for warning in doc.warnings:
+                print(f"  ⚠ {doc.source}: {warning}")
+            if not doc.changed:
+                continue
+            written += 1
+            if not args.dry_run:
+                if doc.path != doc.source:
+                    catalog.forget(doc.source)
+                catalog.record(doc.path, doc.text, "+".join(doc.applied))
+            for name in doc.applied:
+                stage_counts[name] = stage_counts.get(name, 0) + 1
+            target = f" -> {doc.path}" if doc.path != doc.source else ""
+            prefix = "[DRY RUN] " if args.dry_run else ""
+            print(f"  {prefix}{doc.source}{target} ({', '.join(doc.applied)})")
+
+    catalog.close()
+
+    print(f"\n{'=' * 60}")
+    print(f"Processed {len(files)} file(s):")
+    print(f"  {'Would write' if args.dry_run else 'Written'}: {written}")
+    for name in ("metadata", "pandoc", "fix_yaml", "fix_yaml2"):
+        print(f"    {name}: {stage_counts.get(name, 0)}")
+    print(f"  Unchanged: {len(files) - written - len(failed)}")
+    if failed:
+        print(f"  Failed:    {len(failed)}")
+
+
+if __name__ == "__main__":
+    main()
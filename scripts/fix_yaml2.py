@@ -4,24 +4,25 @@ Fix YAML parsing issues in migrated posts - properly escape quotes.
 """
 
 from pathlib import Path
+from typing import Optional
+
+from catalog import Catalog
 
 # Paths
 POSTS_DIR = Path("myblog/content/posts")
 ES_POSTS_DIR = Path("myblog/content/es/posts")
 
 
-def fix_yaml_quotes(file_path: Path):
-    """Fix YAML quotes in frontmatter."""
-    content = file_path.read_text(encoding="utf-8")
-
+def fix_content(content: str) -> str:
+    """Fix YAML quotes in the frontmatter of content, in memory."""
     # Check if there's a frontmatter
     if not content.startswith("---"):
-        return False
+        return content
 
     # Split into frontmatter and body
     parts = content.split("---", 2)
     if len(parts) < 3:
-        return False
+        return content
 
     frontmatter = parts[1]
     body = parts[2]
@@ -66,10 +67,18 @@ def fix_yaml_quotes(file_path: Path):
         new_lines.append(line)
 
     new_frontmatter = "\n".join(new_lines)
-    new_content = f"---{new_frontmatter}---{body}"
+    return f"---{new_frontmatter}---{body}"
+
+
+def fix_yaml_quotes(file_path: Path, catalog: Optional[Catalog] = None):
+    """Fix YAML quotes in frontmatter."""
+    content = file_path.read_text(encoding="utf-8")
+    new_content = fix_content(content)
 
     if new_content != content:
         file_path.write_text(new_content, encoding="utf-8")
+        if catalog is not None:
+            catalog.record(file_path, new_content, "fix_yaml2")
         print(f"Fixed: {file_path}")
         return True
     return False
@@ -79,23 +88,15 @@ def main():
     """Fix all YAML issues in posts."""
     fixed_count = 0
 
-    # Process English posts
-    for post_file in POSTS_DIR.glob("*.rst"):
-        if fix_yaml_quotes(post_file):
-            fixed_count += 1
-
-    for post_file in POSTS_DIR.glob("*.md"):
-        if fix_yaml_quotes(post_file):
-            fixed_count += 1
-
-    # Process Spanish posts
-    for post_file in ES_POSTS_DIR.glob("*.rst"):
-        if fix_yaml_quotes(post_file):
-            fixed_count += 1
-
-    for post_file in ES_POSTS_DIR.glob("*.md"):
-        if fix_yaml_quotes(post_file):
-            fixed_count += 1
+    with Catalog.for_path(POSTS_DIR) as catalog:
+        # English posts, then Spanish posts. Every post is checked: the
+        # quoting fixed here also occurs in frontmatter that parses.
+        for posts_dir in (POSTS_DIR, ES_POSTS_DIR):
+            catalog.refresh(posts_dir)
+            for suffix in (".rst", ".md"):
+                for post_file in catalog.files(posts_dir, suffixes=(suffix,), recursive=False):
+                    if fix_yaml_quotes(post_file, catalog):
+                        fixed_count += 1
 
     print(f"\nFixed {fixed_count} files with YAML issues")
 
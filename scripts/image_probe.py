@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Read image dimensions, orientation and capture date from file headers.
+
+Usage as a script:
+    python3 scripts/image_probe.py photo.jpg [...]
+"""
+
+import hashlib
+import json
+import struct
+import sys
+from pathlib import Path
+from typing import Optional, Tuple
+
+# EXIF tags we care about
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+
+# JPEG start-of-frame markers (all but DHT, JPG and DAC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+class ImageInfo:
+    """What the headers of an image say about it."""
+
+    def __init__(self, width=None, height=None, orientation=1, taken=None):
+        self.width = width
+        self.height = height
+        self.orientation = orientation
+        self.taken = taken
+
+
+def parse_exif(data: bytes, info: ImageInfo):
+    """Fill orientation and capture date from a TIFF-structured EXIF block."""
+    if data.startswith(b"Exif\x00\x00"):
+        data = data[6:]
+    if len(data) < 8 or data[:2] not in (b"II", b"MM"):
+        return
+    endian = "<" if data[:2] == b"II" else ">"
+
+    def read_ifd(offset):
+        entries = {}
+        if offset + 2 > len(data):
+            return entries
+        (count,) = struct.unpack_from(endian + "H", data, offset)
+        for i in range(count):
+            entry = offset + 2 + i * 12
+            if entry + 12 > len(data):
+                break
+            tag, kind, n, value = struct.unpack_from(endian + "HHI4s", data, entry)
+            entries[tag] = (kind, n, value)
+        return entries
+
+    def ascii_value(kind, n, value):
+        if kind != 2:
+            return None
+        raw = value[:n] if n <= 4 else data[struct.unpack(endian + "I", value)[0]:][:n]
+        return raw.split(b"\x00", 1)[0].decode("ascii", "replace").strip() or None
+
+    (ifd0_offset,) = struct.unpack_from(endian + "I", data, 4)
+    ifd0 = read_ifd(ifd0_offset)
+
+    if TAG_ORIENTATION in ifd0:
+        kind, _, value = ifd0[TAG_ORIENTATION]
+        if kind == 3:
+            info.orientation = struct.unpack(endian + "H", value[:2])[0]
+
+    taken = None
+    if TAG_EXIF_IFD in ifd0:
+        exif_ifd = read_ifd(struct.unpack(endian + "I", ifd0[TAG_EXIF_IFD][2])[0])
+        if TAG_DATETIME_ORIGINAL in exif_ifd:
+            taken = ascii_value(*exif_ifd[TAG_DATETIME_ORIGINAL])
+    if taken is None and TAG_DATETIME in ifd0:
+        taken = ascii_value(*ifd0[TAG_DATETIME])
+    if taken:
+        # EXIF dates look like "2019:07:21 18:03:11"
+        date, _, time = taken.partition(" ")
+        info.taken = date.replace(":", "-") + (f"T{time}" if time else "")
+
+
+def probe_jpeg(f, info: ImageInfo):
+    f.seek(2)
+    while True:
+        if f.read(1) != b"\xff":
+            return
+        marker = f.read(1)
+        while marker == b"\xff":
+            # Fill bytes may pad between markers
+            marker = f.read(1)
+        if not marker:
+            return
+        code = marker[0]
+        if code == 0xD8 or 0xD0 <= code <= 0xD7 or code == 0x01:
+            continue
+        if code in (0xD9, 0xDA):
+            # End of image or start of scan: no more headers
+            return
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return
+        (length,) = struct.unpack(">H", length_bytes)
+        if code in JPEG_SOF_MARKERS:
+            _, info.height, info.width = struct.unpack(">BHH", f.read(5))
+            return
+        if code == 0xE1:
+            segment = f.read(length - 2)
+            if segment.startswith(b"Exif\x00\x00"):
+                parse_exif(segment, info)
+        else:
+            f.seek(length - 2, 1)
+
+
+def probe_png(f, info: ImageInfo):
+    f.seek(16)
+    info.width, info.height = struct.unpack(">II", f.read(8))
+    # eXIf must come before the image data; walk chunk headers until then
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        length, kind = struct.unpack(">I4s", header)
+        if kind in (b"IDAT", b"IEND"):
+            return
+        if kind == b"eXIf":
+            parse_exif(f.read(length), info)
+            return
+        f.seek(length + 4, 1)
+
+
+def probe_webp(f, info: ImageInfo):
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        kind, length = struct.unpack("<4sI", header)
+        data = f.read(min(length, 30)) if kind != b"EXIF" else f.read(length)
+        if kind == b"VP8X":
+            info.width = int.from_bytes(data[4:7], "little") + 1
+            info.height = int.from_bytes(data[7:10], "little") + 1
+        elif kind == b"VP8 " and info.width is None:
+            w, h = struct.unpack("<HH", data[6:10])
+            info.width, info.height = w & 0x3FFF, h & 0x3FFF
+            return
+        elif kind == b"VP8L" and info.width is None:
+            bits = int.from_bytes(data[1:5], "little")
+            info.width = (bits & 0x3FFF) + 1
+            info.height = ((bits >> 14) & 0x3FFF) + 1
+            return
+        elif kind == b"EXIF":
+            parse_exif(data, info)
+            return
+        consumed = len(data)
+        f.seek(length - consumed + (length & 1), 1)
+
+
+def probe_gif(f, info: ImageInfo):
+    f.seek(6)
+    info.width, info.height = struct.unpack("<HH", f.read(4))
+
+
+def probe(path: Path) -> Optional[ImageInfo]:
+    """Read an image's header. Returns None for unknown formats."""
+    info = ImageInfo()
+    with path.open("rb") as f:
+        magic = f.read(16)
+        if magic.startswith(b"\xff\xd8"):
+            probe_jpeg(f, info)
+        elif magic.startswith(b"\x89PNG\r\n\x1a\n"):
+            probe_png(f, info)
+        elif magic[:4] == b"RIFF" and magic[8:12] == b"WEBP":
+            probe_webp(f, info)
+        elif magic[:6] in (b"GIF87a", b"GIF89a"):
+            probe_gif(f, info)
+        else:
+            return None
+    return info
+
+
+def file_hash(path: Path) -> str:
+    """SHA-256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def manifest_entry(path: Path) -> Tuple[Path, Optional[dict]]:
+    """Manifest record for one image: header data plus content hash."""
+    try:
+        info = probe(path)
+    except (OSError, struct.error, IndexError, ValueError):
+        info = None
+    if info is None:
+        return path, None
+    return path, {
+        "filename": path.name,
+        "width": info.width,
+        "height": info.height,
+        "orientation": info.orientation,
+        "taken": info.taken,
+        "size": path.stat().st_size,
+        "sha256": file_hash(path),
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python3 image_probe.py <image> [...]", file=sys.stderr)
+        sys.exit(1)
+    for arg in sys.argv[1:]:
+        _, entry = manifest_entry(Path(arg))
+        print(json.dumps(entry or {"filename": arg, "error": "unknown format"}))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,296 +15,812 @@ Uses cached HTML when available for non-markdown formats.
 Usage:
     cd /path/to/nicolino
     python3 scripts/import_site.py
+    python3 scripts/import_site.py --source old/site --target new/site
+    python3 scripts/import_site.py --convert-rst markdown --jobs 8
+    python3 scripts/import_site.py --harvest-output
+    python3 scripts/import_site.py --thumbnails
+    python3 scripts/import_site.py --batch sites.yml
+    python3 scripts/import_site.py --shard 1/4     # ... through --shard 4/4, anywhere
+    python3 scripts/import_site.py --merge-shards
+    python3 scripts/import_site.py --output-archive myblog.tar.gz
+    python3 scripts/import_site.py --watch
+    python3 scripts/import_site.py --dry-run --save-plan plan.json
+    python3 scripts/import_site.py --run-plan plan.json
+    python3 scripts/import_site.py --output-archive - | ssh host tar x
+
+Usage as a library:
+    import import_site
+    import_site.run_import(import_site.ImportConfig(source=Path("old"), target=Path("new")))
+    import_site.close_pool()
 """
 
+import argparse
+import contextlib
+import dbm
+import gzip
+import glob
+import hashlib
+import io
+import json
 import os
 import re
 import shutil
+import sqlite3
 import subprocess
+import tarfile
+import sys
+import tempfile
+import threading
+import time
+import zipfile
 import yaml
-from datetime import datetime
-from pathlib import Path
-from typing import Optional, Tuple, List
+import image_probe
+from migrate_common import (
+    Loader,
+    calibrate,
+    convert_frontmatter_to_nicolino,
+    convert_nikola_date_to_nicolino,
+    determine_extension,
+    nikola_slugify,
+    nicolino_frontmatter,
+    parse_frontmatter,
+    sanitize_slug,
+)
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from itertools import repeat
+from pathlib import Path, PurePosixPath
+from typing import Dict, NamedTuple, Optional, Tuple, List, Union
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
 
 # =============================================================================
 # Configuration
 # =============================================================================
 
-# Source directories (Nikola site)
-SOURCE_DIR = Path("mysite")
-SOURCE_POSTS = SOURCE_DIR / "posts"
-SOURCE_PAGES = SOURCE_DIR / "pages"
-SOURCE_GALLERIES = SOURCE_DIR / "galleries"
-SOURCE_IMAGES = SOURCE_DIR / "images"
-SOURCE_FILES = SOURCE_DIR / "files"
-SOURCE_LISTINGS = SOURCE_DIR / "listings"
-SOURCE_CACHE = SOURCE_DIR / "cache"
+# Where Nikola rendered each source folder, relative to output/, in the
+# order they are tried when harvesting ("" is the output root)
+OUTPUT_SECTIONS = {
+    "posts": ["posts", "weblog/posts"],
+    "pages": ["pages", "stories", ""],
+}
+
+# Where an archive source's media and doit database are unpacked, inside the target
+ARCHIVE_STAGING_NAME = ".nicolino-source"
+
+# Timestamp of every archive member (SOURCE_DATE_EPOCH, or 0), so the same
+# import gives the same archive
+OUTPUT_MTIME = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+
+# Dated subfolders posts can be put in (see Site.post_layout)
+POST_LAYOUTS = ("year", "month")
+
+SHARD_MANIFEST_NAME = ".nicolino-shard.json"
+
+
+class ImportConfig(NamedTuple):
+    """One site import: where from, where to, and the options.
+
+    Defaults match the command line's. search_index takes a path, or True
+    for the default file in the target directory.
+    shard is (index, count) to import one shard into its own root.
+    output_archive is a tar to write the site into, or Path("-") for stdout.
+    """
+    source: Path = Path("mysite")
+    target: Path = Path("myblog")
+    shard: Optional[Tuple[int, int]] = None
+    output_archive: Optional[Path] = None
+    convert_rst: Optional[str] = None
+    check_cache_freshness: bool = True
+    harvest_output: bool = False
+    metadata_index: bool = True
+    search_index: Union[Path, bool, None] = None
+    gallery_manifests: bool = True
+    thumbnails: bool = False
+    downscale: Optional[int] = None
+    reencode: Optional[str] = None
+    prerender_listings: bool = False
+    expand_shortcodes: bool = False
+    rewrite_links: bool = True
+    redirects: bool = True
+    post_layout: Optional[str] = None
+
+
+class Site:
+    """The paths, settings and running state of one site import.
+
+    Built from an ImportConfig and passed to every stage, so the sites of a
+    batch can be imported side by side. close() removes the temporary tree
+    of an output archive and closes Nikola's doit database.
+    """
+
+    def __init__(self, config: ImportConfig):
+        if config.convert_rst is not None and config.convert_rst not in RST_TARGETS:
+            raise ValueError(f"Unknown convert_rst format: {config.convert_rst}")
+        if config.reencode is not None and config.reencode not in REENCODE_SUFFIXES:
+            raise ValueError(f"Unknown reencode format: {config.reencode}")
+        if config.post_layout is not None and config.post_layout not in POST_LAYOUTS:
+            raise ValueError(f"Unknown post_layout: {config.post_layout}")
+        if config.reencode and not config.downscale:
+            raise ValueError("reencode needs downscale")
+        if config.shard is not None and config.output_archive is not None:
+            raise ValueError("Shards are merged as trees; archive the merged target instead")
+        if config.shard is not None:
+            index, count = config.shard
+            if not 1 <= index <= count:
+                raise ValueError(f"Shard {index} of {count} does not exist")
+            if config.search_index not in (None, True):
+                raise ValueError("With shards, search_index must use its default path so it can be merged")
+        if config.output_archive:
+            name = Path(config.output_archive).name.lower()
+            if name.endswith((".tar.zst", ".tzst")) and zstandard is None:
+                raise RuntimeError(f"{config.output_archive}: writing .tar.zst needs the zstandard module")
+
+        self.config = config
+
+        # Import only one shard of the site, as (index, count) with 1 <= index
+        # <= count, into its own root next to the target. Set by --shard.
+        self.shard = tuple(config.shard) if config.shard else None
+
+        # Write the imported site into this .tar, .tar.gz or .tar.zst ("-"
+        # for an uncompressed tar on stdout) instead of leaving a tree at the
+        # target. What later stages read back (galleries, images, thumbnails)
+        # is built in output_tree, a temporary folder removed by close(); the
+        # rest goes to the archive through self.output. Set by --output-archive.
+        self.output_archive = Path(config.output_archive) if config.output_archive else None
+        self.output_tree = Path(tempfile.mkdtemp(prefix="nicolino-import-")) if self.output_archive else None
+
+        # Target directories (Nicolino site)
+        self.target_dir = Path(config.target)
+        if self.shard:
+            self.target_dir = shard_root(self.target_dir, *self.shard)
+        if self.output_tree:
+            self.target_dir = self.output_tree / self.target_dir.name
+
+        # What the files no later stage reads back are written through: the
+        # target folder, or the output archive directly (see TargetArchive)
+        self.output = TargetArchive(self.target_dir) if self.output_tree else TargetFolder()
+        self.target_content = self.target_dir / "content"
+        self.target_posts = self.target_content / "posts"
+        self.target_pages = self.target_content / "pages"
+        self.target_galleries = self.target_content / "galleries"
+        self.target_images = self.target_content / "images"
+        self.target_listings = self.target_content / "listings"
+        self.target_shortcodes = self.target_dir / "shortcodes"
+
+        # The .tar, .tar.zst or .zip the site is imported from, if it is one.
+        # Its media and doit database are unpacked once, into
+        # ARCHIVE_STAGING_NAME in the target, and source_dir points there;
+        # posts, pages and cache/ and output/ pages stay in the archive (see
+        # SourceArchive). Set by --source.
+        source = Path(config.source)
+        self.archive_source = source if is_archive(source) else None
+
+        # Source directories (Nikola site)
+        # An output archive's tree is archived whole, so the staging folder
+        # goes next to it
+        staging = (self.output_tree or self.target_dir) / ARCHIVE_STAGING_NAME
+        self.source_dir = staging if self.archive_source else source
+        self.source_posts = self.source_dir / "posts"
+        self.source_pages = self.source_dir / "pages"
+        self.source_galleries = self.source_dir / "galleries"
+        self.source_images = self.source_dir / "images"
+        self.source_files = self.source_dir / "files"
+        self.source_listings = self.source_dir / "listings"
+        self.source_cache = self.source_dir / "cache"
+        self.source_output = self.source_dir / "output"
+        self.source_doit_db = self.source_dir / ".doit.db"
+
+        # What posts, pages and cache/, output/ and .dep files are read
+        # through: the filesystem, or the archive's member index
+        self.source = SourceArchive(self.archive_source, self.source_dir) if self.archive_source else SourceFolder()
+
+        # Convert reStructuredText bodies that have no cached HTML while
+        # importing. None keeps them as .rst (rendered by pandoc on every
+        # build), "markdown" or "html" converts them once. Set by --convert-rst.
+        self.convert_rst = config.convert_rst
+
+        # Check that cache/ entries are newer than their sources (and their
+        # .dep dependencies / doit records) before using them. Disabled by
+        # --trust-cache.
+        self.check_cache_freshness = config.check_cache_freshness
+
+        # Take post and page bodies from Nikola's rendered output/ pages
+        # before trying cache/ or pandoc. Set by --harvest-output.
+        self.harvest_output = config.harvest_output
+
+        # Where the content metadata index is written (see MetadataIndex), or
+        # None to skip it. Disabled by --no-metadata-index.
+        self.metadata_index = self.target_dir / ".nicolino-metadata.jsonl" if config.metadata_index else None
+
+        # Where to write a search.json-compatible index of the HTML bodies
+        # seen during import, or None. Set by --search-index.
+        self.search_index = config.search_index
+        if self.search_index is True:
+            self.search_index = self.target_dir / "search-index.json"
+
+        # Write a manifest.json (dimensions, EXIF orientation and capture
+        # date, content hash) into each gallery. Disabled by
+        # --no-gallery-manifests.
+        self.gallery_manifests = config.gallery_manifests
+
+        # Pre-generate gallery thumbnails into the output tree, so the first
+        # build doesn't redo them. Needs Pillow. Enabled by --thumbnails.
+        self.pregenerate_thumbnails = config.thumbnails
+
+        # Source hashes and sizes of pre-generated thumbnails. The next import
+        # skips unchanged ones, and the build (Image.pregenerated? in
+        # src/image.cr) keeps a thumbnail whose entry still matches its source
+        # and image_thumb.
+        self.thumbnail_record = self.target_dir / ".nicolino-thumbs.json"
+
+        # Downscale gallery and images/ originals whose long edge is above
+        # this many pixels, or None to copy them as they are. Set by
+        # --downscale.
+        self.downscale_long_edge = config.downscale
+
+        # Re-encode downscaled gallery images to "webp" or "jpeg", or None to
+        # keep their format. Set by --reencode.
+        self.reencode_format = config.reencode
+
+        # Where replaced originals are kept, mirroring content/
+        self.originals_archive = self.target_dir / "originals"
+
+        # What the media stage changed, and how many bytes it saved
+        self.media_record = self.target_dir / ".nicolino-media.json"
+
+        # Pre-render syntax-highlighted listings into listings_cache, which
+        # Listings.cached_highlight reads instead of highlighting again.
+        # Needs the tartrazine CLI. Enabled by --prerender-listings.
+        self.prerender_listings = config.prerender_listings
+        self.listings_cache = self.target_dir / ".listings-cache"
+
+        # Where the shortcode usage index is written
+        self.shortcode_usage = self.target_dir / ".nicolino-shortcodes.json"
+
+        # Replace shortcodes whose templates only substitute their arguments
+        # with the HTML they render to. Enabled by --expand-shortcodes.
+        self.expand_shortcodes = config.expand_shortcodes
+
+        # Rewrite links to legacy Nikola URLs in bodies to their new
+        # locations. Disabled by --no-rewrite-links.
+        self.rewrite_links = config.rewrite_links
+
+        # Write a redirect table from legacy Nikola URLs (nginx map, Apache
+        # RewriteMap and JSON). Disabled by --no-redirects.
+        self.write_redirects = config.redirects
+        self.redirects_nginx = self.target_dir / "redirects.nginx.conf"
+        self.redirects_apache = self.target_dir / "redirects.apache.map"
+        self.redirects_json = self.target_dir / "redirects.json"
+
+        # Put posts in dated subfolders of content/posts/: "year" (YYYY/) or
+        # "month" (YYYY/MM/), or None for one flat folder. Old URLs keep
+        # working through the legacy URL map. Set by --post-layout.
+        self.post_layout = config.post_layout
+
+        # Nikola's doit dependency database, opened on first use (False if absent)
+        self.doit_db = None
+
+        # Cache lookups since the last report_cache_stats()
+        self.cache_stats = {"hit": 0, "stale": 0, "miss": 0}
+
+        # Bodies harvested from output/, by source file
+        self.harvested = {}
+
+        # Bodies queued by process_post_file / process_page_file, converted
+        # in one parallel batch by convert_pending_rst()
+        self.rst_queue: List[RstJob] = []
+
+        # Target file of every imported post and page, by source file, so
+        # watch mode can replace or remove it when the source changes
+        self.content_targets = {}
+
+        # The legacy URL map, if link rewriting or redirects are enabled, and
+        # the shortcode usage index (both built by run_import)
+        self.legacy_urls: Optional[LegacyUrls] = None
+        self.shortcode_index: Optional[ShortcodeIndex] = None
+
+        # The indexes being written, if enabled (opened and closed by run_import)
+        self.metadata_writer: Optional[MetadataIndex] = None
+        self.search_writer: Optional[SearchIndex] = None
+
+    def close(self):
+        """Close the doit database and source archive, and remove the output archive's tree."""
+        if hasattr(self.doit_db, "close"):
+            self.doit_db.close()
+        self.doit_db = None
+        self.source.close()
+        if self.output_tree and self.output_tree.exists():
+            shutil.rmtree(self.output_tree)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Worker count for parallel stages. Overridden by --jobs.
+JOBS = os.cpu_count() or 1
 
-# Target directories (Nicolino site)
-TARGET_DIR = Path("myblog")
-TARGET_CONTENT = TARGET_DIR / "content"
-TARGET_POSTS = TARGET_CONTENT / "posts"
-TARGET_PAGES = TARGET_CONTENT / "pages"
-TARGET_GALLERIES = TARGET_CONTENT / "galleries"
-TARGET_IMAGES = TARGET_CONTENT / "images"
-TARGET_LISTINGS = TARGET_CONTENT / "listings"
-TARGET_SHORTCODES = TARGET_DIR / "shortcodes"
 
 # =============================================================================
-# Utility Functions
+# Site Sources
 # =============================================================================
 
 
-def parse_frontmatter(content: str) -> Tuple[dict, str]:
-    """Parse YAML or Nikola RST-style frontmatter from content."""
-    metadata = {}
-    body = content
+class MemberStat(NamedTuple):
+    """The parts of os.stat_result the import uses, for archive members."""
+    st_size: int
+    st_mtime: float
+    st_mtime_ns: int
 
-    # Try YAML frontmatter first
-    if content.startswith("---"):
-        parts = content.split("---", 2)
-        if len(parts) >= 3:
-            frontmatter_text = parts[1]
-            body = parts[2].lstrip()
 
-            try:
-                # Use Python's yaml module to properly parse YAML with anchors and aliases
-                metadata = yaml.safe_load(frontmatter_text) or {}
-            except Exception as e:
-                # Fallback to simple line-by-line parsing if yaml.safe_load fails
-                metadata = {}
-                for line in frontmatter_text.strip().split("\n"):
-                    line = line.strip()
-                    if ":" in line and not line.startswith("#"):
-                        key, value = line.split(":", 1)
-                        key = key.strip()
-                        value = value.strip()
-                        value = re.sub(r'^&\S+\s+', '', value)
-                        if value.startswith('*'):
-                            continue
-                        value = value.strip().strip("'").strip('"')
-                        metadata[key] = value
-
-            # Clean up any remaining RST-style metadata fragments from the body
-            # (some files have both YAML and old RST metadata)
-            body_lines = []
-            skip_remaining_metadata = False
-            for line in body.split("\n"):
-                stripped = line.strip()
-                # Check if we hit a metadata-like line (starts with ".. " and has ":" or is just "..")
-                # Also check for the HTML comment closing that sometimes wraps old metadata
-                if stripped == "-->" or (stripped.startswith(".. ") and (":" in stripped or len(stripped) <= 3)):
-                    skip_remaining_metadata = True
-                    continue
-                # Once we see a non-metadata line, include everything after
-                if skip_remaining_metadata:
-                    if stripped and not stripped.startswith(".. ") and stripped != "-->":
-                        skip_remaining_metadata = False
-                        body_lines.append(line)
-                    # Continue skipping while we're in metadata mode
-                    continue
-                body_lines.append(line)
-            body = "\n".join(body_lines).lstrip()
-    else:
-        # Try Nikola RST-style metadata (.. key: value)
-        # Format: <!-- .. key: value --> or just .. key: value
-        lines = content.split("\n")
-        metadata_started = False
-        metadata_lines = []
-        body_start = 0
-
-        for i, line in enumerate(lines):
-            stripped = line.strip()
-            # Check for HTML comment start with Nikola metadata
-            if stripped == "<!--":
-                metadata_started = True
-                continue
-            # Check for metadata line
-            if metadata_started:
-                if stripped.startswith(".. "):
-                    # Check if this is the end of metadata (empty line or closing comment)
-                    if stripped == "..":
-                        # Just ".. " on its own might be end of metadata
-                        if metadata_lines:
-                            body_start = i + 1
-                            break
-                    elif stripped == "-->":
-                        # End of HTML comment, metadata ends
-                        body_start = i + 1
-                        break
-                    elif ":" in stripped:
-                        # This is a metadata line like ".. title: Something"
-                        metadata_lines.append(stripped)
-                        continue
-                    else:
-                        # Line starting with ".. " but not a metadata line
-                        # This could be content like ".. code-block::" etc.
-                        body_start = i
-                        break
-                elif stripped == "-->":
-                    # End of HTML comment without blank line before
-                    body_start = i + 1
-                    break
-                else:
-                    # Non-metadata line while in metadata section
-                    body_start = i
+class SourceFolder:
+    """Reads the source files of a site folder from the filesystem."""
+
+    def exists(self, path: Path) -> bool:
+        return path.exists()
+
+    def is_file(self, path: Path) -> bool:
+        return path.is_file()
+
+    def is_dir(self, path: Path) -> bool:
+        return path.is_dir()
+
+    def files(self, folder: Path) -> List[Path]:
+        """The files directly in folder, in directory order."""
+        return [path for path in folder.iterdir() if path.is_file()]
+
+    def dirs(self, folder: Path) -> List[Path]:
+        """The folders directly in folder, sorted."""
+        return sorted(path for path in folder.iterdir() if path.is_dir())
+
+    def walk(self, folder: Path) -> List[Path]:
+        """Every file under folder, each folder's files before its subfolders, sorted."""
+        found = []
+        for dirpath, dirnames, filenames in os.walk(folder):
+            dirnames.sort()
+            found.extend(Path(dirpath) / name for name in sorted(filenames))
+        return found
+
+    def stat(self, path: Path):
+        return path.stat()
+
+    def read_bytes(self, path: Path) -> bytes:
+        return path.read_bytes()
+
+    def read_text(self, path: Path, errors: str = "strict") -> str:
+        return path.read_text(encoding="utf-8", errors=errors)
+
+    def head(self, path: Path, size: int) -> str:
+        """The first size characters of a file."""
+        with path.open(encoding="utf-8", errors="ignore") as f:
+            return f.read(size)
+
+    def close(self):
+        pass
+
+
+class ArchiveMember(NamedTuple):
+    """Where an archive member's data is, if the import reads it.
+
+    data holds the member when the archive can only be read as a stream
+    (compressed tars). Otherwise location is its ZipInfo in a zip, or the
+    offset of its data in an uncompressed tar. Members the import doesn't
+    read have neither: only their stat is kept, for .dep checks.
+    """
+    stat: MemberStat
+    data: Optional[bytes] = None
+    location: Union[zipfile.ZipInfo, int, None] = None
+
+
+class SourceArchive:
+    """Reads the source files of an archive source without unpacking them.
+
+    stage_archive() fills the member index, keyed by the path each member
+    would have under root (site.source_dir). The same methods as
+    SourceFolder answer from it; reads seek to the member, or use the copy
+    kept in memory. Safe to read from several threads.
+    """
+
+    def __init__(self, archive: Path, root: Path):
+        self.archive = archive
+        self.root = root
+        self.members: Dict[Path, ArchiveMember] = {}
+        self.folders: Dict[Path, List[Path]] = {root: []}  # Files directly in each folder
+        self.subfolders: Dict[Path, set] = {}
+        self.zip: Optional[zipfile.ZipFile] = None
+        self.lock = threading.Lock()
+
+    def member_path(self, name: str) -> Optional[Path]:
+        """Where a member goes under root, or None if outside it.
+
+        A top-level folder that isn't part of a Nikola site, like "mysite/",
+        is taken to wrap the site and dropped.
+        """
+        parts = tuple(part for part in PurePosixPath(name).parts if part not in (".", "/"))
+        if parts and parts[0] not in NIKOLA_TOP_LEVEL and len(parts) > 1:
+            parts = parts[1:]
+        if not parts or ".." in parts:
+            return None
+        return self.root.joinpath(*parts)
+
+    def add(self, path: Path, member: ArchiveMember):
+        self.members[path] = member
+        self.folders.setdefault(path.parent, []).append(path)
+        child = path.parent
+        while child != self.root and child not in self.subfolders.get(child.parent, ()):
+            self.subfolders.setdefault(child.parent, set()).add(child)
+            self.folders.setdefault(child.parent, [])
+            child = child.parent
+
+    def fetch(self, paths: List[Path]):
+        """Read listed members that can't be found by offset into memory, in one pass."""
+        wanted = {path for path in paths
+                  if path in self.members and self.members[path].data is None and self.members[path].location is None}
+        if not wanted:
+            return
+        for name, _, _, open_member, _ in archive_members(self.archive):
+            path = self.member_path(name)
+            if path in wanted:
+                with open_member() as src:
+                    self.members[path] = self.members[path]._replace(data=src.read())
+                wanted.discard(path)
+                if not wanted:
                     break
-            # Not in metadata yet, but check if we find a ".. " line (metadata without HTML comment)
-            elif stripped.startswith(".. ") and ":" in stripped:
-                metadata_started = True
-                metadata_lines.append(stripped)
-                continue
-            # Found a non-metadata line before metadata started
-            elif stripped:
-                body_start = i
-                break
 
-        # Parse the metadata lines
-        for line in metadata_lines:
-            if line == "-->" or line == "..":
-                continue
-            if line.startswith(".. ") and ":" in line:
-                # Remove ".. " prefix and parse key: value
-                line = line[3:]  # Remove ".. "
-                key, value = line.split(":", 1)
-                key = key.strip()
-                value = value.strip()
-                # Remove surrounding quotes if present
-                value = value.strip("'").strip('"')
-                metadata[key] = value
-
-        body = "\n".join(lines[body_start:])
-
-    # Convert all values to strings for consistency
-    str_metadata = {}
-    for key, value in metadata.items():
-        if value is None:
-            str_metadata[key] = ""
-        elif isinstance(value, datetime):
-            # For datetime objects, just extract the date
-            str_metadata[key] = value.strftime("%Y-%m-%d %H:%M:%S")
+    def exists(self, path: Path) -> bool:
+        return path in self.members or path in self.folders
+
+    def is_file(self, path: Path) -> bool:
+        return path in self.members
+
+    def is_dir(self, path: Path) -> bool:
+        return path in self.folders
+
+    def files(self, folder: Path) -> List[Path]:
+        """The files directly in folder, in archive order."""
+        return list(self.folders.get(folder, ()))
+
+    def dirs(self, folder: Path) -> List[Path]:
+        """The folders directly in folder, sorted."""
+        return sorted(self.subfolders.get(folder, ()))
+
+    def walk(self, folder: Path) -> List[Path]:
+        """Every file under folder, each folder's files before its subfolders, sorted."""
+        found = sorted(self.folders.get(folder, ()))
+        for subfolder in self.dirs(folder):
+            found.extend(self.walk(subfolder))
+        return found
+
+    def stat(self, path: Path) -> MemberStat:
+        if path not in self.members:
+            raise FileNotFoundError(f"{path}: not in {self.archive}")
+        return self.members[path].stat
+
+    def read_bytes(self, path: Path) -> bytes:
+        member = self.members.get(path)
+        if member is None or (member.data is None and member.location is None):
+            raise FileNotFoundError(f"{path}: not read from {self.archive}")
+        if member.data is not None:
+            return member.data
+        if isinstance(member.location, zipfile.ZipInfo):
+            with self.lock:
+                if self.zip is None:
+                    self.zip = zipfile.ZipFile(self.archive)
+                return self.zip.read(member.location)
+        with self.archive.open("rb") as f:
+            f.seek(member.location)
+            return f.read(member.stat.st_size)
+
+    def read_text(self, path: Path, errors: str = "strict") -> str:
+        return self.read_bytes(path).decode("utf-8", errors)
+
+    def head(self, path: Path, size: int) -> str:
+        """The first size characters of a member."""
+        return self.read_text(path, "ignore")[:size]
+
+    def close(self):
+        with self.lock:
+            if self.zip is not None:
+                self.zip.close()
+                self.zip = None
+
+
+SiteSource = Union[SourceFolder, SourceArchive]
+
+
+# =============================================================================
+# Site Targets
+# =============================================================================
+
+
+class TargetFolder:
+    """Writes the files of an imported site into its target folder."""
+
+    def exists(self, path: Path) -> bool:
+        return path.exists()
+
+    def stat(self, path: Path):
+        return path.stat()
+
+    def open(self, path: Path):
+        """A text file to write path through."""
+        return path.open("w", encoding="utf-8")
+
+    def write_text(self, path: Path, text: str):
+        path.write_text(text, encoding="utf-8")
+
+    def copy(self, source: Path, target: Path):
+        if source.is_dir():
+            shutil.copytree(source, target)
         else:
-            str_metadata[key] = str(value)
-
-    return str_metadata, body
-
-
-def convert_nikola_date_to_nicolino(date_str: str) -> str:
-    """Convert Nikola date format to Nicolino filename date."""
-    if not date_str:
-        return "0000-00-00"
-
-    # If date_str is from YAML datetime parsing, it's in format "YYYY-MM-DD HH:MM:SS"
-    # Just extract the date part
-    if " " in date_str:
-        return date_str.split()[0]
-
-    # Fallback: try various date formats
-    date_str_clean = date_str.replace("UTC", "").replace("GMT", "").replace("T", " ").strip()
-
-    # Remove microseconds if present
-    if "." in date_str_clean:
-        date_str_clean = date_str_clean.split(".")[0]
-
-    formats_to_try = [
-        "%Y-%m-%d %H:%M:%S%z",
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M",
-        "%Y/%m/%d %H:%M:%S",
-        "%Y/%m/%d %H:%M",
-        "%y/%m/%d %H:%M:%S",
-        "%y/%m/%d %H:%M",
-        "%Y/%m/%d",
-        "%Y-%m-%d",
-    ]
+            shutil.copy2(source, target)
 
-    for fmt in formats_to_try:
-        try:
-            dt = datetime.strptime(date_str_clean, fmt)
-            return dt.strftime("%Y-%m-%d")
-        except ValueError:
-            continue
 
-    return "0000-00-00"
-
-
-def sanitize_slug(slug: str) -> str:
-    """Convert slug to a safe filename."""
-    if not slug:
-        return "untitled"
-    slug = re.sub(r'^BB', '', slug)
-    slug = slug.lower().replace(' ', '-').replace('/', '-')
-    slug = re.sub(r'[^a-z0-9-]', '', slug)
-    slug = re.sub(r'-+', '-', slug)
-    return slug.strip('-') or "untitled"
-
-
-def determine_extension(filename: str) -> str:
-    """Determine the file extension based on filename."""
-    if filename.endswith(".md"):
-        return ".md"
-    if filename.endswith(".html"):
-        return ".html"
-    if filename.endswith(".rst"):
-        return ".rst"
-    return ".rst"
-
-
-def convert_frontmatter_to_nicolino(metadata: dict, content: str) -> str:
-    """Convert Nikola frontmatter to Nicolino format."""
-    title = metadata.get("title", "Untitled")
-    date_str = metadata.get("date", "")
-
-    # Merge tags and category fields (some posts have tags in category due to human error)
-    tags = metadata.get("tags", "")
-    category = metadata.get("category", "")
-
-    # Split and merge tags from both fields, removing duplicates
-    all_tags = []
-    if tags:
-        if isinstance(tags, list):
-            all_tags.extend(tags)
+class ArchiveText(io.StringIO):
+    """A text file that becomes an output archive member when closed."""
+
+    def __init__(self, target: "TargetArchive", path: Path):
+        super().__init__()
+        self.target = target
+        self.path = path
+
+    def close(self):
+        if not self.closed:
+            self.target.write_text(self.path, self.getvalue())
+        super().close()
+
+
+class TargetArchive:
+    """Collects the output archive's files that no later stage reads back.
+
+    Content, assets, listings, configuration, indexes and redirect tables
+    never reach the temporary tree: text is kept as its bytes, copies as
+    the path they are read from when the archive is written. Paths outside
+    root (an index written elsewhere) go to the filesystem as usual.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        # Path -> bytes, the Path of a file to copy, or None for a folder
+        self.members: Dict[Path, Union[bytes, Path, None]] = {}
+        self.folder = TargetFolder()
+
+    def exists(self, path: Path) -> bool:
+        return path in self.members or path.exists()
+
+    def stat(self, path: Path):
+        if self.root not in path.parents:
+            return path.stat()
+        # A member, or a file of the tree
+        member = self.members.get(path, path)
+        size = len(member) if isinstance(member, bytes) else member.stat().st_size
+        # Archived files all get OUTPUT_MTIME
+        return MemberStat(size, OUTPUT_MTIME, OUTPUT_MTIME * 10**9)
+
+    def open(self, path: Path):
+        if self.root not in path.parents:
+            return self.folder.open(path)
+        return ArchiveText(self, path)
+
+    def write_text(self, path: Path, text: str):
+        if self.root not in path.parents:
+            self.folder.write_text(path, text)
         else:
-            all_tags.extend([t.strip() for t in str(tags).split(",") if t.strip()])
-    if category and category != "":
-        if isinstance(category, list):
-            all_tags.extend(category)
+            self.members[path] = text.encode("utf-8")
+
+    def copy(self, source: Path, target: Path):
+        if self.root not in target.parents:
+            self.folder.copy(source, target)
+        elif source.is_dir():
+            self.members[target] = None
+            for path in source.rglob("*"):
+                self.members[target / path.relative_to(source)] = None if path.is_dir() else path
         else:
-            all_tags.extend([t.strip() for t in str(category).split(",") if t.strip()])
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_tags = []
-    for tag in all_tags:
-        if tag not in seen:
-            seen.add(tag)
-            unique_tags.append(tag)
-
-    nicolino_date = convert_nikola_date_to_nicolino(date_str)
-
-    # Build frontmatter dictionary
-    frontmatter_dict = {
-        "title": title,
-        "date": nicolino_date,
-    }
+            self.members[target] = source
+
+
+SiteTarget = Union[TargetFolder, TargetArchive]
+
+# =============================================================================
+# Utility Functions
+# =============================================================================
+
+
+# Language suffix in a source stem, e.g. "26.es" from "26.es.txt"
+LANG_SUFFIX_RE = re.compile(r"\.([a-z]{2}(?:_[A-Za-z]{2})?)$")
+
+
+def source_language(source_file: Path) -> Optional[str]:
+    """Language code of a translated source file, None for the default language."""
+    match = LANG_SUFFIX_RE.search(source_file.stem)
+    return match.group(1) if match else None
+
+
+# Process pool of the CPU-bound stages, started on first use and kept warm
+# across sites in batch mode, where the sites imported side by side share
+# it. Its jobs must only depend on their arguments, never on a Site.
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """The shared process pool, started on first use."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=JOBS)
+        return _process_pool
+
+
+def close_pool():
+    """Shut the shared process pool down."""
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown()
+            _process_pool = None
+
+
+def run_captured(function, *args):
+    """Run a process pool job, returning its result and what it printed.
+
+    Output and warnings of pool processes would go straight to the
+    terminal, past the output of the site they work for (see ThreadOutput).
+    """
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+        result = function(*args)
+    return result, output.getvalue()
+
+
+def pool_map(function, *iterables, chunksize: int = 1):
+    """Executor.map over the shared process pool.
+
+    What the jobs print is printed from the calling thread, in job order,
+    so in a batch it goes to the calling site's output.
+    """
+    jobs = process_pool().map(run_captured, repeat(function), *iterables, chunksize=chunksize)
+    for result, printed in jobs:
+        if printed:
+            sys.stdout.write(printed)
+        yield result
+
+
+def thread_pool() -> ThreadPoolExecutor:
+    """A pool of JOBS threads that print where the calling thread does.
+
+    In a batch that is the calling site's buffer (see ThreadOutput).
+    """
+    output = sys.stdout
+    if isinstance(output, ThreadOutput):
+        return ThreadPoolExecutor(max_workers=JOBS, initializer=output.share, initargs=(output.buffer(),))
+    return ThreadPoolExecutor(max_workers=JOBS)
+
+
+def open_doit_db(site: Site):
+    """Open Nikola's doit database, whichever backend wrote it.
+
+    Returns a mapping-like object from task name to its JSON-encoded record,
+    or None if there is no usable database.
+    """
+    if site.doit_db is not None:
+        return site.doit_db or None
+
+    site.doit_db = False
+    try:
+        site.doit_db = dbm.open(str(site.source_doit_db), "r")
+        return site.doit_db
+    except dbm.error:
+        pass
+    if not site.source_doit_db.is_file():
+        return None
+
+    # Not a dbm file: try doit's json and sqlite3 backends
+    try:
+        site.doit_db = {k: json.dumps(v) for k, v in json.loads(site.source_doit_db.read_text()).items()}
+        return site.doit_db
+    except (UnicodeDecodeError, ValueError):
+        pass
+    try:
+        with sqlite3.connect(f"file:{site.source_doit_db}?mode=ro", uri=True) as conn:
+            site.doit_db = dict(conn.execute("SELECT task_id, task_data FROM doit"))
+        return site.doit_db
+    except sqlite3.Error:
+        return None
+
+
+def doit_says_fresh(site: Site, source_file: Path, cache_file: Path) -> Optional[bool]:
+    """Ask Nikola's doit records whether cache_file was built from source_file as it is now.
+
+    Returns None when there is no record to decide with.
+    """
+    db = open_doit_db(site)
+    if db is None:
+        return None
+    task = f"render_posts:{cache_file.relative_to(site.source_dir).as_posix()}"
+    try:
+        record = json.loads(db[task])
+    except (KeyError, ValueError):
+        return None
+
+    state = record.get(source_file.relative_to(site.source_dir).as_posix())
+    if state is None:
+        return None
 
-    # Add merged tags if any exist
-    if unique_tags:
-        frontmatter_dict["tags"] = unique_tags
+    # doit stores [mtime, size, md5] (older versions: just the md5)
+    if isinstance(state, str):
+        recorded_md5 = state
+    else:
+        recorded_mtime, recorded_size, recorded_md5 = state
+        stat = site.source.stat(source_file)
+        if stat.st_size != recorded_size:
+            return False
+        if stat.st_mtime == recorded_mtime:
+            return True
+    return hashlib.md5(site.source.read_bytes(source_file)).hexdigest() == recorded_md5
 
-    # Convert to YAML frontmatter
-    yaml_frontmatter = yaml.dump(frontmatter_dict, default_flow_style=False, sort_keys=False)
-    # Remove trailing ... that yaml.dump adds
-    yaml_frontmatter = yaml_frontmatter.rstrip("...\n").rstrip()
 
-    return f"---\n{yaml_frontmatter}\n---\n\n{content}"
+def is_cache_fresh(site: Site, source_file: Path, cache_file: Path) -> bool:
+    """Decide whether a cache/ entry still matches its source post.
+
+    Nikola's doit records are trusted when they exist; otherwise the cache
+    must be newer than the source and than every dependency listed in its
+    .dep file.
+    """
+    verdict = doit_says_fresh(site, source_file, cache_file)
+    if verdict is not None:
+        return verdict
+
+    cache_mtime = site.source.stat(cache_file).st_mtime
+    if site.source.stat(source_file).st_mtime > cache_mtime:
+        return False
+
+    dep_file = cache_file.with_name(cache_file.name + ".dep")
+    if site.source.is_file(dep_file):
+        for dep in site.source.read_text(dep_file, "ignore").splitlines():
+            dep = dep.strip()
+            if not dep:
+                continue
+            dep_path = site.source_dir / dep
+            if not site.source.exists(dep_path) or site.source.stat(dep_path).st_mtime > cache_mtime:
+                return False
 
+    return True
 
-def get_cached_html(source_file: Path, is_es: bool = False) -> Optional[str]:
+
+def report_cache_stats(site: Site):
+    """Print and reset the cache hit / stale / miss counters."""
+    if any(site.cache_stats.values()):
+        print(
+            f"  Cache: {site.cache_stats['hit']} fresh, {site.cache_stats['stale']} stale, "
+            f"{site.cache_stats['miss']} missing"
+        )
+    for key in site.cache_stats:
+        site.cache_stats[key] = 0
+
+
+def get_cached_html(site: Site, source_file: Path, is_es: bool = False) -> Optional[str]:
     """Get cached HTML from Nikola cache if available.
 
     Returns the HTML content wrapped in raw tags to prevent shortcode reprocessing,
-    or None if no cache exists.
+    or None if no cache exists or it is older than the source.
     """
     # Build cache path
     # pages/26.txt -> cache/pages/26.html
@@ -314,8 +830,8 @@ def get_cached_html(source_file: Path, is_es: bool = False) -> Optional[str]:
     stem = source_file.stem  # e.g., "26.es" from "26.es.txt" or "26" from "26.txt"
 
     # Determine the cache subdirectory and filename
-    rel_path = source_file.relative_to(SOURCE_DIR)
-    cache_dir = SOURCE_CACHE / rel_path.parent
+    rel_path = source_file.relative_to(site.source_dir)
+    cache_dir = site.source_cache / rel_path.parent
 
     if is_es:
         # For .es files, stem is already "filename.es", just add .html
@@ -323,12 +839,21 @@ def get_cached_html(source_file: Path, is_es: bool = False) -> Optional[str]:
     else:
         cache_file = cache_dir / f"{stem}.html"
 
-    if not cache_file.exists():
+    if not site.source.is_file(cache_file):
+        site.cache_stats["miss"] += 1
+        return None
+
+    # Don't ship stale content: the source may have been edited after
+    # Nikola last built
+    if site.check_cache_freshness and not is_cache_fresh(site, source_file, cache_file):
+        site.cache_stats["stale"] += 1
+        print(f"    Cache is stale for {source_file.name}, not using it")
         return None
 
     # Read the cached HTML
     try:
-        html_content = cache_file.read_text(encoding="utf-8")
+        html_content = site.source.read_text(cache_file)
+        site.cache_stats["hit"] += 1
 
         # Wrap in raw tags to prevent shortcode reprocessing
         # The cached HTML is already processed by Nikola
@@ -338,34 +863,899 @@ def get_cached_html(source_file: Path, is_es: bool = False) -> Optional[str]:
         return None
 
 
+# =============================================================================
+# Metadata Index
+# =============================================================================
+
+METADATA_INDEX_FORMAT = "nicolino-metadata-index"
+METADATA_INDEX_VERSION = 1
+
+
+class MetadataIndex:
+    """Streaming writer for the content metadata index.
+
+    The index is a JSON Lines file: a header record with the format and
+    version, then one record per content file written by the import, with
+    the metadata Nicolino would otherwise parse from its frontmatter. Each
+    record is keyed by path, size and mtime, so a scanner can trust it for
+    files that haven't changed since. Records are written as files are, so
+    memory use doesn't grow with the size of the site.
+    """
+
+    def __init__(self, path: Path, site: Site):
+        self.path = path
+        self.site = site
+        self.count = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = site.output.open(path)
+        self.write({"format": METADATA_INDEX_FORMAT, "version": METADATA_INDEX_VERSION})
+
+    def write(self, record: dict):
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self.file.write("\n")
+
+    def add(self, target_file: Path, source_file: Optional[Path], frontmatter: dict, slug: str = ""):
+        """Record a content file that was just written."""
+        site = self.site
+        stat = site.output.stat(target_file)
+        record = {
+            "path": target_file.relative_to(site.target_dir).as_posix(),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "title": frontmatter.get("title", ""),
+            "date": frontmatter.get("date", ""),
+            "tags": frontmatter.get("tags", []),
+            "slug": slug,
+            "lang": source_language(source_file) if source_file else None,
+        }
+        if source_file:
+            record["source"] = source_file.relative_to(site.source_dir).as_posix()
+        self.write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+        print(f"\n  Metadata index: {self.count} records -> {self.path}")
+
+
+# =============================================================================
+# Search Index
+# =============================================================================
+
+# Elements whose text never shows up in Nicolino's search index
+SEARCH_SKIP_ELEMENTS = frozenset(("script", "style", "object", "noindex", "template"))
+
+# The raw tags get_cached_html and harvest_body wrap HTML bodies in
+RAW_TAG_RE = re.compile(r"\{\{%\s*/?raw\s*%\}\}")
+
+
+class HtmlTextParser(HTMLParser):
+    """Collect the visible text of an HTML fragment, like Search.extract_item does."""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SEARCH_SKIP_ELEMENTS:
+            self.skipping += 1
+
+    def handle_endtag(self, tag):
+        if tag in SEARCH_SKIP_ELEMENTS and self.skipping:
+            self.skipping -= 1
+
+    def handle_data(self, data):
+        if not self.skipping and data.strip():
+            self.chunks.append(re.sub(r"\s{2,}", " ", data.strip()))
+
+
+def html_to_text(html: str) -> str:
+    """Plain text of an HTML body, whitespace-collapsed."""
+    parser = HtmlTextParser()
+    parser.feed(RAW_TAG_RE.sub("", html))
+    parser.close()
+    return " ".join(parser.chunks)
+
+
+def content_link(site: Site, target_file: Path) -> str:
+    """The URL Nicolino will give a content file, e.g. /posts/1002.es.html."""
+    return "/" + target_file.relative_to(site.target_content).with_suffix(".html").as_posix()
+
+
+class SearchIndex:
+    """Streaming writer for a search.json-compatible index.
+
+    Items have the same fields Nicolino's search feature writes (title,
+    text, url, id) and are written one by one, as the importer writes
+    each HTML body, so the rendered output doesn't have to be read again.
+    """
+
+    def __init__(self, path: Path, output: SiteTarget):
+        self.path = path
+        self.count = 0
+        self.skipped = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = output.open(path)
+        self.file.write("[")
+
+    def add(self, title: str, url: str, html: str):
+        if self.count:
+            self.file.write(",")
+        item = {"title": title, "text": html_to_text(html), "url": url, "id": self.count}
+        self.file.write(json.dumps(item, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        self.file.write("]")
+        self.file.close()
+        print(f"\n  Search index: {self.count} items -> {self.path}")
+        if self.skipped:
+            print(f"  Not indexed (no HTML body at import time): {self.skipped} files")
+
+
+# =============================================================================
+# Shortcode Index
+# =============================================================================
+
+SOURCE_SHORTCODES = Path("shortcodes")
+
+# A shortcode call in a body: opening delimiter, closing slash, name, arguments
+SHORTCODE_CALL_RE = re.compile(r"\{\{([%<])\s*(/?)([\w.-]+)(.*?)\s*[%>]\}\}", re.DOTALL)
+SHORTCODE_ARG_RE = re.compile(r'(?:([\w-]+)=)?("(?:[^"\\]|\\.)*"|\S+)')
+
+# Template pieces that a static (argument-only) shortcode template may use.
+# Only name and string-key lookups: Crinja looks numeric subscripts such as
+# args[0] up by integer, which misses the string keys Sc.render_sc passes,
+# so templates using them are left for the build to render.
+TEMPLATE_COMMENT_RE = re.compile(r"(\s*)\{#(-?)(.*?)(-?)#\}(\s*)", re.DOTALL)
+TEMPLATE_EXPR_RE = re.compile(r"\{\{.*?\}\}", re.DOTALL)
+TEMPLATE_ARG_RE = re.compile(
+    r"""\{\{\s*args(?:\.([A-Za-z_]\w*)|\[\s*'([^']*)'\s*\]|\[\s*"([^"]*)"\s*\])\s*\}\}"""
+)
+TEMPLATE_INCLUDE_RE = re.compile(r"""\{%-?\s*(?:include|import|from|extends)\s+["']shortcodes/([\w.-]+)\.tmpl["']""")
+
+
+def strip_template_comments(text: str) -> str:
+    """Remove {# #} comments, honouring their whitespace control dashes."""
+    def replace(match):
+        before, trim_before, _, trim_after, after = match.groups()
+        return ("" if trim_before else before) + ("" if trim_after else after)
+    return TEMPLATE_COMMENT_RE.sub(replace, text)
+
+
+def static_template(text: str) -> Optional[List]:
+    """Split a template into literal text and argument names, or None.
+
+    Only templates whose every expression is a plain args lookup (no
+    statements, filters, inner or site data) qualify: their output depends
+    on nothing but the call's arguments, so it can be computed at import.
+    """
+    text = strip_template_comments(text)
+    if "{%" in text:
+        return None
+    # Like Crinja, drop a single trailing newline
+    if text.endswith("\n"):
+        text = text[:-1]
+    parts = []
+    position = 0
+    for match in TEMPLATE_EXPR_RE.finditer(text):
+        arg = TEMPLATE_ARG_RE.fullmatch(match.group(0))
+        if arg is None:
+            return None
+        parts.append(text[position:match.start()])
+        parts.append([name for name in arg.groups() if name is not None][0])
+        position = match.end()
+    parts.append(text[position:])
+    return parts
+
+
+def shortcode_args(text: str) -> dict:
+    """Arguments of a shortcode call, keyed like Sc.render_sc does."""
+    args = {}
+    positional = 0
+    for name, value in SHORTCODE_ARG_RE.findall(text):
+        if value.startswith('"') and value.endswith('"') and len(value) > 1:
+            value = re.sub(r'\\(.)', r"\1", value[1:-1])
+        if name:
+            args[name] = value
+        else:
+            args[str(positional)] = value
+            positional += 1
+    return args
+
+
+class ShortcodeIndex:
+    """Which shortcodes each imported file uses, filled as bodies are written.
+
+    With expansion enabled, calls to shortcodes whose templates only
+    substitute arguments (see static_template) are replaced by their HTML,
+    so Nicolino no longer parses or renders them on every build. Only
+    templates still referenced afterwards need to be copied.
+    """
+
+    def __init__(self, templates_dir: Path, expand: bool, root: Path):
+        self.templates_dir = templates_dir
+        self.expand = expand
+        self.root = root  # The target, which recorded paths are relative to
+        self.templates = {}  # name -> static_template() result
+        self.uses = Counter()
+        self.expanded = Counter()
+        self.files = {}  # target path -> shortcodes still referenced
+
+    def static(self, name: str) -> Optional[List]:
+        if name not in self.templates:
+            template = self.templates_dir / f"{name}.tmpl"
+            self.templates[name] = static_template(template.read_text(encoding="utf-8")) if template.exists() else None
+        return self.templates[name]
+
+    def process(self, target_file: Path, body: str) -> str:
+        """Record the shortcodes in a body, expanding static ones if enabled."""
+        if "{{" not in body:
+            return body
+        calls = list(SHORTCODE_CALL_RE.finditer(body))
+        if not calls:
+            return body
+        # Paired shortcodes have an inner body, so they are never static
+        paired = {m.group(3) for m in calls if m.group(2)}
+        # Markdown and HTML pass expanded HTML through; other formats would not
+        expand = self.expand and target_file.suffix in (".md", ".html")
+
+        referenced = set()
+        pieces = []
+        position = 0
+        for match in calls:
+            _, closing, name, arg_text = match.groups()
+            if closing or name.endswith(".inline"):
+                continue
+            self.uses[name] += 1
+            parts = self.static(name) if expand and name not in paired else None
+            if parts is None:
+                referenced.add(name)
+                continue
+            args = shortcode_args(arg_text)
+            pieces.append(body[position:match.start()])
+            pieces.extend(part if i % 2 == 0 else args.get(part, "") for i, part in enumerate(parts))
+            position = match.end()
+            self.expanded[name] += 1
+        if referenced:
+            self.files[target_file.relative_to(self.root).as_posix()] = sorted(referenced)
+        if not pieces:
+            return body
+        pieces.append(body[position:])
+        return "".join(pieces)
+
+    def referenced(self) -> set:
+        """Template names some imported file still needs, with their includes."""
+        names = set()
+        pending = [name for refs in self.files.values() for name in refs]
+        while pending:
+            name = pending.pop()
+            if name in names:
+                continue
+            names.add(name)
+            template = self.templates_dir / f"{name}.tmpl"
+            if template.exists():
+                pending.extend(TEMPLATE_INCLUDE_RE.findall(template.read_text(encoding="utf-8")))
+        return names
+
+    def write(self, path: Path, output: SiteTarget):
+        usage = {
+            name: {"uses": count, "expanded": self.expanded[name]}
+            for name, count in sorted(self.uses.items())
+        }
+        index = {"usage": usage, "files": dict(sorted(self.files.items()))}
+        output.write_text(path, json.dumps(index, indent=2, ensure_ascii=False) + "\n")
+
+
+# =============================================================================
+# Legacy URLs
+# =============================================================================
+
+# Source files the posts and pages migrations convert
+CONTENT_SUFFIXES = (".txt", ".md", ".rst", ".html")
+
+# A root-relative path in a body, e.g. in href="/weblog/posts/12.html#c1"
+LINK_PATH_RE = re.compile(r"(?<![\w/.:-])/[\w.~%+/-]+")
+
+# How much of a source file to read for its slug
+SOURCE_HEAD_SIZE = 8192
+
+
+def is_content_source(source_file: Path) -> bool:
+    """Whether the posts/pages migrations convert this file."""
+    name = source_file.name
+    return (name.endswith(CONTENT_SUFFIXES) and "wpcomment" not in name
+            and ".meta." not in name)
+
+
+def read_source_metadata(source: SiteSource, source_file: Path) -> Tuple[Path, dict]:
+    """Metadata from the head of a source file, enough for slugs and titles."""
+    metadata, _ = parse_frontmatter(source.head(source_file, SOURCE_HEAD_SIZE))
+    return source_file, metadata
+
+
+def legacy_urls(source_file: Path, metadata: dict, sections: List[str]) -> List[str]:
+    """Every URL Nikola may have published a source file under."""
+    urls = []
+    for page in rendered_page_candidates(source_file, metadata, Path("/"), sections):
+        url = page.as_posix()
+        urls.append(url)
+        if page.name == "index.html":
+            urls.append(url[:-len("index.html")])
+    return urls
+
+
+class LegacyUrls:
+    """Map of legacy Nikola URLs to the URLs Nicolino gives the same content.
+
+    Links are rewritten with one scan per body: a single regex finds every
+    root-relative path and a dict lookup replaces it, so the cost does not
+    depend on how many URLs are mapped.
+    """
+
+    def __init__(self):
+        self.map = {}
+        self.languages = set()  # Translation languages seen in the sources
+        self.conflicts = 0
+        self.rewritten = 0
+        self.files = 0
+
+    def add(self, old: str, new: str):
+        if old == new:
+            return
+        if self.map.setdefault(old, new) != new:
+            self.conflicts += 1
+
+    def finish(self):
+        """Drop legacy URLs that are also some file's new URL: they still resolve."""
+        current = set(self.map.values())
+        for old in [old for old in self.map if old in current]:
+            del self.map[old]
+            self.conflicts += 1
+
+    def lookup(self, path: str) -> Optional[str]:
+        new = self.map.get(path)
+        if new is None:
+            # A path ending a sentence: "see /stories/10.html."
+            stripped = path.rstrip(".")
+            if stripped != path and stripped in self.map:
+                new = self.map[stripped] + path[len(stripped):]
+        return new
+
+    def rewrite(self, text: str) -> str:
+        """Rewrite every mapped link in text in a single pass."""
+        if not self.map or "/" not in text:
+            return text
+        count = 0
+
+        def replace(match):
+            nonlocal count
+            new = self.lookup(match.group(0))
+            if new is None:
+                return match.group(0)
+            count += 1
+            return new
+
+        text = LINK_PATH_RE.sub(replace, text)
+        if count:
+            self.rewritten += count
+            self.files += 1
+        return text
+
+
+def collect_legacy_urls(site: Site) -> LegacyUrls:
+    """Map every post and page's legacy URLs to their new ones.
+
+    Runs before the content passes, so each body can be rewritten as it is
+    written. Only file heads are read, in parallel, for slugs.
+    """
+    urls = LegacyUrls()
+    for kind, source_dir, target_dir in (
+        ("posts", site.source_posts, site.target_posts),
+        ("pages", site.source_pages, site.target_pages),
+    ):
+        if not site.source.exists(source_dir):
+            continue
+        sources = sorted(f for f in site.source.files(source_dir) if is_content_source(f))
+        with thread_pool() as pool:
+            for source_file, metadata in pool.map(read_source_metadata, repeat(site.source), sources):
+                if not metadata:
+                    continue
+                lang = source_language(source_file)
+                if lang:
+                    urls.languages.add(lang)
+                if kind == "posts":
+                    stem = source_file.stem
+                    new = content_link(site, post_folder(site, target_dir, metadata) / f"{stem}.html")
+                    # Where a flat import put the post
+                    urls.add(content_link(site, target_dir / f"{stem}.html"), new)
+                else:
+                    stem = page_target_stem(source_file, metadata)
+                    new = content_link(site, target_dir / f"{stem}.html")
+                for old in legacy_urls(source_file, metadata, OUTPUT_SECTIONS[kind]):
+                    urls.add(old, new)
+    urls.finish()
+    return urls
+
+
+def add_media_redirects(site: Site, root: Path):
+    """Map Nikola's image thumbnail and gallery URLs under root to Nicolino's.
+
+    Nikola thumbnails are image.thumbnail.ext, Nicolino's image.thumb.ext.
+    Translated gallery pages move from /lang/galleries/x/ to
+    /galleries/x/index.lang.html, and originals re-encoded by the media
+    stage keep their old URL through a redirect.
+    """
+    if site.legacy_urls is None or not root.exists():
+        return
+
+    def add_image(old: str, new: str):
+        site.legacy_urls.add(old, new)
+        old_stem, old_ext = os.path.splitext(old)
+        new_stem, new_ext = os.path.splitext(new)
+        site.legacy_urls.add(f"{old_stem}.thumbnail{old_ext}", f"{new_stem}.thumb{new_ext}")
+
+    # Files the media stage re-encoded never existed under their new names
+    reencoded = {}
+    if site.media_record.exists():
+        record = json.loads(site.media_record.read_text(encoding="utf-8"))
+        archive = site.originals_archive.relative_to(site.target_dir)
+        for target, entry in record.items():
+            target_file = site.target_dir / target
+            if root in target_file.parents and target_file.exists():
+                reencoded[target_file] = Path(entry["original"]).relative_to(archive)
+
+    for dirpath, _, filenames in os.walk(root):
+        directory = Path(dirpath)
+        base = "/" + directory.relative_to(site.target_content).as_posix()
+        for name in filenames:
+            if name.lower().endswith(IMAGE_FEATURE_SUFFIXES) and ".thumb." not in name:
+                original = reencoded.get(directory / name)
+                old = "/" + original.as_posix() if original else f"{base}/{name}"
+                add_image(old, f"{base}/{name}")
+        if "index.md" in filenames and site.target_galleries in directory.parents:
+            for lang in site.legacy_urls.languages:
+                new = f"{base}/index.{lang}.html"
+                site.legacy_urls.add(f"/{lang}{base}/", new)
+                site.legacy_urls.add(f"/{lang}{base}/index.html", new)
+
+
+def nginx_quote(value: str) -> str:
+    return f'"{value}"' if re.search(r'[\s;"{}#]', value) else value
+
+
+def write_redirects(site: Site):
+    """Write the legacy URL map as an nginx map, an Apache RewriteMap and JSON.
+
+    All three are exact-match hash lookups, replacing the old
+    stories/ and weblog/posts/ compatibility symlinks.
+    """
+    print("\n" + "="*60)
+    print("WRITING REDIRECTS")
+    print("="*60)
+    write_redirect_tables(site.legacy_urls.map, site.redirects_nginx, site.redirects_apache, site.redirects_json,
+                          site.output)
+
+
+def write_redirect_tables(redirect_map: dict, nginx: Path, apache: Path, json_file: Path, output: SiteTarget):
+    """Write the three redirect tables for a map of legacy URLs to new ones."""
+    redirects = sorted(redirect_map.items())
+
+    with output.open(nginx) as f:
+        f.write("# Legacy Nikola URLs -> Nicolino URLs, generated by import_site.py\n")
+        f.write("#   map $uri $nicolino_redirect { include redirects.nginx.conf; }\n")
+        f.write("#   if ($nicolino_redirect) { return 301 $nicolino_redirect; }\n")
+        for old, new in redirects:
+            f.write(f"{nginx_quote(old)} {nginx_quote(new)};\n")
+
+    skipped = 0
+    with output.open(apache) as f:
+        f.write("# Legacy Nikola URLs -> Nicolino URLs, generated by import_site.py\n")
+        f.write("#   RewriteMap nicolino \"txt:/path/to/redirects.apache.map\"\n")
+        f.write("#   RewriteCond ${nicolino:%{REQUEST_URI}} !=\"\"\n")
+        f.write("#   RewriteRule ^ ${nicolino:%{REQUEST_URI}} [R=301,L]\n")
+        for old, new in redirects:
+            if re.search(r"\s", old + new):
+                # txt: maps are whitespace separated
+                skipped += 1
+                continue
+            f.write(f"{old} {new}\n")
+
+    output.write_text(
+        json_file, json.dumps({"version": 1, "redirects": dict(redirects)}, indent=2, ensure_ascii=False) + "\n"
+    )
+
+    print(f"  {len(redirects)} redirects -> {nginx}, {apache}, {json_file}")
+    if skipped:
+        print(f"  Left {skipped} URLs with whitespace out of the Apache map")
+
+
+def report_legacy_links(site: Site):
+    if site.legacy_urls is None or not site.rewrite_links:
+        return
+    print(f"\n  Legacy links: {site.legacy_urls.rewritten} rewritten in {site.legacy_urls.files} files "
+          f"({len(site.legacy_urls.map)} URLs mapped, {site.legacy_urls.conflicts} ambiguous skipped)")
+
+
+def write_content_file(site: Site, source_file: Path, target_file: Path, metadata: dict, body: str):
+    """Write a converted post or page and record it in the enabled indexes."""
+    if site.legacy_urls is not None and site.rewrite_links:
+        body = site.legacy_urls.rewrite(body)
+    if site.shortcode_index is not None:
+        body = site.shortcode_index.process(target_file, body)
+    site.output.write_text(target_file, convert_frontmatter_to_nicolino(metadata, body))
+    frontmatter = nicolino_frontmatter(metadata)
+    if site.metadata_writer is not None:
+        site.metadata_writer.add(
+            target_file,
+            source_file,
+            frontmatter,
+            slug=nikola_slugify(metadata.get("slug", "")) or source_file.stem.split(".")[0],
+        )
+    if site.search_writer is not None:
+        # Only HTML bodies can be indexed before Nicolino renders them
+        if target_file.suffix == ".html":
+            site.search_writer.add(frontmatter["title"], content_link(site, target_file), body)
+        else:
+            site.search_writer.skipped += 1
+
+
+# =============================================================================
+# Harvesting Rendered Output
+# =============================================================================
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = frozenset((
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr",
+))
+
+
+class ArticleBodyParser(HTMLParser):
+    """Streaming extractor for the article body of a rendered Nikola page.
+
+    Collects the inner HTML of the first element marked as entry content
+    (class "entry-content" or itemprop "articleBody") and ignores the
+    theme around it. Markup is passed through as written.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.parts = []
+        self.stack = []  # Open elements inside the article body
+        self.found = False
+        self.done = False
+
+    def is_article_body(self, attrs) -> bool:
+        for name, value in attrs:
+            if not value:
+                continue
+            if name == "class" and "entry-content" in value.split():
+                return True
+            if name == "itemprop" and "articleBody" in value.split():
+                return True
+        return False
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if not self.found:
+            if self.is_article_body(attrs):
+                self.found = True
+                self.stack.append(tag)
+            return
+        self.parts.append(self.get_starttag_text())
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if self.found and not self.done:
+            self.parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if not self.found or self.done or tag not in self.stack:
+            return
+        # Close anything left implicitly open (e.g. <li> without </li>)
+        while self.stack:
+            if self.stack.pop() == tag:
+                break
+        if self.stack:
+            self.parts.append(f"</{tag}>")
+        else:
+            self.done = True
+
+    def handle_data(self, data):
+        if self.found and not self.done:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data(f"&{name};")
+
+    def handle_charref(self, name):
+        self.handle_data(f"&#{name};")
+
+    def handle_comment(self, data):
+        self.handle_data(f"<!--{data}-->")
+
+
+def article_body(chunks) -> Optional[str]:
+    """The article body HTML of a rendered page, fed in chunks until it ends."""
+    parser = ArticleBodyParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    body = "".join(parser.parts).strip()
+    return body or None
+
+
+def extract_article_body(html_file: Path) -> Optional[str]:
+    """Read a rendered page in chunks and return its article body HTML."""
+    with html_file.open(encoding="utf-8", errors="replace") as f:
+        return article_body(iter(lambda: f.read(65536), ""))
+
+
+def rendered_page_candidates(source_file: Path, metadata: dict, output_dir: Path, sections: List[str]):
+    """Yield the output/ paths where Nikola may have rendered a source file."""
+    stem = source_file.stem
+    lang = ""
+    lang_match = LANG_SUFFIX_RE.search(stem)
+    if lang_match:
+        lang = lang_match.group(1)
+        stem = stem[:lang_match.start()]
+
+    # Nikola publishes under the slugified slug; without one the file stem is
+    # used, which is usually already a slug
+    names = []
+    for name in (nikola_slugify(metadata.get("slug", "")), stem, nikola_slugify(stem)):
+        if name and name not in names:
+            names.append(name)
+
+    for section in sections:
+        base = output_dir / lang / section
+        for name in names:
+            yield base / f"{name}.html"
+            yield base / name / "index.html"
+
+
+def harvest_body(source_file: Path, output_dir: Path, sections: List[str]) -> Optional[str]:
+    """Find the rendered page for a source file and return its article body.
+
+    Like get_cached_html, the HTML is wrapped in raw tags to prevent
+    shortcode reprocessing.
+    """
+    content = source_file.read_text(encoding="utf-8", errors="ignore")
+    metadata, _ = parse_frontmatter(content)
+    for page in rendered_page_candidates(source_file, metadata, output_dir, sections):
+        if not page.is_file():
+            continue
+        body = extract_article_body(page)
+        if body:
+            return "{{% raw %}}\n" + body + "\n{{% /raw %}}"
+    return None
+
+
+def harvest_pages(pages: List[str]) -> Optional[str]:
+    """harvest_body for an archive source, given the text of each rendered page found."""
+    for page in pages:
+        body = article_body((page,))
+        if body:
+            return "{{% raw %}}\n" + body + "\n{{% /raw %}}"
+    return None
+
+
+def harvest_output(site: Site, source_dir: Path, section: str):
+    """Harvest rendered bodies for every non-markdown file in source_dir.
+
+    Runs across a process pool; results go to site.harvested, where
+    process_post_file and process_page_file look before cache/ or pandoc.
+    """
+    source_files = [
+        f for f in site.source.files(source_dir)
+        if f.name.endswith((".txt", ".rst", ".html")) and in_shard(site, f)
+    ]
+    if not source_files:
+        return
+
+    sections = OUTPUT_SECTIONS[section]
+    if site.archive_source:
+        # Workers can't reach the archive's members: find the pages here
+        # and send their text
+        pages = []
+        for source_file in source_files:
+            metadata, _ = parse_frontmatter(site.source.read_text(source_file, "ignore"))
+            pages.append([
+                site.source.read_text(page, "replace")
+                for page in rendered_page_candidates(source_file, metadata, site.source_output, sections)
+                if site.source.is_file(page)
+            ])
+        bodies = pool_map(harvest_pages, pages, chunksize=16)
+    else:
+        bodies = pool_map(
+            harvest_body, source_files, repeat(site.source_output), repeat(sections), chunksize=16
+        )
+    for source_file, body in zip(source_files, bodies):
+        if body:
+            site.harvested[source_file] = body
+
+    harvested = sum(1 for f in source_files if f in site.harvested)
+    output = f"{site.archive_source}: output/" if site.archive_source else site.source_output
+    print(f"  Harvested {harvested} of {len(source_files)} bodies from {output}")
+
+
+def get_prerendered_html(site: Site, source_file: Path, is_es: bool = False) -> Optional[str]:
+    """Get already rendered HTML for a source file, from output/ or cache/."""
+    html = site.harvested.get(source_file)
+    if html:
+        print(f"    Using rendered HTML from output")
+        return html
+
+    html = get_cached_html(site, source_file, is_es)
+    if html:
+        print(f"    Using cached HTML from cache")
+    return html
+
+
+# =============================================================================
+# reStructuredText Conversion
+# =============================================================================
+
+# Pandoc writer and resulting file extension for each --convert-rst choice
+RST_TARGETS = {
+    "markdown": ("markdown-smart", ".md"),
+    "html": ("html", ".html"),
+}
+
+# Nicolino shortcodes, which pandoc must not escape or re-wrap
+SHORTCODE_RE = re.compile(r"\{\{[%<].*?[%>]\}\}", re.DOTALL)
+SHORTCODE_PLACEHOLDER_RE = re.compile(r"NICOLINOSHORTCODE(\d+)X")
+
+
+class RstJob(NamedTuple):
+    """A post or page body waiting to be converted from reStructuredText."""
+    source_file: Path
+    target_file: Path
+    metadata: dict
+    body: str
+
+
+# Converted bodies by (target format, SHA-256 of the reStructuredText), so
+# identical bodies are converted once, across all the sites of a batch
+RST_CACHE = {}
+RST_CACHE_LOCK = threading.Lock()
+
+
+def convert_rst_body(body: str, target: str) -> str:
+    """Convert a reStructuredText body with pandoc, keeping shortcodes verbatim."""
+    shortcodes = []
+
+    def protect(match):
+        shortcodes.append(match.group(0))
+        return f"NICOLINOSHORTCODE{len(shortcodes) - 1}X"
+
+    writer = RST_TARGETS[target][0]
+    result = subprocess.run(
+        ["pandoc", "-f", "rst", "-t", writer, "--wrap=none"],
+        input=SHORTCODE_RE.sub(protect, body),
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or f"pandoc exited with status {result.returncode}")
+
+    return SHORTCODE_PLACEHOLDER_RE.sub(lambda m: shortcodes[int(m.group(1))], result.stdout)
+
+
+def convert_pending_rst(site: Site) -> List[Tuple[Path, str]]:
+    """Convert all queued reStructuredText bodies in parallel and write them.
+
+    Bodies that can't be converted are written unchanged as .rst, so pandoc
+    can still render them at build time, and reported as failures.
+    """
+    jobs = site.rst_queue[:]
+    site.rst_queue.clear()
+    if not jobs:
+        return []
+
+    failures = []
+    if shutil.which("pandoc") is None:
+        failures = [(job.source_file, "pandoc not found in PATH") for job in jobs]
+        results = [(job, None) for job in jobs]
+    else:
+        results = []
+        pending = {}
+        for job in jobs:
+            key = (site.convert_rst, hashlib.sha256(job.body.encode("utf-8")).hexdigest())
+            with RST_CACHE_LOCK:
+                body = RST_CACHE.get(key)
+            if body is not None:
+                results.append((job, body))
+            else:
+                pending.setdefault(key, []).append(job)
+        reused = len(results)
+        with thread_pool() as pool:
+            futures = {
+                pool.submit(convert_rst_body, group[0].body, site.convert_rst): key
+                for key, group in pending.items()
+            }
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    body = future.result()
+                    with RST_CACHE_LOCK:
+                        RST_CACHE[key] = body
+                except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+                    body = None
+                    reason = str(e).splitlines()[0] if str(e) else type(e).__name__
+                    failures.extend((job.source_file, reason) for job in pending[key])
+                results.extend((job, body) for job in pending[key])
+        if reused:
+            print(f"  Reused {reused} conversions from earlier identical bodies")
+
+    for job, body in results:
+        if body is None:
+            target_file = job.target_file.with_suffix(".rst")
+            body = job.body
+        else:
+            target_file = job.target_file
+        write_content_file(site, job.source_file, target_file, job.metadata, body)
+
+    print(f"\n  Converted from reStructuredText: {len(jobs) - len(failures)} files to {site.convert_rst}")
+    if failures:
+        print(f"  Could not convert {len(failures)} files (kept as .rst):")
+        for source_file, reason in sorted(failures):
+            print(f"    {source_file}: {reason}")
+
+    return failures
+
+
 # =============================================================================
 # Posts Migration
 # =============================================================================
 
 
-def process_post_file(source_file: Path, target_dir: Path) -> Optional[Path]:
+def post_folder(site: Site, target_dir: Path, metadata: dict) -> Path:
+    """Folder a post goes in: target_dir, or its dated subfolder with a post layout.
+
+    Posts without a usable date stay in target_dir.
+    """
+    if not site.post_layout:
+        return target_dir
+    date = convert_nikola_date_to_nicolino(metadata.get("date", ""))
+    if date.startswith("0000"):
+        return target_dir
+    year, month, _ = date.split("-")
+    return target_dir / year if site.post_layout == "year" else target_dir / year / month
+
+
+def process_post_file(site: Site, source_file: Path, target_dir: Path) -> Optional[Path]:
     """Process a single post file and convert it to Nicolino format."""
     if "wpcomment" in source_file.name or ".meta." in source_file.name:
         return None
-    if source_file.is_dir():
+    if not site.source.is_file(source_file):
         return None
 
     # Check if this is a translation
     is_es = source_file.name.endswith((".es.txt", ".es.md", ".es.rst", ".es.html"))
 
-    content = source_file.read_text(encoding="utf-8", errors="ignore")
+    content = site.source.read_text(source_file, "ignore")
     metadata, body = parse_frontmatter(content)
 
     if not metadata:
         print(f"  Warning: No frontmatter in {source_file.name}, skipping")
         return None
 
-    # Check if we can use cached HTML (for non-markdown files)
+    target_dir = post_folder(site, target_dir, metadata)
+    if site.post_layout:
+        target_dir.mkdir(parents=True, exist_ok=True)
+
+    # Check if we can use rendered or cached HTML (for non-markdown files)
     cached_html = None
     if not source_file.name.endswith(".md"):
-        cached_html = get_cached_html(source_file, is_es)
+        cached_html = get_prerendered_html(site, source_file, is_es)
         if cached_html:
-            print(f"    Using cached HTML from cache")
             body = cached_html
 
     # Preserve original filename to maintain output paths
@@ -376,50 +1766,64 @@ def process_post_file(source_file: Path, target_dir: Path) -> Optional[Path]:
     else:
         ext = determine_extension(source_file.name)
 
+    # reStructuredText bodies are converted later, in one parallel batch
+    if ext == ".rst" and site.convert_rst:
+        target_file = target_dir / (source_file.stem + RST_TARGETS[site.convert_rst][1])
+        site.rst_queue.append(RstJob(source_file, target_file, metadata, body))
+        return target_file
+
     filename = source_file.stem + ext
     target_file = target_dir / filename
 
-    # Convert frontmatter
-    new_content = convert_frontmatter_to_nicolino(metadata, body)
-
-    # Write to target
-    target_file.write_text(new_content, encoding="utf-8")
+    # Convert frontmatter and write to target
+    write_content_file(site, source_file, target_file, metadata, body)
     return target_file
 
 
-def migrate_posts():
+def migrate_posts(site: Site):
     """Migrate all blog posts."""
     print("\n" + "="*60)
     print("MIGRATING POSTS")
     print("="*60)
 
-    if not SOURCE_POSTS.exists():
-        print(f"  Source directory not found: {SOURCE_POSTS}")
+    if not site.source.exists(site.source_posts):
+        print(f"  Source directory not found: {site.source_posts}")
         return
 
-    TARGET_POSTS.mkdir(parents=True, exist_ok=True)
+    site.target_posts.mkdir(parents=True, exist_ok=True)
+
+    if site.harvest_output:
+        harvest_output(site, site.source_posts, "posts")
 
     processed = 0
     skipped = 0
+    elsewhere = 0
 
-    for source_file in SOURCE_POSTS.iterdir():
-        if not source_file.is_file():
+    for source_file in site.source.files(site.source_posts):
+        if not in_shard(site, source_file):
+            elsewhere += 1
             continue
 
-        if source_file.name.endswith((".txt", ".md", ".rst", ".html")):
-            target_file = process_post_file(source_file, TARGET_POSTS)
+        if source_file.name.endswith(CONTENT_SUFFIXES):
+            target_file = process_post_file(site, source_file, site.target_posts)
         else:
             skipped += 1
             continue
 
         if target_file:
+            site.content_targets[source_file] = target_file
             processed += 1
-            print(f"  {source_file.name} -> {target_file.relative_to(TARGET_DIR)}")
+            print(f"  {source_file.name} -> {target_file.relative_to(site.target_dir)}")
         else:
             skipped += 1
 
     print(f"\n  Processed: {processed} posts")
     print(f"  Skipped: {skipped} files")
+    if site.shard:
+        print(f"  In other shards: {elsewhere} files")
+    report_cache_stats(site)
+
+    convert_pending_rst(site)
 
 
 # =============================================================================
@@ -427,29 +1831,36 @@ def migrate_posts():
 # =============================================================================
 
 
-def process_page_file(source_file: Path, target_dir: Path) -> Optional[Path]:
+def page_target_stem(source_file: Path, metadata: dict) -> str:
+    """Name of an imported page: its sanitized slug, or the source stem."""
+    file_slug = sanitize_slug(metadata.get("slug", ""))
+    if not file_slug or file_slug == "untitled":
+        file_slug = source_file.stem
+    return file_slug
+
+
+def process_page_file(site: Site, source_file: Path, target_dir: Path) -> Optional[Path]:
     """Process a single page file."""
     if "wpcomment" in source_file.name or ".meta." in source_file.name:
         return None
-    if source_file.is_dir():
+    if not site.source.is_file(source_file):
         return None
 
     # Check if this is a translation
     is_es = source_file.name.endswith((".es.txt", ".es.md", ".es.rst", ".es.html"))
 
-    content = source_file.read_text(encoding="utf-8", errors="ignore")
+    content = site.source.read_text(source_file, "ignore")
     metadata, body = parse_frontmatter(content)
 
     if not metadata:
         print(f"  Warning: No frontmatter in {source_file.name}, skipping")
         return None
 
-    # Check if we can use cached HTML (for non-markdown files)
+    # Check if we can use rendered or cached HTML (for non-markdown files)
     cached_html = None
     if not source_file.name.endswith(".md"):
-        cached_html = get_cached_html(source_file, is_es)
+        cached_html = get_prerendered_html(site, source_file, is_es)
         if cached_html:
-            print(f"    Using cached HTML from cache")
             body = cached_html
 
     # Preserve original filename
@@ -459,132 +1870,438 @@ def process_page_file(source_file: Path, target_dir: Path) -> Optional[Path]:
     else:
         ext = determine_extension(source_file.name)
 
-    file_slug = sanitize_slug(metadata.get("slug", ""))
-    if not file_slug or file_slug == "untitled":
-        file_slug = source_file.stem
+    file_slug = page_target_stem(source_file, metadata)
+
+    # reStructuredText bodies are converted later, in one parallel batch
+    if ext == ".rst" and site.convert_rst:
+        target_file = target_dir / f"{file_slug}{RST_TARGETS[site.convert_rst][1]}"
+        site.rst_queue.append(RstJob(source_file, target_file, metadata, body))
+        return target_file
 
     filename = f"{file_slug}{ext}"
     target_file = target_dir / filename
 
-    new_content = convert_frontmatter_to_nicolino(metadata, body)
-    target_file.write_text(new_content, encoding="utf-8")
+    write_content_file(site, source_file, target_file, metadata, body)
     return target_file
 
 
-def migrate_pages():
+def migrate_pages(site: Site):
     """Migrate all pages."""
     print("\n" + "="*60)
     print("MIGRATING PAGES")
     print("="*60)
 
-    if not SOURCE_PAGES.exists():
-        print(f"  Source directory not found: {SOURCE_PAGES}")
+    if not site.source.exists(site.source_pages):
+        print(f"  Source directory not found: {site.source_pages}")
         return
 
-    TARGET_PAGES.mkdir(parents=True, exist_ok=True)
+    site.target_pages.mkdir(parents=True, exist_ok=True)
+
+    if site.harvest_output:
+        harvest_output(site, site.source_pages, "pages")
 
     processed = 0
     skipped = 0
+    elsewhere = 0
 
-    for source_file in SOURCE_PAGES.iterdir():
-        if not source_file.is_file():
+    for source_file in site.source.files(site.source_pages):
+        if not in_shard(site, source_file):
+            elsewhere += 1
             continue
 
-        if source_file.name.endswith((".txt", ".md", ".rst", ".html")):
-            target_file = process_page_file(source_file, TARGET_PAGES)
+        if source_file.name.endswith(CONTENT_SUFFIXES):
+            target_file = process_page_file(site, source_file, site.target_pages)
         else:
             skipped += 1
             continue
 
-        if target_file:
-            processed += 1
-            print(f"  {source_file.name} -> {target_file.relative_to(TARGET_DIR)}")
-        else:
-            skipped += 1
+        if target_file:
+            site.content_targets[source_file] = target_file
+            processed += 1
+            print(f"  {source_file.name} -> {target_file.relative_to(site.target_dir)}")
+        else:
+            skipped += 1
+
+    print(f"\n  Processed: {processed} pages")
+    print(f"  Skipped: {skipped} files")
+    if site.shard:
+        print(f"  In other shards: {elsewhere} files")
+    report_cache_stats(site)
+
+    convert_pending_rst(site)
+
+
+# =============================================================================
+# Galleries Migration
+# =============================================================================
+
+
+def convert_gallery_index(site: Site, index_file: Path):
+    """Convert a gallery index.txt to index.md."""
+    if not index_file.exists():
+        return
+
+    content = index_file.read_text(encoding="utf-8")
+
+    # Parse Nikola metadata format
+    title = "Gallery"
+    title_match = re.search(r'\.\.\s*title:\s*(.+)', content)
+    if title_match:
+        title = title_match.group(1).strip()
+
+    # Remove Nikola metadata lines
+    lines = []
+    for line in content.split("\n"):
+        if not line.strip().startswith(".."):
+            lines.append(line)
+
+    body_content = "\n".join(lines).strip()
+    output_file = index_file.with_suffix(".md")
+    if site.legacy_urls is not None and site.rewrite_links:
+        body_content = site.legacy_urls.rewrite(body_content)
+    if site.shortcode_index is not None:
+        body_content = site.shortcode_index.process(output_file, body_content)
+
+    new_content = f"""---
+title: "{title}"
+date: 2024-01-01
+---
+
+{body_content}
+"""
+
+    output_file.write_text(new_content, encoding="utf-8")
+    index_file.unlink()
+
+    if site.metadata_writer is not None:
+        site.metadata_writer.add(output_file, None, {"title": title, "date": "2024-01-01"}, slug=index_file.parent.name)
+
+    return output_file
+
+
+# Images Nicolino's gallery feature picks up (see Gallery.read_all)
+GALLERY_IMAGE_SUFFIXES = (".jpg", ".png", ".webp", ".gif")
+GALLERY_MANIFEST_NAME = "manifest.json"
+GALLERY_MANIFEST_VERSION = 1
+
+
+def gallery_images(gallery_root: Path) -> List[Path]:
+    """Every gallery image under gallery_root, thumbnails excluded."""
+    images = []
+    for dirpath, _, filenames in os.walk(gallery_root):
+        for name in filenames:
+            if name.endswith(GALLERY_IMAGE_SUFFIXES) and ".thumb." not in name:
+                images.append(Path(dirpath) / name)
+    return images
+
+
+def write_gallery_manifests(gallery_root: Path, under: Optional[Path] = None) -> dict:
+    """Probe every gallery image's header in parallel and write one manifest per gallery.
+
+    Only headers are read (no pixel decoding) plus a content hash, so this
+    stays I/O bound and runs on threads. Every directory holding images is
+    a gallery, as in Nicolino, and gets its own manifest.json. With under,
+    only the galleries in that folder are done.
+    """
+    images = gallery_images(under or gallery_root)
+    hashes = {}
+    if not images:
+        return hashes
+
+    by_gallery = {}
+    unreadable = []
+    with thread_pool() as pool:
+        for path, entry in pool.map(image_probe.manifest_entry, images):
+            if entry is None:
+                unreadable.append(path)
+            else:
+                by_gallery.setdefault(path.parent, []).append(entry)
+                hashes[path] = entry["sha256"]
+
+    for gallery_dir, entries in sorted(by_gallery.items()):
+        entries.sort(key=lambda entry: entry["filename"])
+        manifest = {
+            "version": GALLERY_MANIFEST_VERSION,
+            "gallery": gallery_dir.relative_to(gallery_root).as_posix(),
+            "images": entries,
+        }
+        (gallery_dir / GALLERY_MANIFEST_NAME).write_text(
+            json.dumps(manifest, indent=2, ensure_ascii=False) + "\n", encoding="utf-8"
+        )
+
+    print(f"  Manifests: {len(by_gallery)} galleries, {len(images) - len(unreadable)} images")
+    for path in unreadable:
+        print(f"    Could not read image header: {path}")
+    return hashes
+
+
+# Images Nicolino's images feature resizes and thumbnails (see Image.read_all)
+IMAGE_FEATURE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+
+REENCODE_SUFFIXES = {"webp": ".webp", "jpeg": ".jpg"}
+
+
+class MediaJob(NamedTuple):
+    source: Path
+    archive: Path
+    long_edge: int
+    reencode: Optional[str]
+
+
+def shrink_image(job: MediaJob) -> Tuple[MediaJob, Optional[Path], int, int, Optional[str]]:
+    """Downscale (and maybe re-encode) one image, archiving the original.
+
+    Returns the job, the new path (None if the image was left alone), the
+    sizes before and after, and an error message or None. Results that
+    would not be smaller than the original are discarded.
+    """
+    before = job.source.stat().st_size
+    try:
+        info = image_probe.probe(job.source)
+    except (OSError, ValueError, IndexError):
+        info = None
+    if info is None or info.width is None:
+        return job, None, before, before, None
+    if max(info.width, info.height) <= job.long_edge:
+        return job, None, before, before, None
+
+    target = job.source
+    if job.reencode:
+        target = job.source.with_suffix(REENCODE_SUFFIXES[job.reencode])
+        if target != job.source and target.exists():
+            target = job.source
+
+    temp = target.with_name(f".{target.name}.tmp")
+    try:
+        with Image.open(job.source) as img:
+            exif = img.info.get("exif")
+            img.draft("RGB", (job.long_edge, job.long_edge))
+            img.thumbnail((job.long_edge, job.long_edge), Image.LANCZOS)
+            if target.suffix == ".jpg" and img.mode not in ("RGB", "L"):
+                if "A" in img.getbands():
+                    # JPEG has no alpha channel; keep this one as it is
+                    return job, None, before, before, None
+                img = img.convert("RGB")
+            options = {"format": Image.registered_extensions()[target.suffix.lower()], "quality": 90}
+            if exif:
+                options["exif"] = exif
+            img.save(temp, **options)
+    except Exception as e:
+        temp.unlink(missing_ok=True)
+        return job, None, before, before, str(e)
+
+    after = temp.stat().st_size
+    if after >= before:
+        temp.unlink()
+        return job, None, before, before, None
+
+    job.archive.parent.mkdir(parents=True, exist_ok=True)
+    shutil.move(job.source, job.archive)
+    temp.replace(target)
+    return job, target, before, after, None
+
+
+def shrink_originals(site: Site, root: Path, reencode: Optional[str]):
+    """Downscale oversized images under root in a process pool.
+
+    Originals are moved to the originals archive and the bytes saved are
+    added to the media record. Re-encoding renames files, so it is only
+    asked for on galleries, whose pages list their directory; images/ files
+    are linked by name from posts and keep their format.
+    """
+    if Image is None:
+        print("  Downscale: Pillow is not installed, copying originals unchanged")
+        return
+
+    jobs = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if name.lower().endswith(IMAGE_FEATURE_SUFFIXES) and ".thumb." not in name:
+                source = Path(dirpath) / name
+                archive = site.originals_archive / source.relative_to(site.target_content)
+                jobs.append(MediaJob(source, archive, site.downscale_long_edge, reencode))
+
+    record = {}
+    if site.media_record.exists():
+        record = json.loads(site.media_record.read_text(encoding="utf-8"))
+
+    changed = 0
+    saved = 0
+    failed = []
+    for job, target, before, after, error in pool_map(shrink_image, jobs, chunksize=8):
+        if error:
+            failed.append((job.source, error))
+        if target is None:
+            continue
+        changed += 1
+        saved += before - after
+        record[target.relative_to(site.target_dir).as_posix()] = {
+            "original": job.archive.relative_to(site.target_dir).as_posix(),
+            "before": before,
+            "after": after,
+        }
+
+    site.media_record.write_text(json.dumps(record, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    print(f"  Downscale: {changed} of {len(jobs)} images replaced, "
+          f"{saved / 1048576:.1f} MiB saved (originals in {site.originals_archive})")
+    for source, error in failed:
+        print(f"    {source}: {error}")
+
+
+class ThumbJob(NamedTuple):
+    source: Path
+    thumb: Path
+    size: int
+    source_hash: Optional[str]
+    previous: Optional[dict]
+
+
+def target_config(site: Site) -> dict:
+    """The imported site's conf.yml, or an empty dict."""
+    conf = site.target_dir / "conf.yml"
+    if not conf.exists():
+        return {}
+    with conf.open(encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def make_thumbnail(job: ThumbJob) -> Tuple[ThumbJob, dict, Optional[str]]:
+    """Write one thumbnail like Images.thumb, unless its source is unchanged.
+
+    Returns the job, the record to keep for it and an error message (None
+    on success). The record's "fresh" flag tells if the thumbnail was kept.
+    """
+    digest = job.source_hash or image_probe.file_hash(job.source)
+    record = {"source_sha256": digest, "size": job.size}
+    if job.previous == record and job.thumb.exists():
+        return job, dict(record, fresh=True), None
+
+    try:
+        with Image.open(job.source) as img:
+            # Let the JPEG decoder scale down while decoding
+            img.draft("RGB", (job.size, job.size))
+            img.thumbnail((job.size, job.size))
+            if job.thumb.suffix.lower() in (".jpg", ".jpeg") and img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            job.thumb.parent.mkdir(parents=True, exist_ok=True)
+            img.save(job.thumb, quality=85)
+    except Exception as e:
+        return job, record, str(e)
+    return job, dict(record, fresh=False), None
 
-    print(f"\n  Processed: {processed} pages")
-    print(f"  Skipped: {skipped} files")
 
+def pregenerate_thumbnails(site: Site, hashes: dict, under: Optional[Path] = None):
+    """Create image.thumb.ext for every gallery image in a process pool.
 
-# =============================================================================
-# Galleries Migration
-# =============================================================================
+    Thumbnails go where Nicolino's images feature writes them (output/,
+    mirroring content/) at conf.yml's image_thumb size. A record of source
+    hashes lets unchanged images be skipped on the next import. With under,
+    only the gallery images in that folder are done.
+    """
+    if Image is None:
+        print("  Thumbnails: Pillow is not installed, leaving them to the build")
+        return
 
+    config = target_config(site)
+    size = int(config.get("image_thumb", 640))
+    output_dir = site.target_dir / config.get("output", "output/")
 
-def convert_gallery_index(index_file: Path):
-    """Convert a gallery index.txt to index.md."""
-    if not index_file.exists():
-        return
+    previous = {}
+    if site.thumbnail_record.exists():
+        previous = json.loads(site.thumbnail_record.read_text(encoding="utf-8"))
 
-    content = index_file.read_text(encoding="utf-8")
+    jobs = []
+    for source in gallery_images(under or site.target_galleries):
+        if not source.name.endswith(IMAGE_FEATURE_SUFFIXES):
+            continue
+        dest = output_dir / source.relative_to(site.target_content)
+        thumb = dest.with_name(f"{dest.stem}.thumb{dest.suffix}")
+        key = thumb.relative_to(site.target_dir).as_posix()
+        jobs.append(ThumbJob(source, thumb, size, hashes.get(source), previous.get(key)))
+
+    record = {}
+    if under is not None:
+        # Keep the entries of the galleries that were not redone
+        prefix = output_dir / under.relative_to(site.target_content)
+        prefix = prefix.relative_to(site.target_dir).as_posix() + "/"
+        record = {key: entry for key, entry in previous.items() if not key.startswith(prefix)}
+    created = fresh = 0
+    failed = []
+    for job, entry, error in pool_map(make_thumbnail, jobs, chunksize=16):
+        if error:
+            failed.append((job.source, error))
+            continue
+        if entry.pop("fresh"):
+            fresh += 1
+        else:
+            created += 1
+        record[job.thumb.relative_to(site.target_dir).as_posix()] = entry
 
-    # Parse Nikola metadata format
-    title = "Gallery"
-    title_match = re.search(r'\.\.\s*title:\s*(.+)', content)
-    if title_match:
-        title = title_match.group(1).strip()
+    site.thumbnail_record.write_text(json.dumps(record, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+    print(f"  Thumbnails: {created} created, {fresh} unchanged, {len(failed)} failed ({size}px)")
+    for source, error in failed:
+        print(f"    {source}: {error}")
 
-    # Remove Nikola metadata lines
-    lines = []
-    for line in content.split("\n"):
-        if not line.strip().startswith(".."):
-            lines.append(line)
 
-    body_content = "\n".join(lines).strip()
+def import_gallery(site: Site, item: Path) -> int:
+    """Copy one gallery folder into the target and convert its index files.
 
-    new_content = f"""---
-title: "{title}"
-date: 2024-01-01
----
+    Returns the number of index files converted.
+    """
+    # Copy the entire gallery directory
+    target_gallery = site.target_galleries / item.name
+    if target_gallery.exists():
+        shutil.rmtree(target_gallery)
+    place(site, item, target_gallery)
 
-{body_content}
-"""
+    # Convert index.txt if present
+    processed = 0
+    index_txt = target_gallery / "index.txt"
+    index_es_txt = target_gallery / "index.es.txt"
 
-    output_file = index_file.parent / "index.md"
-    output_file.write_text(new_content, encoding="utf-8")
-    index_file.unlink()
+    if index_txt.exists():
+        convert_gallery_index(site, index_txt)
+        processed += 1
+        print(f"  {item.name}/index.txt -> index.md")
 
-    return output_file
+    if index_es_txt.exists():
+        convert_gallery_index(site, index_es_txt)
+        processed += 1
+        print(f"  {item.name}/index.es.txt -> index.es.md")
+    return processed
 
 
-def migrate_galleries():
+def migrate_galleries(site: Site):
     """Migrate galleries."""
     print("\n" + "="*60)
     print("MIGRATING GALLERIES")
     print("="*60)
 
-    if not SOURCE_GALLERIES.exists():
-        print(f"  Source directory not found: {SOURCE_GALLERIES}")
+    if not site.source_galleries.exists():
+        print(f"  Source directory not found: {site.source_galleries}")
         return
 
-    TARGET_GALLERIES.mkdir(parents=True, exist_ok=True)
+    site.target_galleries.mkdir(parents=True, exist_ok=True)
 
     # Copy gallery directories and convert index files
     processed = 0
 
-    for item in SOURCE_GALLERIES.iterdir():
-        if item.is_dir():
-            # Copy the entire gallery directory
-            target_gallery = TARGET_GALLERIES / item.name
-            if target_gallery.exists():
-                shutil.rmtree(target_gallery)
-            shutil.copytree(item, target_gallery)
+    for item in site.source_galleries.iterdir():
+        if item.is_dir() and in_shard(site, item):
+            processed += import_gallery(site, item)
 
-            # Convert index.txt if present
-            index_txt = target_gallery / "index.txt"
-            index_es_txt = target_gallery / "index.es.txt"
+    print(f"\n  Processed: {processed} gallery indexes")
 
-            if index_txt.exists():
-                convert_gallery_index(index_txt)
-                processed += 1
-                print(f"  {item.name}/index.txt -> index.md")
+    if site.downscale_long_edge:
+        shrink_originals(site, site.target_galleries, site.reencode_format)
 
-            if index_es_txt.exists():
-                convert_gallery_index(index_es_txt)
-                processed += 1
-                print(f"  {item.name}/index.es.txt -> index.es.md")
+    add_media_redirects(site, site.target_galleries)
 
-    print(f"\n  Processed: {processed} gallery indexes")
+    hashes = {}
+    if site.gallery_manifests:
+        hashes = write_gallery_manifests(site.target_galleries)
+    if site.pregenerate_thumbnails:
+        pregenerate_thumbnails(site, hashes)
 
 
 # =============================================================================
@@ -592,60 +2309,72 @@ def migrate_galleries():
 # =============================================================================
 
 
-def migrate_images():
+def migrate_images(site: Site):
     """Migrate images from galleries and images folder."""
     print("\n" + "="*60)
     print("MIGRATING IMAGES")
     print("="*60)
 
-    TARGET_IMAGES.mkdir(parents=True, exist_ok=True)
+    site.target_images.mkdir(parents=True, exist_ok=True)
     copied = 0
 
     # Copy from images/ folder if it exists
-    if SOURCE_IMAGES.exists():
-        for img_file in SOURCE_IMAGES.rglob("*"):
-            if img_file.is_file():
-                rel_path = img_file.relative_to(SOURCE_IMAGES)
-                target_file = TARGET_IMAGES / rel_path
+    if site.source_images.exists():
+        for img_file in sorted(site.source_images.rglob("*")):
+            if img_file.is_file() and in_shard(site, img_file):
+                rel_path = img_file.relative_to(site.source_images)
+                target_file = site.target_images / rel_path
                 target_file.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(img_file, target_file)
+                place(site, img_file, target_file)
                 copied += 1
 
     print(f"  Copied: {copied} image files")
 
+    if site.downscale_long_edge:
+        shrink_originals(site, site.target_images, None)
+
+    add_media_redirects(site, site.target_images)
+
 
 # =============================================================================
 # Files Migration (Static Assets)
 # =============================================================================
 
 
-def migrate_files():
+def import_asset(site: Site, item: Path):
+    """Replace the copy of one top-level files/ entry under assets/.
+
+    An entry that no longer exists in the source is removed.
+    """
+    target_item = site.target_dir / "assets" / item.name
+    if target_item.is_dir():
+        shutil.rmtree(target_item)
+    elif target_item.exists():
+        target_item.unlink()
+    if item.exists():
+        place_output(site, item, target_item)
+
+
+def migrate_files(site: Site):
     """Migrate static files to assets/."""
     print("\n" + "="*60)
     print("MIGRATING STATIC FILES (ASSETS)")
     print("="*60)
 
-    if not SOURCE_FILES.exists():
-        print(f"  Source directory not found: {SOURCE_FILES}")
+    if not site.source_files.exists():
+        print(f"  Source directory not found: {site.source_files}")
         return
 
-    target_assets = TARGET_DIR / "assets"
+    target_assets = site.target_dir / "assets"
     target_assets.mkdir(parents=True, exist_ok=True)
 
     # Copy entire files directory to assets
     if target_assets.exists():
         # Only copy contents, don't remove assets if it has other stuff
-        for item in SOURCE_FILES.iterdir():
-            target_item = target_assets / item.name
-            if target_item.exists():
-                if target_item.is_dir():
-                    shutil.rmtree(target_item)
-                else:
-                    target_item.unlink()
-            if item.is_dir():
-                shutil.copytree(item, target_item)
-            else:
-                shutil.copy2(item, target_item)
+        for item in sorted(site.source_files.iterdir()):
+            if not in_shard(site, item):
+                continue
+            import_asset(site, item)
 
     print(f"  Copied: files/ -> assets/")
 
@@ -655,26 +2384,133 @@ def migrate_files():
 # =============================================================================
 
 
-def migrate_listings():
-    """Migrate code listings."""
+# How Nicolino highlights listings (Listings::HIGHLIGHTER in
+# src/listings.cr; keep both in sync). It starts settings.txt, and the
+# build ignores a cache made for another highlighter configuration.
+LISTINGS_THEME = "default-dark"
+LISTINGS_HIGHLIGHTER = f"tartrazine theme={LISTINGS_THEME} line_numbers=true surrounding_pre=true"
+
+# Seconds one listing may take to highlight
+LISTINGS_TIMEOUT = 60
+
+
+def listing_settings() -> Optional[str]:
+    """Highlighter settings, part of every listings cache key.
+
+    None when the tartrazine CLI, the build's own highlighter, is not
+    installed; its version goes into the settings so entries made by
+    another release miss the cache.
+    """
+    if shutil.which("tartrazine") is None:
+        return None
+    result = subprocess.run(["tartrazine", "--version"], capture_output=True, text=True)
+    version = result.stdout.strip().removeprefix("tartrazine").strip()
+    if result.returncode != 0 or not version:
+        return None
+    return f"{LISTINGS_HIGHLIGHTER}\ntartrazine {version}\n"
+
+
+def highlight_listing(args: Tuple[Path, str, Path]) -> Tuple[Path, Optional[str], bool]:
+    """Highlight one listing into a cache directory unless its entry exists.
+
+    Uses the tartrazine CLI with the build's theme and options, so an entry
+    is the markup the build would render. The key covers the file name,
+    which picks the lexer here and in the build. Returns the listing, its
+    cache key (None for binary files and names tartrazine has no lexer
+    for, which the build handles) and whether the entry was written now.
+    """
+    listing_file, settings, cache_dir = args
+    data = listing_file.read_bytes()
+    try:
+        data.decode("utf-8")
+    except UnicodeDecodeError:
+        return listing_file, None, False
+
+    key = hashlib.sha256(f"{settings}{listing_file.name}\n".encode("utf-8") + data).hexdigest()
+    cache_file = cache_dir / f"{key}.html"
+    if cache_file.exists():
+        return listing_file, key, False
+
+    temp = cache_file.with_name(f".{key}.tmp")
+    try:
+        result = subprocess.run(
+            ["tartrazine", str(listing_file), "-f", "html", "-t", LISTINGS_THEME, "--line-numbers", "-o", str(temp)],
+            capture_output=True, timeout=LISTINGS_TIMEOUT)
+    except subprocess.TimeoutExpired:
+        result = None
+    if result is None or result.returncode != 0 or not temp.exists():
+        temp.unlink(missing_ok=True)
+        return listing_file, None, False
+    temp.replace(cache_file)
+    return listing_file, key, True
+
+
+def prerender_listings(site: Site, listing_files: List[Path]):
+    """Fill the site's listings cache for every listing in a thread pool.
+
+    Entries are keyed by the SHA-256 of the settings, the file name and the
+    file content, so unchanged listings keep their entry and stale entries
+    are dropped.
+    """
+    settings = listing_settings()
+    if settings is None:
+        print("  Highlight cache: tartrazine is not installed, leaving it to the build")
+        return
+
+    site.listings_cache.mkdir(parents=True, exist_ok=True)
+    (site.listings_cache / "settings.txt").write_text(settings, encoding="utf-8")
+    (site.listings_cache / "listings.css").unlink(missing_ok=True)
+
+    keys = set()
+    rendered = 0
+    jobs = zip(listing_files, repeat(settings), repeat(site.listings_cache))
+    with thread_pool() as pool:
+        for _, key, written in pool.map(highlight_listing, jobs):
+            if key is not None:
+                keys.add(key)
+                rendered += written
+
+    removed = 0
+    for entry in site.listings_cache.glob("*.html"):
+        if entry.stem not in keys:
+            entry.unlink()
+            removed += 1
+    print(f"  Highlight cache: {rendered} rendered, {len(keys) - rendered} unchanged, "
+          f"{removed} stale entries removed")
+
+
+def migrate_listings(site: Site):
+    """Migrate code listings, mirroring the whole listings tree."""
     print("\n" + "="*60)
     print("MIGRATING CODE LISTINGS")
     print("="*60)
 
-    if not SOURCE_LISTINGS.exists():
-        print(f"  Source directory not found: {SOURCE_LISTINGS}")
+    if not site.source_listings.exists():
+        print(f"  Source directory not found: {site.source_listings}")
         return
 
-    TARGET_LISTINGS.mkdir(parents=True, exist_ok=True)
+    site.target_listings.mkdir(parents=True, exist_ok=True)
 
-    processed = 0
-    for listing_file in SOURCE_LISTINGS.glob("*.py"):
-        target_file = TARGET_LISTINGS / listing_file.name
-        shutil.copy2(listing_file, target_file)
-        processed += 1
-        print(f"  {listing_file.name}")
+    copied = []
+    for dirpath, dirnames, filenames in os.walk(site.source_listings):
+        # Nicolino skips hidden files and folders
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            if name.startswith("."):
+                continue
+            listing_file = Path(dirpath) / name
+            if not in_shard(site, listing_file):
+                continue
+            rel_path = listing_file.relative_to(site.source_listings)
+            target_file = site.target_listings / rel_path
+            target_file.parent.mkdir(parents=True, exist_ok=True)
+            copied.append(place_output(site, listing_file, target_file))
+            print(f"  {rel_path.as_posix()}")
 
-    print(f"\n  Copied: {processed} listing files")
+    print(f"\n  Copied: {len(copied)} listing files")
+
+    if site.prerender_listings:
+        prerender_listings(site, copied)
 
 
 # =============================================================================
@@ -682,18 +2518,18 @@ def migrate_listings():
 # =============================================================================
 
 
-def migrate_config():
+def migrate_config(site: Site):
     """Copy and adapt configuration."""
     print("\n" + "="*60)
     print("MIGRATING CONFIGURATION")
     print("="*60)
 
     # Copy the config file if it doesn't exist
-    target_conf = TARGET_DIR / "conf.yml"
-    if not target_conf.exists():
+    target_conf = site.target_dir / "conf.yml"
+    if not site.output.exists(target_conf):
         default_conf = Path("conf.yml")
         if default_conf.exists():
-            shutil.copy2(default_conf, target_conf)
+            site.output.copy(default_conf, target_conf)
             print(f"  Created: conf.yml")
 
     print("\n  Note: You may need to manually adjust paths in conf.yml")
@@ -704,71 +2540,1611 @@ def migrate_config():
 # =============================================================================
 
 
-def migrate_shortcodes():
-    """Copy shortcodes directory to maintain compatibility."""
+def migrate_shortcodes(site: Site):
+    """Copy the shortcode templates imported content still references."""
     print("\n" + "="*60)
     print("MIGRATING SHORTCODES")
     print("="*60)
 
-    source_shortcodes = Path("shortcodes")
-    if not source_shortcodes.exists():
-        print(f"  Source directory not found: {source_shortcodes}")
+    if not SOURCE_SHORTCODES.exists():
+        print(f"  Source directory not found: {SOURCE_SHORTCODES}")
         return
 
-    TARGET_SHORTCODES.mkdir(parents=True, exist_ok=True)
+    site.target_shortcodes.mkdir(parents=True, exist_ok=True)
+
+    # Without a usage index (content not imported in this run), copy them all
+    referenced = site.shortcode_index.referenced() if site.shortcode_index is not None else None
 
     processed = 0
-    for shortcode_file in source_shortcodes.glob("*.tmpl"):
-        target_file = TARGET_SHORTCODES / shortcode_file.name
-        shutil.copy2(shortcode_file, target_file)
+    skipped = 0
+    for shortcode_file in sorted(SOURCE_SHORTCODES.glob("*.tmpl")):
+        if referenced is not None and shortcode_file.stem not in referenced:
+            skipped += 1
+            continue
+        target_file = site.target_shortcodes / shortcode_file.name
+        site.output.copy(shortcode_file, target_file)
         processed += 1
         print(f"  {shortcode_file.name}")
 
-    print(f"\n  Copied: {processed} shortcode files")
+    print(f"\n  Copied: {processed} shortcode files, skipped {skipped} unreferenced")
+
+    if site.shortcode_index is not None:
+        print("\n  Usage (calls / expanded at import):")
+        for name, count in site.shortcode_index.uses.most_common():
+            print(f"    {name}: {count} / {site.shortcode_index.expanded[name]}")
+        missing = referenced - {f.stem for f in SOURCE_SHORTCODES.glob("*.tmpl")}
+        for name in sorted(missing):
+            print(f"    Missing template: shortcodes/{name}.tmpl")
+        site.shortcode_index.write(site.shortcode_usage, site.output)
+        print(f"  Shortcode index -> {site.shortcode_usage}")
 
 
 # =============================================================================
-# Main Entry Point
+# Archive Sources
 # =============================================================================
 
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".tar.zst", ".tzst", ".zip")
 
-def main():
-    """Run the complete site migration."""
+# Top-level entries of a Nikola site; anything else at the top of an
+# archive is taken to be a folder wrapping the site, like "mysite/"
+NIKOLA_TOP_LEVEL = frozenset((
+    "posts", "pages", "galleries", "images", "files", "listings", "cache", "output",
+    "conf.py", "themes", "plugins", "templates", "shortcodes",
+))
+
+# Folders whose files are moved into the target as they are
+ARCHIVE_MEDIA_FOLDERS = ("galleries", "images", "files", "listings")
+
+# Copy buffer per member: the archive is read sequentially through it
+ARCHIVE_BUFFER = 1 << 20
+
+
+def is_archive(path: Path) -> bool:
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES) and path.is_file()
+
+
+def archive_members(path: Path):
+    """Yield (name, size, mtime, open, location) for each regular file, in archive order.
+
+    location is the ZipInfo of a zip member, or where a member's data starts
+    in an uncompressed tar, so it can be read again later; None in
+    compressed tars. Tars are read as a stream, so each member must be
+    opened before the next one is yielded.
+    """
+    name = path.name.lower()
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    mtime = time.mktime(info.date_time + (0, 0, -1))
+                    yield info.filename, info.file_size, mtime, lambda info=info: archive.open(info), info
+        return
+
+    if name.endswith((".tar.zst", ".tzst")):
+        if zstandard is None:
+            raise RuntimeError(f"{path}: reading .tar.zst needs the zstandard module")
+        with path.open("rb") as raw, zstandard.ZstdDecompressor().stream_reader(raw) as stream:
+            with tarfile.open(fileobj=stream, mode="r|") as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield (member.name, member.size, member.mtime,
+                               lambda member=member: archive.extractfile(member), None)
+        return
+
+    with tarfile.open(path, mode="r|*") as archive:
+        # Offsets in the stream are offsets in the file only without compression
+        seekable = archive.fileobj.comptype == "tar"
+        for member in archive:
+            if member.isfile():
+                yield (member.name, member.size, member.mtime, lambda member=member: archive.extractfile(member),
+                       member.offset_data if seekable else None)
+
+
+def archive_wants(site: Site, parts: Tuple[str, ...], staged: Path) -> bool:
+    """Whether the import reads an archive member, by its path in the site."""
+    top = parts[0]
+    if len(parts) == 1:
+        # .doit.db may be several files, depending on the dbm backend
+        return top.startswith(".doit.db")
+    if top in ("posts", "pages"):
+        return True
+    if top == "cache":
+        return staged.suffix in (".html", ".dep")
+    if top == "output":
+        return site.harvest_output and staged.suffix == ".html"
+    if top in ARCHIVE_MEDIA_FOLDERS:
+        # Shards only unpack their own media; galleries and files/ go by top-level entry
+        return in_shard(site, site.source_dir.joinpath(*parts[:2]) if top in ("galleries", "files") else staged)
+    return False
+
+
+def stage_archive(site: Site, archive: Path, unpack: bool = True):
+    """Read an archive source in one pass, filling site.source's member index.
+
+    Media and the doit database are unpacked into site.source_dir, through
+    a fixed buffer, and media are later moved, not copied, into the target.
+    Posts, pages and cache/ and output/ pages stay in the archive: they are
+    read again by offset, or kept in memory for compressed tars. Members the
+    import never reads (themes, plugins, output/ except harvested pages,
+    cache/ except rendered bodies) are only listed, for .dep checks.
+
+    Plans don't unpack media: they are listed, found by offset where the
+    archive allows it. The doit database always goes next to
+    site.source_doit_db, as dbm needs a file.
+    """
+    print("\n" + "="*60)
+    print("READING ARCHIVE")
+    print("="*60)
+
+    counts = Counter()
+    sizes = Counter()
+    skipped = skipped_bytes = 0
+    held = held_bytes = 0
+    for name, size, mtime, open_member, location in archive_members(archive):
+        path = site.source.member_path(name)
+        if path is None:
+            skipped += 1
+            skipped_bytes += size
+            continue
+        parts = path.relative_to(site.source_dir).parts
+        stat = MemberStat(size, mtime, int(mtime * 1e9))
+        if not archive_wants(site, parts, path):
+            site.source.add(path, ArchiveMember(stat))
+            skipped += 1
+            skipped_bytes += size
+            continue
+        if len(parts) == 1 or (unpack and parts[0] in ARCHIVE_MEDIA_FOLDERS):
+            # Media are moved into the target, and dbm opens .doit.db by name
+            if len(parts) == 1:
+                path = site.source_doit_db.with_name(parts[0])
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open_member() as src, path.open("wb") as dst:
+                shutil.copyfileobj(src, dst, ARCHIVE_BUFFER)
+            os.utime(path, (mtime, mtime))
+        elif location is not None or parts[0] in ARCHIVE_MEDIA_FOLDERS:
+            site.source.add(path, ArchiveMember(stat, location=location))
+        else:
+            with open_member() as src:
+                site.source.add(path, ArchiveMember(stat, data=src.read()))
+            held += 1
+            held_bytes += size
+        counts[parts[0]] += 1
+        sizes[parts[0]] += size
+
+    for top, count in sorted(counts.items()):
+        print(f"  {top}: {count} files, {sizes[top] / 1e6:.1f} MB")
+    if held:
+        print(f"  Held in memory: {held} files, {held_bytes / 1e6:.1f} MB (compressed archive)")
+    print(f"  Skipped: {skipped} members the import doesn't read, {skipped_bytes / 1e6:.1f} MB")
+
+
+def place(site: Site, source: Path, target: Path):
+    """Copy a source file or folder to target, or move it if it was unpacked from an archive."""
+    if site.archive_source:
+        shutil.move(source, target)
+    elif source.is_dir():
+        shutil.copytree(source, target)
+    else:
+        shutil.copy2(source, target)
+
+
+def place_output(site: Site, source: Path, target: Path) -> Path:
+    """place() a file or folder no later stage reads back; returns where it can be read now.
+
+    An output archive takes it from where it is, when the archive is written.
+    """
+    if site.output_archive:
+        site.output.copy(source, target)
+        return source
+    place(site, source, target)
+    return target
+
+
+# =============================================================================
+# Output Archives
+# =============================================================================
+
+
+def open_output_archive(path: Path):
+    """The binary stream an output archive is written to, and what to close after."""
+    if str(path) == "-":
+        # The real stdout: main() sends progress output to stderr meanwhile
+        return sys.__stdout__.buffer, []
+    raw = path.open("wb")
+    name = path.name.lower()
+    if name.endswith((".tar.gz", ".tgz")):
+        # No name or timestamp in the gzip header
+        stream = gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+        return stream, [stream, raw]
+    if name.endswith((".tar.zst", ".tzst")):
+        if zstandard is None:
+            raw.close()
+            raise RuntimeError(f"{path}: writing .tar.zst needs the zstandard module")
+        stream = zstandard.ZstdCompressor().stream_writer(raw)
+        return stream, [stream, raw]
+    return raw, [raw]
+
+
+def write_output_archive(tree: Path, archive: Path, members: Optional[dict] = None) -> int:
+    """Stream tree, and members (see TargetArchive), into a tar archive, reproducibly.
+
+    Members are sorted by path, owned by root with no names, and have
+    normalized permissions and OUTPUT_MTIME as their timestamp. Files under
+    output/ (pre-generated thumbnails) get one second more, so a
+    --fast-mode build, which compares mtimes, still finds them newer than
+    their sources. Returns the member count.
+    """
+    # Relative path -> Path of a file, bytes, or None for a folder
+    entries = {"": None}
+    for path in tree.rglob("*"):
+        entries[path.relative_to(tree).as_posix()] = None if path.is_dir() else path
+    for path, member in (members or {}).items():
+        name = path.relative_to(tree).as_posix()
+        entries[name] = member
+        for parent in PurePosixPath(name).parents[:-1]:
+            entries.setdefault(parent.as_posix(), None)
+
+    stream, to_close = open_output_archive(archive)
+    count = 0
+    try:
+        with tarfile.open(fileobj=stream, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            for name in sorted(entries):
+                member = entries[name]
+                info = tarfile.TarInfo(f"{tree.name}/{name}" if name else tree.name)
+                info.mtime = OUTPUT_MTIME
+                if name.startswith("output/"):
+                    info.mtime += 1
+                if member is None:
+                    info.type = tarfile.DIRTYPE
+                    info.mode = 0o755
+                    tar.addfile(info)
+                elif isinstance(member, bytes):
+                    info.size = len(member)
+                    info.mode = 0o644
+                    tar.addfile(info, io.BytesIO(member))
+                else:
+                    stat = member.stat()
+                    info.size = stat.st_size
+                    info.mode = 0o755 if stat.st_mode & 0o100 else 0o644
+                    with member.open("rb") as f:
+                        tar.addfile(info, f)
+                count += 1
+    finally:
+        stream.flush()
+        for f in to_close:
+            f.close()
+    return count
+
+
+# =============================================================================
+# Shards
+# =============================================================================
+
+
+def shard_key(site: Site, source: Path) -> str:
+    """What decides a source's shard: its path under the source without
+    extension or language suffix, so translations stay with their original.
+    """
+    rel = source.relative_to(site.source_dir)
+    return (rel.parent / LANG_SUFFIX_RE.sub("", rel.stem)).as_posix()
+
+
+def shard_of(key: str, count: int) -> int:
+    """The shard (1 to count) of a key, the same on every machine and run."""
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def in_shard(site: Site, source: Path) -> bool:
+    """Whether this run imports a source file or folder."""
+    if site.shard is None:
+        return True
+    index, count = site.shard
+    return shard_of(shard_key(site, source), count) == index
+
+
+def shard_root(target: Path, index: int, count: int) -> Path:
+    """Where one shard of an import into target is written."""
+    return target.with_name(f"{target.name}.shard-{index}-of-{count}")
+
+
+def write_shard_manifest(site: Site):
+    """List every file of this shard with its size and SHA-256."""
+    files = sorted(path for path in site.target_dir.rglob("*") if path.is_file())
+    files = [path for path in files if path.name != SHARD_MANIFEST_NAME]
+    with thread_pool() as pool:
+        hashes = list(pool.map(image_probe.file_hash, files))
+    manifest = {
+        "version": 1,
+        "shard": site.shard[0],
+        "count": site.shard[1],
+        "source": str(site.archive_source or site.source_dir),
+        "files": {
+            path.relative_to(site.target_dir).as_posix(): {"size": path.stat().st_size, "sha256": digest}
+            for path, digest in zip(files, hashes)
+        },
+    }
+    (site.target_dir / SHARD_MANIFEST_NAME).write_text(json.dumps(manifest, indent=1) + "\n", encoding="utf-8")
+    print(f"\n  Shard {site.shard[0]} of {site.shard[1]}: {len(files)} files "
+          f"-> {site.target_dir / SHARD_MANIFEST_NAME}")
+
+
+def merge_metadata_index(parts: List[Path], target: Path, collisions: List[str]):
+    header = None
+    records = []
+    for part in parts:
+        with part.open(encoding="utf-8") as f:
+            header = json.loads(f.readline())
+            records.extend(json.loads(line) for line in f if line.strip())
+    with target.open("w", encoding="utf-8") as f:
+        for record in [header] + sorted(records, key=lambda record: record["path"]):
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+def merge_search_index(parts: List[Path], target: Path, collisions: List[str]):
+    items = []
+    for part in parts:
+        items.extend(json.loads(part.read_text(encoding="utf-8")))
+    items.sort(key=lambda item: item["url"])
+    for number, item in enumerate(items):
+        item["id"] = number
+    target.write_text("[" + ",".join(json.dumps(item, ensure_ascii=False) for item in items) + "]",
+                      encoding="utf-8")
+
+
+def merge_shortcode_usage(parts: List[Path], target: Path, collisions: List[str]):
+    usage = {}
+    files = {}
+    for part in parts:
+        index = json.loads(part.read_text(encoding="utf-8"))
+        for name, counts in index["usage"].items():
+            merged = usage.setdefault(name, {"uses": 0, "expanded": 0})
+            merged["uses"] += counts["uses"]
+            merged["expanded"] += counts["expanded"]
+        files.update(index["files"])
+    index = {"usage": dict(sorted(usage.items())), "files": dict(sorted(files.items()))}
+    target.write_text(json.dumps(index, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+
+def merge_records(parts: List[Path], target: Path, collisions: List[str]):
+    """Union of JSON objects keyed by path, such as the thumbnail record."""
+    record = {}
+    for part in parts:
+        for key, value in json.loads(part.read_text(encoding="utf-8")).items():
+            if record.setdefault(key, value) != value:
+                collisions.append(f"{target.name}: {key}")
+    target.write_text(json.dumps(record, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def merge_redirects(parts: List[Path], target: Path, collisions: List[str]):
+    """Union of the shards' redirect maps, written as all three tables."""
+    urls = LegacyUrls()
+    for part in parts:
+        for old, new in json.loads(part.read_text(encoding="utf-8"))["redirects"].items():
+            if urls.map.setdefault(old, new) != new:
+                collisions.append(f"{target.name}: {old}")
+    urls.finish()
+    write_redirect_tables(urls.map, target.with_name("redirects.nginx.conf"),
+                          target.with_name("redirects.apache.map"), target, TargetFolder())
+
+
+# Files every shard writes its own part of, by path under the target, and
+# how to combine the parts. Redirect tables are rebuilt from redirects.json.
+SHARD_MERGERS = {
+    ".nicolino-metadata.jsonl": merge_metadata_index,
+    "search-index.json": merge_search_index,
+    ".nicolino-shortcodes.json": merge_shortcode_usage,
+    ".nicolino-thumbs.json": merge_records,
+    ".nicolino-media.json": merge_records,
+    "redirects.json": merge_redirects,
+}
+SHARD_REBUILT = {"redirects.nginx.conf", "redirects.apache.map"}
+
+
+def merge_shards(target: Path) -> bool:
+    """Combine the shard roots of an import into target.
+
+    Files found in several shards must be identical, except the indexes in
+    SHARD_MERGERS, which are combined. Nothing is written if a shard is
+    missing or incomplete or two shards disagree about a file. Entries that
+    differ inside merged indexes are reported, keeping the first shard's.
+    """
+    print("\n" + "="*60)
+    print("MERGING SHARDS")
+    print("="*60)
+
+    manifests = {}
+    for root in sorted(target.parent.glob(f"{glob.escape(target.name)}.shard-*-of-*")):
+        manifest_file = root / SHARD_MANIFEST_NAME
+        if manifest_file.exists():
+            manifests[root] = json.loads(manifest_file.read_text(encoding="utf-8"))
+        else:
+            print(f"  {root}: no {SHARD_MANIFEST_NAME}, the shard did not finish")
+            return False
+    if not manifests:
+        print(f"  No shards found next to {target} ({target.name}.shard-N-of-M)")
+        return False
+    counts = {manifest["count"] for manifest in manifests.values()}
+    if len(counts) != 1:
+        print(f"  Shard roots of different splits next to {target}: {sorted(counts)} shards")
+        return False
+    count = counts.pop()
+    indexes = sorted(manifest["shard"] for manifest in manifests.values())
+    if indexes != list(range(1, count + 1)):
+        missing = sorted(set(range(1, count + 1)) - set(indexes))
+        print(f"  Missing shards {missing} of {count}")
+        return False
+    if target.exists() and any(target.iterdir()):
+        print(f"  {target} is not empty; remove it first")
+        return False
+
+    # Where each file comes from, checking the shards are complete
+    sources = {}
+    problems = []
+    for root, manifest in manifests.items():
+        for rel, entry in manifest["files"].items():
+            path = root / rel
+            if not path.is_file() or path.stat().st_size != entry["size"]:
+                problems.append(f"{path}: missing or changed since the shard finished")
+            sources.setdefault(rel, []).append((path, entry["sha256"]))
+    for rel, copies in sorted(sources.items()):
+        if rel in SHARD_MERGERS or rel in SHARD_REBUILT:
+            continue
+        if len({digest for _, digest in copies}) > 1:
+            problems.append(f"{rel}: differs between " + ", ".join(str(path.parent) for path, _ in copies))
+    if problems:
+        print(f"  {len(problems)} problems, nothing merged:")
+        for problem in problems:
+            print(f"    {problem}")
+        return False
+
+    copied = 0
+    for rel, copies in sorted(sources.items()):
+        if rel in SHARD_MERGERS or rel in SHARD_REBUILT:
+            continue
+        destination = target / rel
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(copies[0][0], destination)
+        copied += 1
+
+    collisions = []
+    for rel, merger in SHARD_MERGERS.items():
+        if rel in sources:
+            merger([path for path, _ in sources[rel]], target / rel, collisions)
+            print(f"  Merged {rel} from {len(sources[rel])} shards")
+    print(f"  Copied {copied} files from {count} shards into {target}")
+    if collisions:
+        print(f"  {len(collisions)} entries differ between shards (first one kept):")
+        for collision in collisions:
+            print(f"    {collision}")
+        return False
+    return True
+
+
+# =============================================================================
+# Watch Mode
+# =============================================================================
+
+# Source folders watch mode follows
+WATCH_FOLDERS = ("posts", "pages", "galleries", "images", "files", "listings", "cache")
+
+# Seconds without new events before a burst of changes is imported, and
+# the most a burst can delay its import
+WATCH_DEBOUNCE = 0.2
+WATCH_MAX_DELAY = 2.0
+
+# Seconds between scans when inotify is not available
+WATCH_POLL_INTERVAL = 0.5
+
+
+class InotifyWatcher:
+    """Changed paths under some folders, from inotify (needs inotify_simple)."""
+
+    def __init__(self, roots: List[Path]):
+        flags = inotify_simple.flags
+        self.mask = (flags.CREATE | flags.MODIFY | flags.CLOSE_WRITE | flags.DELETE
+                     | flags.MOVED_FROM | flags.MOVED_TO)
+        self.inotify = inotify_simple.INotify()
+        self.dirs = {}
+        for root in roots:
+            if root.is_dir():
+                self.watch_tree(root)
+
+    def watch_tree(self, directory: Path) -> List[Path]:
+        """Watch a folder and its subfolders. Returns the files already in them."""
+        files = []
+        for dirpath, _, filenames in os.walk(directory):
+            self.dirs[self.inotify.add_watch(dirpath, self.mask)] = Path(dirpath)
+            files.extend(Path(dirpath) / name for name in filenames)
+        return files
+
+    def changes(self, timeout: Optional[float]) -> set:
+        """Paths changed within timeout seconds (None waits for the first change)."""
+        flags = inotify_simple.flags
+        changed = set()
+        for event in self.inotify.read(timeout=None if timeout is None else int(timeout * 1000)):
+            directory = self.dirs.get(event.wd)
+            if event.mask & flags.IGNORED:
+                self.dirs.pop(event.wd, None)
+                continue
+            if directory is None or not event.name:
+                continue
+            path = directory / event.name
+            changed.add(path)
+            if event.mask & flags.ISDIR and event.mask & (flags.CREATE | flags.MOVED_TO):
+                # Files can land in a new folder before its watch is added
+                changed.update(self.watch_tree(path))
+        return changed
+
+
+class PollingWatcher:
+    """Changed paths under some folders, by comparing sizes and mtimes."""
+
+    def __init__(self, roots: List[Path]):
+        self.roots = roots
+        self.state = self.scan()
+
+    def scan(self) -> dict:
+        state = {}
+        for root in self.roots:
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    state[path] = (stat.st_size, stat.st_mtime_ns)
+        return state
+
+    def changes(self, timeout: Optional[float]) -> set:
+        """Paths changed within timeout seconds (None waits for the first change)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = WATCH_POLL_INTERVAL
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            time.sleep(wait)
+            state = self.scan()
+            changed = {Path(path) for path in state.keys() | self.state.keys()
+                       if state.get(path) != self.state.get(path)}
+            self.state = state
+            if changed or (deadline is not None and time.monotonic() >= deadline):
+                return changed
+
+
+def is_watched_file(site: Site, path: Path) -> bool:
+    """Whether a changed path is something the import reads (not editor droppings)."""
+    rel = path.relative_to(site.source_dir)
+    return not any(part.startswith((".", "#")) or part.endswith("~") for part in rel.parts)
+
+
+def cached_sources(site: Site, cache_file: Path) -> List[Path]:
+    """The posts or pages a cache/ entry holds the HTML of (see get_cached_html)."""
+    name = cache_file.name
+    if name.endswith(".dep"):
+        name = name[:-len(".dep")]
+    if not name.endswith(".html"):
+        return []
+    rel_dir = cache_file.parent.relative_to(site.source_cache)
+    source_dir = site.source_dir / rel_dir
+    if not rel_dir.parts or rel_dir.parts[0] not in ("posts", "pages") or not source_dir.is_dir():
+        return []
+    stem = name[:-len(".html")]
+    return [
+        source for source in source_dir.glob(f"{glob.escape(stem)}.*")
+        if source.stem == stem and source.name.endswith(CONTENT_SUFFIXES)
+    ]
+
+
+def sync_content_file(site: Site, source_file: Path):
+    """Re-import one post or page, removing the file it used to produce."""
+    if source_file.parent == site.source_posts:
+        target_dir, process = site.target_posts, process_post_file
+    else:
+        target_dir, process = site.target_pages, process_page_file
+
+    # Rendered output/ predates the edit; cache/ is checked for freshness again
+    site.harvested.pop(source_file, None)
+    old = site.content_targets.pop(source_file, None)
+    new = None
+    if source_file.is_file() and source_file.name.endswith(CONTENT_SUFFIXES):
+        target_dir.mkdir(parents=True, exist_ok=True)
+        new = process(site, source_file, target_dir)
+    if new:
+        site.content_targets[source_file] = new
+        print(f"  {source_file.relative_to(site.source_dir)} -> {new.relative_to(site.target_dir)}")
+    # Another source may have been imported to the same file since
+    if old and old != new and old not in site.content_targets.values() and old.exists():
+        old.unlink()
+        print(f"  Removed {old.relative_to(site.target_dir)}")
+
+
+def sync_mirrored_file(site: Site, source: Path, target: Path):
+    """Copy a changed file to its mirror in the target, or remove the mirror."""
+    if source.is_file():
+        target.parent.mkdir(parents=True, exist_ok=True)
+        place(site, source, target)
+        print(f"  {source.relative_to(site.source_dir)} -> {target.relative_to(site.target_dir)}")
+    elif not source.exists() and (target.exists() or target.is_symlink()):
+        if target.is_dir():
+            shutil.rmtree(target)
+        else:
+            target.unlink()
+        print(f"  Removed {target.relative_to(site.target_dir)}")
+
+
+def sync_changes(site: Site, paths: set):
+    """Re-import what a set of changed source paths affects.
+
+    Posts and pages are converted again one by one, galleries and files/
+    entries are copied again as a whole, and images and listings are
+    copied file by file. Indexes, redirect tables and the shortcode usage
+    index are left as the last full import wrote them.
+    """
+    content = set()
+    galleries = set()
+    assets = set()
+    images = set()
+    listings = set()
+    for path in paths:
+        if not is_watched_file(site, path):
+            continue
+        folder, *rest = path.relative_to(site.source_dir).parts
+        if folder == "cache":
+            content.update(cached_sources(site, path))
+        elif folder in ("posts", "pages") and len(rest) == 1:
+            content.add(path)
+        elif folder == "galleries" and rest:
+            galleries.add(rest[0])
+        elif folder == "files" and rest:
+            assets.add(rest[0])
+        elif folder == "images" and rest:
+            images.add(path)
+        elif folder == "listings" and rest:
+            listings.add(path)
+
+    for source_file in sorted(content):
+        sync_content_file(site, source_file)
+    convert_pending_rst(site)
+
+    for name in sorted(galleries):
+        source = site.source_galleries / name
+        target = site.target_galleries / name
+        if not source.is_dir():
+            if target.exists():
+                shutil.rmtree(target)
+                print(f"  Removed {target.relative_to(site.target_dir)}")
+            continue
+        site.target_galleries.mkdir(parents=True, exist_ok=True)
+        import_gallery(site, source)
+        if site.downscale_long_edge:
+            shrink_originals(site, target, site.reencode_format)
+        hashes = write_gallery_manifests(site.target_galleries, target) if site.gallery_manifests else {}
+        if site.pregenerate_thumbnails:
+            pregenerate_thumbnails(site, hashes, target)
+
+    for name in sorted(assets):
+        (site.target_dir / "assets").mkdir(parents=True, exist_ok=True)
+        import_asset(site, site.source_files / name)
+        if (site.source_files / name).exists():
+            print(f"  files/{name} -> assets/{name}")
+        else:
+            print(f"  Removed assets/{name}")
+
+    for path in sorted(images):
+        sync_mirrored_file(site, path, site.target_images / path.relative_to(site.source_images))
+    if site.downscale_long_edge:
+        folders = {site.target_images / path.parent.relative_to(site.source_images) for path in images}
+        for directory in sorted(folders):
+            if directory.is_dir():
+                shrink_originals(site, directory, None)
+
+    settings = listing_settings() if site.prerender_listings else None
+    for path in sorted(listings):
+        target = site.target_listings / path.relative_to(site.source_listings)
+        sync_mirrored_file(site, path, target)
+        if settings and target.is_file():
+            site.listings_cache.mkdir(parents=True, exist_ok=True)
+            highlight_listing((target, settings, site.listings_cache))
+
+
+def watch_site(site: Site):
+    """Keep the last imported site in sync with its source until interrupted.
+
+    Changes under WATCH_FOLDERS are read from inotify when inotify_simple is
+    installed, or found by polling otherwise. Bursts of events are imported
+    together once the source has been quiet for WATCH_DEBOUNCE seconds.
+    """
+    if site.archive_source or site.output_archive or site.shard:
+        raise RuntimeError("Watch mode needs a source folder and a plain target folder")
+
+    roots = [site.source_dir / folder for folder in WATCH_FOLDERS]
+    if inotify_simple is not None:
+        watcher, how = InotifyWatcher(roots), "inotify"
+    else:
+        watcher, how = PollingWatcher(roots), f"polling every {WATCH_POLL_INTERVAL}s"
+
+    print(f"\nWatching {site.source_dir} ({how}); press Ctrl+C to stop")
+    try:
+        while True:
+            changed = watcher.changes(None)
+            start = time.monotonic()
+            while time.monotonic() - start < WATCH_MAX_DELAY:
+                more = watcher.changes(WATCH_DEBOUNCE)
+                if not more:
+                    break
+                changed |= more
+            began = time.perf_counter()
+            print(f"\n{time.strftime('%H:%M:%S')} {len(changed)} changed paths")
+            sync_changes(site, changed)
+            print(f"  Synced in {time.perf_counter() - began:.2f}s")
+    except KeyboardInterrupt:
+        print("\nStopped watching")
+
+
+# =============================================================================
+# Library API
+# =============================================================================
+
+
+def run_import(config: ImportConfig) -> bool:
+    """Import one site. Returns False if its source directory is missing.
+
+    The process pool stays up for the next call; close_pool() stops it.
+    """
+    with Site(config) as site:
+        return migrate_site(site)
+
+
+def migrate_site(site: Site) -> bool:
+    """Run every stage of an import. Returns False if the source is missing."""
     print("\n" + "="*60)
     print("NICOLINO SITE IMPORT")
     print("="*60)
-    print(f"\nSource: {SOURCE_DIR.absolute()}")
-    print(f"Target: {TARGET_DIR.absolute()}")
+    source = site.archive_source or site.source_dir
+    print(f"\nSource: {source.absolute()}")
+    print(f"Target: {site.target_dir.absolute()}")
+    if site.output_archive:
+        print(f"Archive: {site.output_archive}")
 
-    if not SOURCE_DIR.exists():
-        print(f"\nError: Source directory not found: {SOURCE_DIR}")
-        print("Please ensure 'mysite' directory exists in the nicolino root.")
-        return
+    if not source.exists():
+        print(f"\nError: Source directory not found: {source}")
+        print(f"Please ensure '{source}' exists in the nicolino root.")
+        return False
 
     # Create target directories
-    TARGET_DIR.mkdir(parents=True, exist_ok=True)
-    TARGET_CONTENT.mkdir(parents=True, exist_ok=True)
-
-    # Run all migrations
-    migrate_config()
-    migrate_shortcodes()
-    migrate_posts()
-    migrate_pages()
-    migrate_galleries()
-    migrate_images()
-    migrate_files()
-    migrate_listings()
+    site.target_dir.mkdir(parents=True, exist_ok=True)
+    site.target_content.mkdir(parents=True, exist_ok=True)
+
+    try:
+        if site.archive_source:
+            stage_archive(site, site.archive_source)
+
+        site.shortcode_index = ShortcodeIndex(SOURCE_SHORTCODES, site.expand_shortcodes, site.target_dir)
+        if site.rewrite_links or site.write_redirects:
+            site.legacy_urls = collect_legacy_urls(site)
+        if site.metadata_index is not None:
+            site.metadata_writer = MetadataIndex(site.metadata_index, site)
+        if site.search_index is not None:
+            site.search_writer = SearchIndex(site.search_index, site.output)
+
+        # Run all migrations
+        migrate_config(site)
+        try:
+            migrate_posts(site)
+            migrate_pages(site)
+            migrate_galleries(site)
+            report_legacy_links(site)
+            # After the content passes, which fill the shortcode usage index
+            migrate_shortcodes(site)
+        finally:
+            if site.metadata_writer is not None:
+                site.metadata_writer.close()
+                site.metadata_writer = None
+            if site.search_writer is not None:
+                site.search_writer.close()
+                site.search_writer = None
+        migrate_images(site)
+        migrate_files(site)
+        migrate_listings(site)
+        if site.write_redirects:
+            write_redirects(site)
+        if site.output_archive:
+            count = write_output_archive(site.target_dir, site.output_archive, site.output.members)
+            destination = "stdout" if str(site.output_archive) == "-" else site.output_archive
+            print(f"\n  Archived {count} members -> {destination}")
+    finally:
+        if site.archive_source and site.source_dir.exists():
+            shutil.rmtree(site.source_dir)
+    if site.shard:
+        write_shard_manifest(site)
+        print(f"\n  When all {site.shard[1]} shards are done: "
+              f"import_site.py --merge-shards --target {site.config.target}")
+        return True
 
     print("\n" + "="*60)
     print("IMPORT COMPLETE!")
     print("="*60)
     print("\nNext steps:")
     print("1. Review conf.yml and adjust paths if needed")
-    print("2. Run: cd myblog && ../bin/nicolino build")
-    print("3. Create compatibility symlinks for old HTML paths:")
-    print("   ../scripts/add_compat_symlinks.sh myblog/output")
+    if site.output_archive:
+        print(f"2. Extract the archive, then run: cd {site.target_dir.name} && nicolino build")
+    else:
+        print(f"2. Run: cd {site.target_dir} && nicolino build")
+    redirects = site.redirects_nginx
+    if site.output_archive:
+        redirects = redirects.relative_to(site.target_dir.parent)
+    print(f"3. Serve redirects for old Nikola URLs from {redirects},")
+    print(f"   {site.redirects_apache.name} or {site.redirects_json.name}")
     print("4. Check the output/ directory for generated files")
+    if site.convert_rst:
+        print("5. If no files were kept as .rst, remove 'pandoc' from the features in conf.yml")
     print("="*60 + "\n")
+    return True
+
+
+# ImportConfig fields that hold paths
+CONFIG_PATH_FIELDS = ("source", "target", "output_archive", "search_index")
+
+
+def load_batch(batch_file: Path, base: ImportConfig) -> List[ImportConfig]:
+    """Site configs from a batch file.
+
+    The file is YAML: a list of sites, or a mapping with "sites" and
+    optional "defaults". Each site maps ImportConfig fields to values and
+    needs at least source and target. Fields a site leaves out come from
+    "defaults", then from base (the command line options).
+    """
+    with batch_file.open(encoding="utf-8") as f:
+        data = yaml.load(f, Loader=Loader) or {}
+    if isinstance(data, list):
+        data = {"sites": data}
+    defaults = data.get("defaults") or {}
+
+    configs = []
+    for number, entry in enumerate(data.get("sites") or [], 1):
+        fields = dict(defaults, **entry)
+        unknown = set(fields) - set(ImportConfig._fields)
+        if unknown:
+            raise ValueError(f"{batch_file}: site {number}: unknown options {', '.join(sorted(unknown))}")
+        if "source" not in entry or "target" not in entry:
+            raise ValueError(f"{batch_file}: site {number}: needs a source and a target")
+        for name in CONFIG_PATH_FIELDS:
+            if isinstance(fields.get(name), str):
+                fields[name] = Path(fields[name])
+        configs.append(base._replace(**fields))
+
+    targets = Counter(config.target.resolve() for config in configs)
+    shared = [str(target) for target, count in targets.items() if count > 1]
+    if shared:
+        raise ValueError(f"{batch_file}: several sites import into {', '.join(shared)}")
+    return configs
+
+
+# Sites a batch imports at the same time, so one site's file copies and
+# reads overlap with another's stages in the process pool
+BATCH_SITES = 2
+
+
+class ThreadOutput:
+    """A sys.stdout stand-in that gives each thread its own buffer.
+
+    Threads that haven't set a buffer write to the wrapped stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def buffer(self):
+        """The current thread's buffer, or None."""
+        return getattr(self.local, "buffer", None)
+
+    def share(self, buffer):
+        """Make the current thread write to buffer (a pool initializer)."""
+        self.local.buffer = buffer
+
+    def write(self, text: str) -> int:
+        return (self.buffer() or self.stream).write(text)
+
+    def flush(self):
+        if self.buffer() is None:
+            self.stream.flush()
+
+
+def run_buffered(config: ImportConfig, output: ThreadOutput) -> Tuple[str, float, str]:
+    """Import one site of a batch, collecting what it prints.
+
+    Returns its status, its duration and its output.
+    """
+    output.local.buffer = io.StringIO()
+    start = time.perf_counter()
+    try:
+        status = "ok" if run_import(config) else "missing source"
+    except Exception as e:
+        status = f"failed: {e}"
+        print(f"\nError importing {config.source}: {e}")
+    finally:
+        log = output.local.buffer.getvalue()
+        output.local.buffer = None
+    return status, time.perf_counter() - start, log
+
+
+def run_batch(configs: List[ImportConfig]):
+    """Import several sites in this process, BATCH_SITES at a time.
+
+    The sites share the interpreter, the process pool, the YAML codec and
+    the reStructuredText conversion cache. Each site's output is printed
+    as a whole, in batch order. A site that fails is reported and the
+    batch goes on.
+    """
+    results = []
+    output = ThreadOutput(sys.stdout)
+    with contextlib.redirect_stdout(output), ThreadPoolExecutor(max_workers=BATCH_SITES) as pool:
+        futures = [pool.submit(run_buffered, config, output) for config in configs]
+        for config, future in zip(configs, futures):
+            status, elapsed, log = future.result()
+            output.stream.write(log)
+            output.stream.flush()
+            results.append((config, status, elapsed))
+
+    print("\n" + "="*60)
+    print(f"BATCH COMPLETE: {len(configs)} sites")
+    print("="*60)
+    for config, status, elapsed in results:
+        print(f"  {config.source} -> {config.target}: {status} ({elapsed:.1f}s)")
+    return all(status == "ok" for _, status, _ in results)
+
+
+# =============================================================================
+# Dry Run Planning
+# =============================================================================
+
+PLAN_FORMAT = "nicolino-import-plan"
+PLAN_VERSION = 1
+
+# What an import does to each path
+PLAN_ACTIONS = ("convert", "copy", "skip", "delete")
+
+# migrate_common benchmark cases that make up the cost of converting a post
+PLAN_CALIBRATION = ("parse_frontmatter (YAML)", "convert_frontmatter_to_nicolino")
+
+# Planned images timed through the thumbnail and downscale jobs, spread
+# over the size range, to estimate media processing
+PLAN_MEDIA_SAMPLES = 3
+
+
+class PlanAction(NamedTuple):
+    """One step of an import. Paths are relative to the source and target."""
+    stage: str
+    action: str
+    source: str
+    target: str
+    size: int
+    mtime_ns: int
+    note: str = ""
+
+
+def plan_file(site: Site, stage: str, action: str, source: Optional[Path], target: Optional[Path],
+              note: str = "") -> PlanAction:
+    # Folders (a gallery in another shard) count no bytes
+    stat = site.source.stat(source) if source is not None and site.source.is_file(source) else None
+    return PlanAction(
+        stage,
+        action,
+        source.relative_to(site.source_dir).as_posix() if source is not None else "",
+        target.relative_to(site.target_dir).as_posix() if target is not None else "",
+        stat.st_size if stat else 0,
+        stat.st_mtime_ns if stat else 0,
+        note,
+    )
+
+
+def plan_tree(site: Site, stage: str, action: str, source: Path, target: Path) -> List[PlanAction]:
+    """One action per file in a folder (or for a single file) and its mirror."""
+    if not site.source.is_dir(source):
+        return [plan_file(site, stage, action, source, target)]
+    return [plan_file(site, stage, action, file, target / file.relative_to(source))
+            for file in site.source.walk(source)]
+
+
+def plan_deletion(site: Site, stage: str, target: Path) -> List[PlanAction]:
+    """Delete actions for a target file or folder the import replaces."""
+    if not target.exists():
+        return []
+    files = [target] if not target.is_dir() else sorted(p for p in target.rglob("*") if p.is_file())
+    return [PlanAction(stage, "delete", "", f.relative_to(site.target_dir).as_posix(), f.stat().st_size, 0)
+            for f in files]
+
+
+def planned_content_target(site: Site, source_file: Path, metadata: dict, section: str,
+                           target_dir: Path) -> Tuple[Path, str]:
+    """Where process_post_file / process_page_file will write a source, and how."""
+    name = source_file.name
+    ext = None
+    note = ""
+    if not name.endswith(".md"):
+        if site.harvest_output and any(
+            site.source.is_file(page) for page in rendered_page_candidates(
+                source_file, metadata, site.source_output, OUTPUT_SECTIONS[section])
+        ):
+            ext, note = ".html", "rendered output"
+        else:
+            cache_dir = site.source_cache / source_file.relative_to(site.source_dir).parent
+            cache_file = cache_dir / f"{source_file.stem}.html"
+            if site.source.is_file(cache_file) and (not site.check_cache_freshness
+                                        or is_cache_fresh(site, source_file, cache_file)):
+                ext, note = ".html", "cached HTML"
+    if ext is None:
+        ext = determine_extension(name)
+        if ext == ".rst" and site.convert_rst:
+            ext, note = RST_TARGETS[site.convert_rst][1], "pandoc"
+    if section == "pages":
+        return target_dir / f"{page_target_stem(source_file, metadata)}{ext}", note
+    return post_folder(site, target_dir, metadata) / f"{source_file.stem}{ext}", note
+
+
+def plan_content(site: Site, section: str, source_dir: Path, target_dir: Path) -> List[PlanAction]:
+    actions = []
+    if not site.source.exists(source_dir):
+        return actions
+    for source_file in sorted(site.source.files(source_dir)):
+        if not in_shard(site, source_file):
+            actions.append(plan_file(site, section, "skip", source_file, None, "other shard"))
+        elif not is_content_source(source_file):
+            actions.append(plan_file(site, section, "skip", source_file, None, "not content"))
+        else:
+            _, metadata = read_source_metadata(site.source, source_file)
+            if not metadata:
+                actions.append(plan_file(site, section, "skip", source_file, None, "no frontmatter"))
+                continue
+            target_file, note = planned_content_target(site, source_file, metadata, section, target_dir)
+            if target_file.exists():
+                note = f"{note}, replaces existing" if note else "replaces existing"
+            actions.append(plan_file(site, section, "convert", source_file, target_file, note))
+    return actions
+
+
+def plan_import(site: Site) -> List[PlanAction]:
+    """Every action an import of the site would take.
+
+    Built from one walk of the source that only stats files and reads the
+    head of posts and pages for their metadata, in the order the stages run.
+    An archive source is listed instead, unpacking only the doit database,
+    into a temporary folder.
+    """
+    if not site.archive_source:
+        return plan_source(site)
+    with tempfile.TemporaryDirectory(prefix="nicolino-plan-") as temp:
+        site.source_doit_db = Path(temp) / ".doit.db"
+        stage_archive(site, site.archive_source, unpack=False)
+        try:
+            return plan_source(site)
+        finally:
+            if hasattr(site.doit_db, "close"):
+                site.doit_db.close()
+            site.doit_db = None
+
+
+def plan_source(site: Site) -> List[PlanAction]:
+    actions = []
+    if not (site.target_dir / "conf.yml").exists() and Path("conf.yml").exists():
+        actions.append(PlanAction("config", "copy", "", "conf.yml", Path("conf.yml").stat().st_size, 0))
+
+    actions += plan_content(site, "posts", site.source_posts, site.target_posts)
+    actions += plan_content(site, "pages", site.source_pages, site.target_pages)
+
+    if site.source.exists(site.source_galleries):
+        for item in site.source.dirs(site.source_galleries):
+            if not in_shard(site, item):
+                actions.append(plan_file(site, "galleries", "skip", item, None, "other shard"))
+                continue
+            target_gallery = site.target_galleries / item.name
+            actions += plan_deletion(site, "galleries", target_gallery)
+            for action in plan_tree(site, "galleries", "copy", item, target_gallery):
+                if action.target.endswith(("/index.txt", "/index.es.txt")):
+                    action = action._replace(action="convert", target=action.target[:-len(".txt")] + ".md")
+                actions.append(action)
+
+    if SOURCE_SHORTCODES.exists():
+        # Shortcode templates live next to the script, not in the source
+        for shortcode_file in sorted(SOURCE_SHORTCODES.glob("*.tmpl")):
+            stat = shortcode_file.stat()
+            actions.append(PlanAction("shortcodes", "copy", shortcode_file.as_posix(),
+                                      f"shortcodes/{shortcode_file.name}", stat.st_size,
+                                      stat.st_mtime_ns, "if referenced"))
+
+    if site.source.exists(site.source_images):
+        for img_file in sorted(site.source.walk(site.source_images)):
+            if in_shard(site, img_file):
+                target_file = site.target_images / img_file.relative_to(site.source_images)
+                actions.append(plan_file(site, "images", "copy", img_file, target_file))
+            else:
+                actions.append(plan_file(site, "images", "skip", img_file, None, "other shard"))
+
+    if site.source.exists(site.source_files):
+        for item in sorted(site.source.files(site.source_files) + site.source.dirs(site.source_files)):
+            if not in_shard(site, item):
+                actions += [a._replace(action="skip", target="", note="other shard")
+                            for a in plan_tree(site, "files", "skip", item, site.target_dir / "assets" / item.name)]
+                continue
+            actions += plan_deletion(site, "files", site.target_dir / "assets" / item.name)
+            actions += plan_tree(site, "files", "copy", item, site.target_dir / "assets" / item.name)
+
+    if site.source.exists(site.source_listings):
+        for action in plan_tree(site, "listings", "copy", site.source_listings, site.target_listings):
+            parts = PurePosixPath(action.source).parts[1:]
+            if any(part.startswith(".") for part in parts):
+                action = action._replace(action="skip", target="", note="hidden")
+            elif not in_shard(site, site.source_dir / action.source):
+                action = action._replace(action="skip", target="", note="other shard")
+            actions.append(action)
+    return actions
+
+
+def plan_collisions(actions: List[PlanAction]) -> dict:
+    """Targets that more than one source would be written to."""
+    sources = {}
+    for action in actions:
+        if action.action in ("convert", "copy") and action.source:
+            sources.setdefault(action.target, []).append(action.source)
+    return {target: names for target, names in sources.items() if len(names) > 1}
+
+
+def calibrate_io(directory: Path) -> Tuple[float, float]:
+    """Copy throughput (bytes per second) and per-file cost (seconds) in directory.
+
+    Dry runs measure in the temporary folder, not next to the target.
+    """
+    with tempfile.TemporaryDirectory(dir=directory) as temp:
+        temp = Path(temp)
+        big = temp / "big"
+        big.write_bytes(os.urandom(1 << 20) * 8)
+        start = time.perf_counter()
+        shutil.copy2(big, temp / "big.copy")
+        throughput = (8 << 20) / max(time.perf_counter() - start, 1e-6)
+        small = temp / "small"
+        small.write_bytes(b"x" * 1024)
+        start = time.perf_counter()
+        for i in range(200):
+            shutil.copy2(small, temp / f"small.{i}")
+        per_file = (time.perf_counter() - start) / 200
+    return throughput, per_file
+
+
+def planned_media(site: Site, actions: List[PlanAction]) -> Tuple[List[PlanAction], List[PlanAction]]:
+    """The planned images that get thumbnails, and those that get downscaled."""
+    images = [a for a in actions if a.action == "copy" and a.stage in ("galleries", "images")
+              and a.target.endswith(IMAGE_FEATURE_SUFFIXES) and ".thumb." not in a.target]
+    thumbnails = [a for a in images if a.stage == "galleries"] if site.pregenerate_thumbnails else []
+    downscaled = images if site.downscale_long_edge else []
+    return thumbnails, downscaled
+
+
+def calibrate_media(site: Site, samples: List[Path]) -> Tuple[float, float]:
+    """Seconds per source byte to make a thumbnail and to downscale an image.
+
+    The jobs run on copies of the samples in the temporary folder, with the
+    import's settings.
+    """
+    size = int(target_config(site).get("image_thumb", 640))
+    thumb_time = shrink_time = 0.0
+    if site.archive_source:
+        site.source.fetch(samples)
+    total = sum(site.source.stat(sample).st_size for sample in samples) or 1
+    with tempfile.TemporaryDirectory() as temp:
+        temp = Path(temp)
+        for number, sample in enumerate(samples):
+            copy = temp / f"{number}{sample.suffix.lower()}"
+            copy.write_bytes(site.source.read_bytes(sample))
+            if site.pregenerate_thumbnails:
+                start = time.perf_counter()
+                make_thumbnail(ThumbJob(copy, temp / f"{number}.thumb{copy.suffix}", size, None, None))
+                thumb_time += time.perf_counter() - start
+            if site.downscale_long_edge:
+                start = time.perf_counter()
+                shrink_image(MediaJob(copy, temp / "originals" / copy.name,
+                                      site.downscale_long_edge, site.reencode_format))
+                shrink_time += time.perf_counter() - start
+    return thumb_time / total, shrink_time / total
+
+
+def estimate_runtime(site: Site, actions: List[PlanAction]) -> dict:
+    """Seconds each kind of work should take, from timings on this machine.
+
+    Conversions cost the migrate_common frontmatter benchmarks plus a copy
+    of their bytes, pandoc calls a timed pandoc start spread over the
+    workers, and copies and deletions the measured copy rate. Thumbnails
+    and downscaling are timed on a few of the planned images and scaled by
+    the bytes of the rest, spread over the workers.
+    """
+    throughput, per_file = calibrate_io(Path(tempfile.gettempdir()))
+    per_conversion = sum(calibrate(PLAN_CALIBRATION, repeat=1).values())
+
+    # One small conversion, start-up included
+    pandoc_call = 0.0
+    pandoc_jobs = [a for a in actions if a.action == "convert" and a.note.startswith("pandoc")]
+    if pandoc_jobs and shutil.which("pandoc"):
+        start = time.perf_counter()
+        subprocess.run(["pandoc", "-f", "rst", "-t", RST_TARGETS[site.convert_rst][0]],
+                       input="Title\n=====\n\nSome *text*.\n", capture_output=True, text=True)
+        pandoc_call = time.perf_counter() - start
+
+    estimate = Counter()
+    for action in actions:
+        if action.action == "convert":
+            estimate["convert"] += per_conversion + per_file + action.size / throughput
+        elif action.action == "copy":
+            estimate["copy"] += per_file + action.size / throughput
+        elif action.action == "delete":
+            estimate["delete"] += per_file
+    estimate["pandoc"] = len(pandoc_jobs) * pandoc_call / JOBS
+
+    thumbnails, downscaled = planned_media(site, actions)
+    if (thumbnails or downscaled) and Image is not None:
+        images = sorted(thumbnails + downscaled, key=lambda action: action.size)
+        step = max(1, len(images) // PLAN_MEDIA_SAMPLES)
+        samples = list(dict.fromkeys(site.source_dir / action.source for action in images[step // 2::step]))
+        per_thumb_byte, per_shrink_byte = calibrate_media(site, samples[:PLAN_MEDIA_SAMPLES])
+        estimate["thumbnails"] = sum(a.size for a in thumbnails) * per_thumb_byte / JOBS
+        estimate["downscale"] = sum(a.size for a in downscaled) * per_shrink_byte / JOBS
+    return estimate
+
+
+def format_size(size: int) -> str:
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GiB"
+
+
+def report_plan(actions: List[PlanAction], estimate: Optional[dict] = None):
+    """Print counts and bytes per stage and action, collisions and the estimate."""
+    print("\n" + "="*60)
+    print("IMPORT PLAN (dry run, nothing written)")
+    print("="*60)
+    stages = list(dict.fromkeys(action.stage for action in actions))
+    counts = Counter((action.stage, action.action) for action in actions)
+    sizes = Counter()
+    for action in actions:
+        sizes[action.stage, action.action] += action.size
+
+    print(f"\n  {'Stage':12}" + "".join(f"{name:>18}" for name in PLAN_ACTIONS))
+    for stage in stages:
+        cells = []
+        for name in PLAN_ACTIONS:
+            count = counts[stage, name]
+            cells.append(f"{count:>8} {format_size(sizes[stage, name]):>9}" if count else f"{'-':>18}")
+        print(f"  {stage:12}" + "".join(cells))
+
+    notes = Counter((action.stage, action.action, action.note) for action in actions if action.note)
+    if notes:
+        print("\n  Notes:")
+        for (stage, name, note), count in sorted(notes.items()):
+            print(f"    {stage} {name}: {count} {note}")
+
+    collisions = plan_collisions(actions)
+    if collisions:
+        print(f"\n  Collisions (targets several sources would write): {len(collisions)}")
+        for target, names in sorted(collisions.items()):
+            print(f"    {target} <- {', '.join(names)}")
+
+    if estimate is not None:
+        total = sum(estimate.values())
+        print(f"\n  Estimated runtime: ~{total:.2f}s ("
+              + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in estimate.items() if seconds) + ")")
+        print("  Not included: harvesting output/, indexes and listing highlighting")
+
+
+def config_to_json(config: ImportConfig) -> dict:
+    return {
+        name: str(value) if isinstance(value, Path) else list(value) if isinstance(value, tuple) else value
+        for name, value in config._asdict().items()
+    }
+
+
+def config_from_json(data: dict) -> ImportConfig:
+    fields = dict(data)
+    for name in CONFIG_PATH_FIELDS:
+        if isinstance(fields.get(name), str):
+            fields[name] = Path(fields[name])
+    if fields.get("shard") is not None:
+        fields["shard"] = tuple(fields["shard"])
+    return ImportConfig(**fields)
+
+
+def dry_run(config: ImportConfig, plan_path: Optional[Path] = None) -> bool:
+    """Plan an import without writing to the target, optionally saving the plan.
+
+    Returns False if the source is missing or the plan has collisions.
+    """
+    with Site(config) as site:
+        source = site.archive_source or site.source_dir
+        if not source.exists():
+            print(f"\nError: Source directory not found: {source}")
+            return False
+        print(f"\nSource: {source.absolute()}")
+        print(f"Target: {site.target_dir.absolute()}")
+        actions = plan_import(site)
+        report_plan(actions, estimate_runtime(site, actions))
+
+    if plan_path is not None:
+        plan = {
+            "format": PLAN_FORMAT,
+            "version": PLAN_VERSION,
+            "config": config_to_json(config),
+            "actions": [action._asdict() for action in actions],
+        }
+        plan_path.write_text(json.dumps(plan, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\n  Plan: {len(actions)} actions -> {plan_path}")
+        print(f"  Run it with: import_site.py --run-plan {plan_path}")
+    return not plan_collisions(actions)
+
+
+def run_plan(plan_path: Path) -> bool:
+    """Run a saved plan, if the source and target still give the same one."""
+    plan = json.loads(plan_path.read_text(encoding="utf-8"))
+    if plan.get("format") != PLAN_FORMAT or plan.get("version") != PLAN_VERSION:
+        raise RuntimeError(f"{plan_path}: not a version {PLAN_VERSION} import plan")
+    config = config_from_json(plan["config"])
+    with Site(config) as site:
+        actions = [action._asdict() for action in plan_import(site)]
+    if actions != plan["actions"]:
+        changed = {json.dumps(a, sort_keys=True) for a in actions} ^ {
+            json.dumps(a, sort_keys=True) for a in plan["actions"]}
+        print(f"Error: the source or target changed since the plan was made "
+              f"({len(changed)} differing actions); plan again")
+        return False
+    return run_import(config)
+
+
+# =============================================================================
+# Main Entry Point
+# =============================================================================
+
+
+def parse_args() -> Tuple[ImportConfig, argparse.Namespace]:
+    """Parse command line options into an import configuration."""
+    global JOBS
+
+    defaults = ImportConfig()
+    parser = argparse.ArgumentParser(description="Import a Nikola site into Nicolino")
+    parser.add_argument(
+        "--source",
+        type=Path,
+        default=defaults.source,
+        help="Nikola site to import, a folder or a .tar, .tar.gz, .tar.zst or .zip "
+        "archive of one (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--target",
+        type=Path,
+        default=defaults.target,
+        help="Nicolino site to create (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--shard",
+        metavar="I/N",
+        help="Import only shard I of N (by a stable hash of each post, page, gallery and "
+        "asset) into TARGET.shard-I-of-N, with a manifest for --merge-shards",
+    )
+    parser.add_argument(
+        "--output-archive",
+        type=Path,
+        metavar="PATH",
+        help="Write the imported site into a reproducible .tar, .tar.gz or .tar.zst "
+        "instead of a folder; \"-\" streams a plain tar to stdout",
+    )
+    parser.add_argument(
+        "--merge-shards",
+        action="store_true",
+        help="Combine the finished TARGET.shard-*-of-N roots into TARGET and exit",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print what the import would convert, copy, skip and delete, per stage, "
+        "with target collisions and a runtime estimate, and write nothing",
+    )
+    parser.add_argument(
+        "--save-plan",
+        type=Path,
+        metavar="FILE",
+        help="With --dry-run, also save the plan as JSON for --run-plan",
+    )
+    parser.add_argument(
+        "--run-plan",
+        type=Path,
+        metavar="FILE",
+        help="Run the import a saved plan describes (with the options it was made with), "
+        "if planning again still gives the same actions",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the import, keep re-importing the files that change in the source "
+        "(inotify with the inotify_simple module, polling otherwise) until Ctrl+C",
+    )
+    parser.add_argument(
+        "--batch",
+        type=Path,
+        metavar="FILE",
+        help="Import every site listed in this YAML file in one process; the other "
+        "options are the defaults for each site",
+    )
+    parser.add_argument(
+        "--convert-rst",
+        choices=sorted(RST_TARGETS),
+        default=defaults.convert_rst,
+        help="Convert reStructuredText bodies without cached HTML to this format "
+        "(default: keep them as .rst for the pandoc feature)",
+    )
+    parser.add_argument(
+        "--trust-cache",
+        action="store_true",
+        help="Use cache/ entries without checking that they are newer than their sources",
+    )
+    parser.add_argument(
+        "--harvest-output",
+        action="store_true",
+        help="Take post and page bodies from Nikola's rendered output/ pages "
+        "when available, before trying cache/ or pandoc",
+    )
+    parser.add_argument(
+        "--no-metadata-index",
+        action="store_true",
+        help="Don't write the content metadata index",
+    )
+    parser.add_argument(
+        "--search-index",
+        nargs="?",
+        type=Path,
+        const=True,
+        help="Write a search.json-compatible index of the HTML bodies seen during "
+        "import (default path: TARGET/search-index.json)",
+    )
+    parser.add_argument(
+        "--no-gallery-manifests",
+        action="store_true",
+        help="Don't write a manifest.json of image dimensions and EXIF data into each gallery",
+    )
+    parser.add_argument(
+        "--thumbnails",
+        action="store_true",
+        help="Pre-generate gallery thumbnails into the output directory (needs Pillow); "
+             "nicolino build keeps them while their sources and image_thumb are unchanged",
+    )
+    parser.add_argument(
+        "--downscale",
+        type=int,
+        metavar="PIXELS",
+        help="Downscale gallery and images/ originals whose long edge is larger "
+        "than this, keeping the originals in TARGET/originals (needs Pillow)",
+    )
+    parser.add_argument(
+        "--reencode",
+        choices=sorted(REENCODE_SUFFIXES),
+        help="Also re-encode downscaled gallery images to this format",
+    )
+    parser.add_argument(
+        "--prerender-listings",
+        action="store_true",
+        help="Pre-render highlighted listings into TARGET/.listings-cache for the "
+        "build to reuse (needs the tartrazine CLI)",
+    )
+    parser.add_argument(
+        "--expand-shortcodes",
+        action="store_true",
+        help="Replace calls to shortcodes whose templates only use their arguments "
+        "with the HTML they render to",
+    )
+    parser.add_argument(
+        "--no-rewrite-links",
+        action="store_true",
+        help="Leave links to legacy Nikola URLs (/weblog/posts/..., /stories/...) in bodies as they are",
+    )
+    parser.add_argument(
+        "--no-redirects",
+        action="store_true",
+        help="Don't write the legacy URL redirect tables (nginx, Apache, JSON)",
+    )
+    parser.add_argument(
+        "--post-layout",
+        choices=POST_LAYOUTS,
+        help="Put posts in content/posts/YYYY/ (year) or YYYY/MM/ (month) by date instead "
+        "of one flat folder; old post URLs are kept in the link map and redirect tables",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=JOBS,
+        help=f"Number of parallel workers (default: {JOBS})",
+    )
+    args = parser.parse_args()
+    if args.reencode and not args.downscale:
+        parser.error("--reencode needs --downscale")
+    shard = None
+    if args.shard:
+        match = re.fullmatch(r"(\d+)/(\d+)", args.shard)
+        if not match or not 1 <= int(match.group(1)) <= int(match.group(2)):
+            parser.error("--shard takes I/N with 1 <= I <= N, e.g. 2/4")
+        shard = (int(match.group(1)), int(match.group(2)))
+        if args.batch:
+            parser.error("--shard can't be used with --batch")
+        if args.output_archive:
+            parser.error("--shard can't be used with --output-archive")
+    if args.watch and (args.batch or args.merge_shards or args.shard or args.output_archive):
+        parser.error("--watch imports into a plain target folder; it can't be used with "
+                     "--batch, --merge-shards, --shard or --output-archive")
+    if args.save_plan and not args.dry_run:
+        parser.error("--save-plan needs --dry-run")
+    if (args.dry_run or args.run_plan) and (args.batch or args.merge_shards or args.watch):
+        parser.error("--dry-run and --run-plan plan one site; they can't be used with "
+                     "--batch, --merge-shards or --watch")
+    if args.dry_run and args.run_plan:
+        parser.error("--dry-run and --run-plan can't be used together")
+    if args.batch and args.output_archive:
+        parser.error("--output-archive can't be used with --batch; set output_archive per site")
+
+    JOBS = max(1, args.jobs)
+    config = ImportConfig(
+        source=args.source,
+        target=args.target,
+        shard=shard,
+        output_archive=args.output_archive,
+        convert_rst=args.convert_rst,
+        check_cache_freshness=not args.trust_cache,
+        harvest_output=args.harvest_output,
+        metadata_index=not args.no_metadata_index,
+        search_index=args.search_index,
+        gallery_manifests=not args.no_gallery_manifests,
+        thumbnails=args.thumbnails,
+        downscale=args.downscale,
+        reencode=args.reencode,
+        prerender_listings=args.prerender_listings,
+        expand_shortcodes=args.expand_shortcodes,
+        rewrite_links=not args.no_rewrite_links,
+        redirects=not args.no_redirects,
+        post_layout=args.post_layout,
+    )
+    return config, args
+
+
+def main():
+    """Run the site migration, or a batch of them."""
+    config, args = parse_args()
+    try:
+        if args.merge_shards:
+            ok = merge_shards(config.target)
+        elif args.dry_run:
+            ok = dry_run(config, args.save_plan)
+        elif args.run_plan:
+            ok = run_plan(args.run_plan)
+        elif args.batch:
+            try:
+                configs = load_batch(args.batch, config)
+            except (OSError, ValueError, yaml.YAMLError) as e:
+                print(f"Error: {e}", file=sys.stderr)
+                sys.exit(1)
+            ok = run_batch(configs)
+        elif str(config.output_archive) == "-":
+            # The archive owns stdout; progress goes to stderr
+            with contextlib.redirect_stdout(sys.stderr):
+                ok = run_import(config)
+        else:
+            with Site(config) as site:
+                ok = migrate_site(site)
+                if ok and args.watch:
+                    watch_site(site)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        ok = False
+    finally:
+        close_pool()
+    if not ok:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
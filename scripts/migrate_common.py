@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Helpers shared by the Nikola migration scripts.
+
+Usage as a library:
+    from migrate_common import parse_frontmatter, convert_frontmatter_to_nicolino
+
+Usage as a script, to time each helper on typical inputs:
+    python3 scripts/migrate_common.py
+"""
+
+import re
+import string
+import timeit
+import unicodedata
+from datetime import date, datetime
+from typing import Tuple
+
+import yaml
+
+try:
+    from unidecode import unidecode
+except ImportError:
+    unidecode = None
+
+# Prefer the LibYAML loader and dumper; fall back to the pure Python ones
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+# =============================================================================
+# Frontmatter
+# =============================================================================
+
+# YAML alias anchors ("&name ") and the like, for the line-by-line fallback
+YAML_ANCHOR_RE = re.compile(r"^&\S+\s+")
+
+
+def parse_yaml_lines(frontmatter_text: str) -> dict:
+    """Line-by-line "key: value" parsing, for YAML that does not load."""
+    metadata = {}
+    for line in frontmatter_text.strip().split("\n"):
+        line = line.strip()
+        if ":" in line and not line.startswith("#"):
+            key, value = line.split(":", 1)
+            value = YAML_ANCHOR_RE.sub("", value.strip())
+            if value.startswith("*"):
+                continue
+            metadata[key.strip()] = value.strip().strip("'").strip('"')
+    return metadata
+
+
+def strip_leftover_metadata(body: str) -> str:
+    """Drop old Nikola metadata lines left in a body after YAML frontmatter.
+
+    Some files have both YAML and old RST metadata. Metadata-like lines
+    (".. key: value", a bare "..", or the "-->" closing an HTML comment) and
+    anything up to the next content line are removed.
+    """
+    if "-->" not in body and ".. " not in body:
+        return body
+
+    body_lines = []
+    skip_remaining_metadata = False
+    for line in body.split("\n"):
+        stripped = line.strip()
+        if stripped == "-->" or (stripped.startswith(".. ") and (":" in stripped or len(stripped) <= 3)):
+            skip_remaining_metadata = True
+            continue
+        # Once we see a non-metadata line, include everything after
+        if skip_remaining_metadata:
+            if stripped and not stripped.startswith(".. ") and stripped != "-->":
+                skip_remaining_metadata = False
+                body_lines.append(line)
+            continue
+        body_lines.append(line)
+    return "\n".join(body_lines).lstrip()
+
+
+def parse_nikola_metadata(content: str) -> Tuple[dict, str]:
+    """Parse Nikola ".. key: value" metadata, bare or in an HTML comment."""
+    lines = content.split("\n")
+    metadata_started = False
+    metadata_lines = []
+    body_start = 0
+
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if stripped == "<!--":
+            metadata_started = True
+            continue
+        if metadata_started:
+            if stripped.startswith(".. "):
+                if ":" in stripped:
+                    # A metadata line like ".. title: Something"
+                    metadata_lines.append(stripped)
+                    continue
+                # Something like ".. code-block::": the body starts here
+                body_start = i
+                break
+            if stripped == "-->":
+                body_start = i + 1
+                break
+            body_start = i
+            break
+        # Metadata without an HTML comment
+        elif stripped.startswith(".. ") and ":" in stripped:
+            metadata_started = True
+            metadata_lines.append(stripped)
+            continue
+        elif stripped:
+            body_start = i
+            break
+
+    metadata = {}
+    for line in metadata_lines:
+        key, value = line[3:].split(":", 1)
+        metadata[key.strip()] = value.strip().strip("'").strip('"')
+
+    return metadata, "\n".join(lines[body_start:])
+
+
+def metadata_value(value):
+    """Normalize a metadata value: strings, or lists of strings for lists."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, list):
+        return [metadata_value(item) for item in value]
+    return str(value)
+
+
+def parse_frontmatter(content: str) -> Tuple[dict, str]:
+    """Parse YAML or Nikola RST-style frontmatter from content.
+
+    Returns (metadata, body). Values are strings, except YAML lists (tags
+    written as lists, for example), which stay lists of strings.
+    """
+    metadata = {}
+    body = content
+
+    if content.startswith("---"):
+        parts = content.split("---", 2)
+        if len(parts) >= 3:
+            frontmatter_text = parts[1]
+            try:
+                metadata = yaml.load(frontmatter_text, Loader=Loader) or {}
+            except (yaml.YAMLError, ValueError, TypeError):
+                metadata = None
+            if not isinstance(metadata, dict):
+                metadata = parse_yaml_lines(frontmatter_text)
+            body = strip_leftover_metadata(parts[2].lstrip())
+    else:
+        metadata, body = parse_nikola_metadata(content)
+
+    return {str(key): metadata_value(value) for key, value in metadata.items()}, body
+
+
+# =============================================================================
+# Dates, slugs and extensions
+# =============================================================================
+
+# Year, month and day at the start of "2015-05-13 02:31:11 UTC", "2012/03/04 17:40",
+# "12/03/04 17:40", ...
+DATE_PREFIX_RE = re.compile(r"(\d{4}|\d{2})[-/](\d{1,2})[-/](\d{1,2})(?!\d)")
+
+# Formats for dates DATE_PREFIX_RE does not match
+DATE_FORMATS = [
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+    "%y/%m/%d %H:%M:%S",
+    "%y/%m/%d %H:%M",
+    "%Y/%m/%d",
+    "%Y-%m-%d",
+]
+
+
+def convert_nikola_date_to_nicolino(date_str: str) -> str:
+    """Convert a Nikola date to a Nicolino one (YYYY-MM-DD).
+
+    Nikola formats:
+    - 2012/03/04 17:40
+    - 2015-05-13 02:31:11 UTC
+    - 12/03/04 17:40
+    Unparseable dates become "0000-00-00".
+    """
+    if not date_str:
+        return "0000-00-00"
+
+    match = DATE_PREFIX_RE.match(date_str.strip())
+    if match:
+        year, month, day = match.groups()
+        year = int(year)
+        if year < 100:
+            # Same pivot as strptime's %y
+            year += 1900 if year >= 69 else 2000
+        try:
+            return date(year, int(month), int(day)).isoformat()
+        except ValueError:
+            return "0000-00-00"
+
+    date_str_clean = date_str.replace("UTC", "").replace("GMT", "").replace("T", " ").strip()
+    # Remove microseconds if present
+    date_str_clean = date_str_clean.split(".")[0]
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str_clean, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return "0000-00-00"
+
+
+class _SlugTable(dict):
+    """Translation table that drops every character it does not map."""
+
+    def __missing__(self, key):
+        return None
+
+
+# a-z, 0-9 and "-" are kept, spaces and slashes become "-"
+SLUG_TABLE = _SlugTable({ord(c): c for c in string.ascii_lowercase + string.digits + "-"})
+SLUG_TABLE.update({ord(" "): "-", ord("/"): "-"})
+
+HYPHENS_RE = re.compile(r"-{2,}")
+
+
+def sanitize_slug(slug: str) -> str:
+    """Convert a slug to a safe filename: lowercase a-z, 0-9 and single hyphens."""
+    if not slug:
+        return "untitled"
+    # Remove leading BB if present (from BB1001)
+    if slug.startswith("BB"):
+        slug = slug[2:]
+    slug = slug.lower().translate(SLUG_TABLE)
+    if "--" in slug:
+        slug = HYPHENS_RE.sub("-", slug)
+    return slug.strip("-") or "untitled"
+
+
+# Nikola's slugify: drop what isn't a word character, "+", "-" or space, then
+# turn runs of spaces and hyphens into one hyphen
+NIKOLA_SLUG_STRIP_RE = re.compile(r"[^+\w\s-]")
+NIKOLA_SLUG_HYPHENATE_RE = re.compile(r"[-\s]+")
+
+
+def nikola_slugify(value: str) -> str:
+    """Slugify like Nikola does for URLs (nikola.utils.slugify, USE_SLUGIFY on).
+
+    Nikola transliterates with unidecode; without it installed, accents are
+    stripped and other non-ASCII characters dropped.
+    """
+    if unidecode is not None:
+        value = unidecode(value)
+    else:
+        value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode("ascii")
+    value = NIKOLA_SLUG_STRIP_RE.sub("", value).strip().lower()
+    return NIKOLA_SLUG_HYPHENATE_RE.sub("-", value)
+
+
+def determine_extension(filename: str) -> str:
+    """Nicolino extension for a Nikola source file; .txt files are reStructuredText."""
+    if filename.endswith(".md"):
+        return ".md"
+    if filename.endswith(".html"):
+        return ".html"
+    return ".rst"
+
+
+# =============================================================================
+# Nicolino frontmatter
+# =============================================================================
+
+
+def split_tags(value) -> list:
+    """Tags from a list or a comma-separated string."""
+    if not value:
+        return []
+    if isinstance(value, list):
+        return [tag for tag in value if tag]
+    return [tag.strip() for tag in str(value).split(",") if tag.strip()]
+
+
+def nicolino_frontmatter(metadata: dict, strip_emphasis: bool = False) -> dict:
+    """Build the Nicolino frontmatter fields from Nikola metadata.
+
+    Tags and category are merged (some posts have tags in category),
+    keeping the first occurrence of each tag. With strip_emphasis, markdown
+    bold and italic asterisks are removed from tags, as migrate_posts.py
+    always did.
+    """
+    frontmatter_dict = {
+        "title": metadata.get("title", "Untitled"),
+        "date": convert_nikola_date_to_nicolino(metadata.get("date", "")),
+    }
+    tags = split_tags(metadata.get("tags", "")) + split_tags(metadata.get("category", ""))
+    if strip_emphasis:
+        tags = [tag for tag in (str(tag).replace("*", "").strip() for tag in tags) if tag]
+    if tags:
+        frontmatter_dict["tags"] = list(dict.fromkeys(tags))
+    return frontmatter_dict
+
+
+def convert_frontmatter_to_nicolino(metadata: dict, content: str, strip_emphasis: bool = False) -> str:
+    """Convert Nikola frontmatter to Nicolino format."""
+    yaml_frontmatter = yaml.dump(
+        nicolino_frontmatter(metadata, strip_emphasis), Dumper=Dumper, default_flow_style=False, sort_keys=False
+    ).rstrip("\n")
+    return f"---\n{yaml_frontmatter}\n---\n\n{content}"
+
+
+# =============================================================================
+# Micro-benchmarks
+# =============================================================================
+
+BENCH_YAML = """---
+title: "A post: with a colon"
+date: 2015-05-13 02:31:11 UTC
+tags: [python, nikola, "static sites"]
+category: blog
+slug: a-post-with-a-colon
+---
+
+Some text.
+"""
+
+BENCH_NIKOLA = """<!--
+.. title: An old post
+.. slug: an-old-post
+.. date: 2012/03/04 17:40
+.. tags: python, nikola
+.. category:
+.. link:
+.. description:
+.. type: text
+-->
+
+Some text.
+"""
+
+BENCH_CASES = [
+    ("parse_frontmatter (YAML)", lambda: parse_frontmatter(BENCH_YAML)),
+    ("parse_frontmatter (Nikola)", lambda: parse_frontmatter(BENCH_NIKOLA)),
+    ("convert_nikola_date_to_nicolino", lambda: convert_nikola_date_to_nicolino("2015-05-13 02:31:11 UTC")),
+    ("convert_nikola_date_to_nicolino (2-digit)", lambda: convert_nikola_date_to_nicolino("12/03/04 17:40")),
+    ("sanitize_slug", lambda: sanitize_slug("BB1001 Some Title / With  Odd_Chars!")),
+    ("nikola_slugify", lambda: nikola_slugify("About Me: Café & Co")),
+    ("determine_extension", lambda: determine_extension("1001.es.txt")),
+    ("convert_frontmatter_to_nicolino", lambda: convert_frontmatter_to_nicolino(
+        {"title": "A post", "date": "2012/03/04 17:40", "tags": "a, b", "category": "c"}, "Body\n")),
+]
+
+
+def calibrate(names=None, repeat: int = 5) -> dict:
+    """Seconds per call of each benchmark case (or the named ones), best of repeat."""
+    timings = {}
+    for name, func in BENCH_CASES:
+        if names is not None and name not in names:
+            continue
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        timings[name] = min(timer.repeat(repeat=repeat, number=number)) / number
+    return timings
+
+
+def main():
+    print(f"YAML: {Loader.__name__} / {Dumper.__name__}")
+    for name, best in calibrate().items():
+        print(f"  {name:45} {best * 1e6:9.2f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,118 +5,21 @@ Migrate Nikola pages to Nicolino format.
 Pages in Nikola go to stories/, in Nicolino they go in content/ root.
 """
 
-import os
-import sys
-from datetime import datetime
 from pathlib import Path
 
+from migrate_common import (
+    convert_frontmatter_to_nicolino,
+    determine_extension,
+    parse_frontmatter,
+    sanitize_slug,
+)
+
 # Paths
 SOURCE_DIR = Path("mysite/pages")
 TARGET_DIR = Path("myblog/content")
 TARGET_ES_DIR = Path("myblog/content/es")
 
 
-def parse_frontmatter(content: str):
-    """Parse YAML frontmatter from content."""
-    if not content.startswith("---"):
-        return {}, content
-
-    parts = content.split("---", 2)
-    if len(parts) < 3:
-        return {}, content
-
-    frontmatter_text = parts[1]
-    body = parts[2].lstrip()
-
-    metadata = {}
-    for line in frontmatter_text.strip().split("\n"):
-        line = line.strip()
-        if ":" in line and not line.startswith("#"):
-            key, value = line.split(":", 1)
-            key = key.strip()
-            value = value.strip().strip("'").strip('"')
-            metadata[key] = value
-
-    return metadata, body
-
-
-def convert_nikola_date_to_nicolino(date_str: str) -> str:
-    """Convert Nikola date format to Nicolino filename date.
-
-    Nikola formats:
-    - 2012/03/04 17:40
-    - 2015-05-13 02:31:11 UTC
-    Nicolino: 2012-03-04
-    """
-    if not date_str:
-        return "0000-00-00"
-
-    # Clean up the date string - remove timezone info
-    date_str_clean = date_str.replace("UTC", "").replace("GMT", "").strip()
-
-    # Try various date formats
-    formats_to_try = [
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M",
-        "%Y/%m/%d %H:%M:%S",
-        "%Y/%m/%d %H:%M",
-        "%Y/%m/%d",
-        "%Y-%m-%d",
-    ]
-
-    for fmt in formats_to_try:
-        try:
-            dt = datetime.strptime(date_str_clean, fmt)
-            return dt.strftime("%Y-%m-%d")
-        except ValueError:
-            continue
-
-    return "0000-00-00"
-
-
-def sanitize_slug(slug: str) -> str:
-    """Convert slug to a safe filename."""
-    if not slug:
-        return "untitled"
-    slug = slug.lower().replace(' ', '-')
-    slug = slug.replace('/', '-')
-    return slug or "untitled"
-
-
-def determine_extension(filename: str) -> str:
-    """Determine the file extension based on filename."""
-    if filename.endswith(".md"):
-        return ".md"
-    if filename.endswith(".html"):
-        return ".html"
-    if filename.endswith(".rst"):
-        return ".rst"
-    return ".rst"
-
-
-def convert_frontmatter_to_nicolino(metadata: dict, content: str) -> str:
-    """Convert Nikola frontmatter to Nicolino format."""
-    title = metadata.get("title", "Untitled")
-    date_str = metadata.get("date", "")
-    tags = metadata.get("tags", "")
-
-    nicolino_date = convert_nikola_date_to_nicolino(date_str)
-
-    frontmatter_lines = [
-        "---",
-        f'title: "{title}"',
-        f"date: {nicolino_date}",
-    ]
-
-    if tags:
-        frontmatter_lines.append(f"tags: [{tags}]")
-
-    frontmatter_lines.append("---")
-    frontmatter_lines.append("")
-
-    return "\n".join(frontmatter_lines) + content
-
-
 def process_file(source_file: Path, target_dir: Path, is_translation: bool = False):
     """Process a single page file and convert it to Nicolino format."""
     if "wpcomment" in source_file.name or ".meta." in source_file.name:
@@ -16,12 +16,10 @@ Usage:
     python3 scripts/migrate_posts.py
 """
 
-import os
-import re
-import sys
-from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional
+
+from migrate_common import convert_frontmatter_to_nicolino, determine_extension, parse_frontmatter
 
 # Paths
 SOURCE_DIR = Path("mysite/posts")
@@ -29,134 +27,6 @@ TARGET_DIR = Path("myblog/content/posts")
 TARGET_ES_DIR = Path("myblog/content/es/posts")
 
 
-def parse_frontmatter(content: str) -> Tuple[dict, str]:
-    """Parse YAML frontmatter from content.
-
-    Returns (metadata_dict, content_without_frontmatter)
-    """
-    if not content.startswith("---"):
-        return {}, content
-
-    parts = content.split("---", 2)
-    if len(parts) < 3:
-        return {}, content
-
-    frontmatter_text = parts[1]
-    body = parts[2].lstrip()
-
-    metadata = {}
-    for line in frontmatter_text.strip().split("\n"):
-        line = line.strip()
-        if ":" in line and not line.startswith("#"):
-            key, value = line.split(":", 1)
-            key = key.strip()
-            value = value.strip().strip("'").strip('"')
-            metadata[key] = value
-
-    return metadata, body
-
-
-def convert_nikola_date_to_nicolino(date_str: str) -> str:
-    """Convert Nikola date format to Nicolino filename date.
-
-    Nikola formats:
-    - 2012/03/04 17:40
-    - 2015-05-13 02:31:11 UTC
-    Nicolino: 2012-03-04
-    """
-    if not date_str:
-        return "0000-00-00"
-
-    # Clean up the date string - remove timezone info and T separator
-    date_str_clean = date_str.replace("UTC", "").replace("GMT", "").replace("T", " ").strip()
-
-    # Try various date formats
-    formats_to_try = [
-        "%Y-%m-%d %H:%M:%S%z",
-        "%Y-%m-%d %H:%M:%S",
-        "%Y-%m-%d %H:%M",
-        "%Y/%m/%d %H:%M:%S",
-        "%Y/%m/%d %H:%M",
-        "%y/%m/%d %H:%M:%S",
-        "%y/%m/%d %H:%M",
-        "%Y/%m/%d",
-        "%Y-%m-%d",
-    ]
-
-    for fmt in formats_to_try:
-        try:
-            dt = datetime.strptime(date_str_clean, fmt)
-            return dt.strftime("%Y-%m-%d")
-        except ValueError:
-            continue
-
-    return "0000-00-00"
-
-
-def sanitize_slug(slug: str) -> str:
-    """Convert slug to a safe filename."""
-    if not slug:
-        return "untitled"
-    # Remove leading BB if present (from BB1001)
-    slug = re.sub(r'^BB', '', slug)
-    # Convert to lowercase, replace spaces with hyphens
-    slug = slug.lower().replace(' ', '-')
-    # Remove non-alphanumeric chars except hyphen
-    slug = re.sub(r'[^a-z0-9-]', '', slug)
-    # Remove multiple consecutive hyphens
-    slug = re.sub(r'-+', '-', slug)
-    # Remove leading/trailing hyphens
-    slug = slug.strip('-')
-    return slug or "untitled"
-
-
-def determine_extension(filename: str) -> str:
-    """Determine the file extension based on filename."""
-    if filename.endswith(".md"):
-        return ".md"
-    if filename.endswith(".html"):
-        return ".html"
-    if filename.endswith(".rst"):
-        return ".rst"
-    # Default .txt files are restructuredtext
-    return ".rst"
-
-
-def convert_frontmatter_to_nicolino(metadata: dict, content: str) -> str:
-    """Convert Nikola frontmatter to Nicolino format.
-
-    Nicolino uses:
-    - title: required
-    - date: required, format YYYY-MM-DD
-    - tags: optional, comma-separated
-    - draft: optional
-    """
-    title = metadata.get("title", "Untitled")
-    date_str = metadata.get("date", "")
-    tags = metadata.get("tags", "")
-
-    # Convert date
-    nicolino_date = convert_nikola_date_to_nicolino(date_str)
-
-    # Build Nicolino frontmatter
-    frontmatter_lines = [
-        "---",
-        f'title: "{title}"',
-        f"date: {nicolino_date}",
-    ]
-
-    if tags:
-        # Tags are comma-separated in Nikola - keep as quoted string to handle special chars
-        # Remove markdown bold (***) syntax from tags if present
-        tags_clean = tags.replace("**", "").replace("*", "")
-        frontmatter_lines.append(f'tags: [{tags_clean}]')
-
-    frontmatter_lines.append("---")
-    frontmatter_lines.append("")
-
-    return "\n".join(frontmatter_lines) + content
-
-
 def process_file(source_file: Path, target_dir: Path, is_translation: bool = False) -> Optional[Path]:
     """Process a single post file and convert it to Nicolino format."""
     # Skip comment files and metadata files
@@ -181,8 +51,8 @@ def process_file(source_file: Path, target_dir: Path, is_translation: bool = Fal
 
     target_file = target_dir / filename
 
-    # Convert frontmatter
-    new_content = convert_frontmatter_to_nicolino(metadata, body)
+    # Convert frontmatter, removing markdown bold (**) syntax from tags
+    new_content = convert_frontmatter_to_nicolino(metadata, body, strip_emphasis=True)
 
     # Write to target
     target_file.write_text(new_content, encoding="utf-8")
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Validate and repair YAML frontmatter in migrated posts.
+
+Usage:
+    python3 scripts/repair_yaml.py
+    python3 scripts/repair_yaml.py --dry-run
+    python3 scripts/repair_yaml.py myblog/content/posts myblog/content/pages
+"""
+
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional, Tuple
+
+import yaml
+
+import fix_yaml
+import fix_yaml2
+from catalog import Catalog
+
+# Paths checked by default (the same ones fix_yaml.py used)
+DEFAULT_DIRS = [Path("myblog/content/posts"), Path("myblog/content/es/posts")]
+
+SUFFIXES = (".md", ".rst")
+
+# Prefer the C loader; fall back to the pure Python one
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# A simple "key: value" line, not a list item or a nested mapping
+SCALAR_LINE_RE = re.compile(r"^([A-Za-z_][\w-]*):[ \t]+(\S.*?)\s*$")
+
+
+def split_frontmatter(content: str) -> Optional[Tuple[str, str]]:
+    """Split content into (frontmatter, body) the way Nicolino does."""
+    if not content.startswith("---\n"):
+        return None
+    parts = content.split("---\n", 2)
+    if len(parts) < 3:
+        return None
+    return parts[1], parts[2]
+
+
+def check_frontmatter(frontmatter: str) -> Optional[str]:
+    """Return what is wrong with a frontmatter block, or None if it is fine."""
+    try:
+        data = yaml.load(frontmatter, Loader=Loader)
+    except yaml.YAMLError as e:
+        problem = getattr(e, "problem", None) or str(e).splitlines()[0]
+        mark = getattr(e, "problem_mark", None)
+        return f"{problem} (line {mark.line + 1})" if mark else problem
+    if not isinstance(data, dict):
+        return "frontmatter is not a mapping"
+    if not data.get("title"):
+        return "no title"
+    return None
+
+
+def unquote(value: str) -> str:
+    """Drop one pair of outer quotes, if the value has them."""
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+def quote(value: str) -> str:
+    """Emit a single-line string as a YAML scalar, quoted only if needed."""
+    return yaml.safe_dump(value, width=float("inf")).split("\n", 1)[0]
+
+
+def line_is_valid(line: str) -> bool:
+    """Whether a "key: value" line parses on its own to a non-empty value."""
+    try:
+        data = yaml.load(line, Loader=Loader)
+    except yaml.YAMLError:
+        return False
+    return isinstance(data, dict) and all(v is not None for v in data.values())
+
+
+def requote_lines(frontmatter: str, keys=None) -> str:
+    """Re-emit the values of simple "key: value" lines with proper quoting.
+
+    With keys, only those lines are re-emitted; otherwise every line that
+    doesn't parse on its own (or parses to nothing) is.
+    """
+    lines = []
+    for line in frontmatter.split("\n"):
+        match = SCALAR_LINE_RE.match(line)
+        if match and (match.group(1) in keys if keys else not line_is_valid(line)):
+            key, value = match.groups()
+            # Leave flow collections and block scalar markers alone
+            if not value.startswith(("[", "{", "|", ">")):
+                line = f"{key}: {quote(unquote(value))}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+# Repair heuristics, in the order they are tried. Each takes a frontmatter
+# block and returns the repaired block.
+HEURISTICS = [
+    ("requote_title", lambda fm: requote_lines(fm, keys={"title"})),
+    ("fix_yaml", lambda fm: split_frontmatter(fix_yaml.fix_content(f"---\n{fm}---\n"))[0]),
+    ("fix_yaml2", lambda fm: split_frontmatter(fix_yaml2.fix_content(f"---\n{fm}---\n"))[0]),
+    ("requote_all", lambda fm: requote_lines(fm)),
+]
+
+
+def validate_file(path: Path, dry_run: bool = False) -> Tuple[Path, str, str]:
+    """Validate one file and repair it if needed.
+
+    Returns (path, status, detail) where status is "ok", "fixed", "failed"
+    or "skipped", and detail is the heuristic used or the problem found.
+    """
+    content = path.read_text(encoding="utf-8")
+    split = split_frontmatter(content)
+    if split is None:
+        return path, "skipped", "no frontmatter"
+    frontmatter, body = split
+
+    problem = check_frontmatter(frontmatter)
+    if problem is None:
+        return path, "ok", ""
+
+    for name, heuristic in HEURISTICS:
+        try:
+            candidate = heuristic(frontmatter)
+        except (ValueError, TypeError, IndexError):
+            continue
+        if candidate != frontmatter and check_frontmatter(candidate) is None:
+            if not dry_run:
+                path.write_text(f"---\n{candidate}---\n{body}", encoding="utf-8")
+            return path, "fixed", name
+
+    return path, "failed", problem
+
+
+def find_files(paths, catalog: Catalog) -> Tuple[list, dict]:
+    """Files that need validating, and counts of files known not to.
+
+    Files given explicitly are always validated. For directories, the
+    content catalog is refreshed (one scandir walk, reading only new or
+    changed files) and only files whose frontmatter it found broken are
+    returned; valid and metadata-less ones are just counted.
+    """
+    files = []
+    known = {"ok": 0, "skipped": 0}
+    for path in paths:
+        if path.is_file():
+            files.append(path)
+            continue
+        if not path.is_dir():
+            continue
+        catalog.refresh(path)
+        files.extend(catalog.files(path, suffixes=SUFFIXES, metadata=("broken",), recursive=False))
+        known["ok"] += len(catalog.files(path, suffixes=SUFFIXES, metadata=("yaml",), recursive=False))
+        known["skipped"] += len(catalog.files(path, suffixes=SUFFIXES, metadata=("nikola", "none"), recursive=False))
+    return sorted(files), known
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and repair YAML frontmatter")
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        type=Path,
+        default=DEFAULT_DIRS,
+        help="Files or directories to check (default: myblog/content/posts and myblog/content/es/posts)",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report what would be repaired without making changes",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: CPU count)",
+    )
+    args = parser.parse_args()
+
+    catalog = Catalog.for_path(args.paths[0])
+    files, known = find_files(args.paths, catalog)
+    if not files and not any(known.values()):
+        print("No files found to check", file=sys.stderr)
+        sys.exit(1)
+
+    if Loader is yaml.SafeLoader:
+        print("Note: libyaml is not available, using the pure Python YAML loader")
+
+    results = {"ok": [], "fixed": [], "failed": [], "skipped": []}
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        chunksize = max(1, len(files) // (args.jobs * 8))
+        for path, status, detail in pool.map(
+            validate_file, files, [args.dry_run] * len(files), chunksize=chunksize
+        ):
+            results[status].append((path, detail))
+            if status == "fixed" and not args.dry_run:
+                catalog.record(path, None, "repair_yaml")
+    catalog.close()
+
+    prefix = "[DRY RUN] Would fix" if args.dry_run else "Fixed"
+    for path, heuristic in results["fixed"]:
+        print(f"{prefix}: {path} ({heuristic})")
+    for path, problem in results["failed"]:
+        print(f"Still broken: {path}: {problem}")
+
+    by_heuristic = {}
+    for _, heuristic in results["fixed"]:
+        by_heuristic[heuristic] = by_heuristic.get(heuristic, 0) + 1
+
+    print(f"\n{'=' * 60}")
+    print(f"Checked {len(files) + sum(known.values())} file(s):")
+    print(f"  Valid:        {len(results['ok']) + known['ok']}")
+    print(f"  Repaired:     {len(results['fixed'])}")
+    for name, _ in HEURISTICS:
+        if name in by_heuristic:
+            print(f"    {name}: {by_heuristic[name]}")
+    print(f"  Still broken: {len(results['failed'])}")
+    print(f"  No frontmatter: {len(results['skipped']) + known['skipped']}")
+
+    if results["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
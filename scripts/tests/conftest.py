@@ -0,0 +1,49 @@
+"""Make the flat helper modules in scripts/ importable from the tests, and
+build small Nikola sites for them to import."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import import_site  # noqa: E402
+
+POST = """.. title: {title}
+.. slug: {slug}
+.. date: 2020/01/{day:02d} 03:04
+.. tags: {tags}
+
+{title} body, with a few words to shingle.
+"""
+
+
+def write_site(site: Path, posts: int = 6):
+    """A Nikola site: posts (one translated), a page, a gallery, images, files and a listing."""
+    (site / "posts").mkdir(parents=True)
+    for number in range(1, posts + 1):
+        text = POST.format(title=f"Post {number}", slug=f"post-{number}", day=number, tags="a, b")
+        (site / "posts" / f"post-{number}.txt").write_text(text, encoding="utf-8")
+    (site / "posts" / "post-1.es.txt").write_text(
+        POST.format(title="Entrada 1", slug="post-1", day=1, tags="a"), encoding="utf-8")
+    (site / "pages").mkdir()
+    (site / "pages" / "about.txt").write_text(
+        POST.format(title="About", slug="about", day=1, tags=""), encoding="utf-8")
+    (site / "galleries" / "trip").mkdir(parents=True)
+    (site / "galleries" / "trip" / "a.jpg").write_bytes(b"not really a jpeg")
+    (site / "images").mkdir()
+    (site / "images" / "logo.png").write_bytes(b"not really a png")
+    (site / "files" / "docs").mkdir(parents=True)
+    (site / "files" / "docs" / "guide.pdf").write_bytes(b"%PDF")
+    (site / "listings").mkdir()
+    (site / "listings" / "hello.py").write_text("print('hello')\n", encoding="utf-8")
+    return site
+
+
+@pytest.fixture
+def nikola_site(tmp_path, monkeypatch):
+    """A Nikola site in tmp_path/mysite, with tmp_path as the working directory."""
+    monkeypatch.chdir(tmp_path)
+    yield write_site(tmp_path / "mysite")
+    import_site.close_pool()
@@ -0,0 +1,140 @@
+"""Which members of a source archive (--source site.tar / .zip) the import reads."""
+
+import io
+import tarfile
+import zipfile
+
+import pytest
+
+import import_site
+
+MEMBERS = {
+    "posts/hello.txt": "wanted",
+    "pages/about.txt": "wanted",
+    "cache/posts/hello.html": "wanted",
+    "cache/posts/hello.html.dep": "wanted",
+    "cache/other.json": "skipped",
+    ".doit.db": "wanted",
+    ".doit.db.dat": "wanted",
+    "output/posts/hello.html": "harvest",
+    "output/assets/css/theme.css": "skipped",
+    "themes/mine/templates/base.tmpl": "skipped",
+    "plugins/plugin.py": "skipped",
+    "conf.py": "skipped",
+    "galleries/trip/a.jpg": "wanted",
+    "images/logo.png": "wanted",
+    "files/robots.txt": "wanted",
+    "listings/hello.py": "wanted",
+}
+
+
+def write_tar(path, members, prefix):
+    with tarfile.open(path, "w:gz" if path.name.endswith(".tar.gz") else "w") as tar:
+        for name in members:
+            data = name.encode("utf-8")
+            info = tarfile.TarInfo(prefix + name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+def write_zip(path, members, prefix):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name in members:
+            archive.writestr(prefix + name, name)
+
+
+def read_members(tmp_path, archive, **options):
+    """What stage_archive leaves readable: unpacked files, and members read from the archive."""
+    with import_site.Site(import_site.ImportConfig(source=archive, target=tmp_path / "myblog", **options)) as site:
+        import_site.stage_archive(site, archive)
+        root = site.source_dir
+        unpacked = {path.relative_to(root).as_posix(): path.read_text() for path in root.rglob("*") if path.is_file()}
+        indexed = {
+            path.relative_to(root).as_posix(): site.source.read_text(path)
+            for path, member in site.source.members.items()
+            if member.data is not None or member.location is not None
+        }
+        return unpacked, indexed
+
+
+@pytest.mark.parametrize("writer, suffix", [(write_tar, ".tar"), (write_tar, ".tar.gz"), (write_zip, ".zip")])
+@pytest.mark.parametrize("prefix", ["", "mysite/"])
+def test_only_wanted_members_are_read(tmp_path, writer, suffix, prefix):
+    archive = tmp_path / f"mysite{suffix}"
+    writer(archive, MEMBERS, prefix)
+    unpacked, indexed = read_members(tmp_path, archive)
+    assert set(unpacked) | set(indexed) == {name for name, status in MEMBERS.items() if status == "wanted"}
+    assert indexed["posts/hello.txt"] == "posts/hello.txt"
+    assert indexed["cache/posts/hello.html"] == "cache/posts/hello.html"
+
+
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz", ".zip"])
+def test_only_media_are_unpacked(tmp_path, suffix):
+    archive = tmp_path / f"mysite{suffix}"
+    (write_zip if suffix == ".zip" else write_tar)(archive, MEMBERS, "mysite/")
+    unpacked, indexed = read_members(tmp_path, archive)
+    assert set(unpacked) == {
+        ".doit.db", ".doit.db.dat", "galleries/trip/a.jpg", "images/logo.png", "files/robots.txt", "listings/hello.py",
+    }
+    assert not set(unpacked) & set(indexed)
+
+
+def test_compressed_archives_are_held_in_memory(tmp_path):
+    for suffix in (".tar", ".tar.gz"):
+        archive = tmp_path / f"mysite{suffix}"
+        write_tar(archive, MEMBERS, "")
+        with import_site.Site(import_site.ImportConfig(source=archive, target=tmp_path / "myblog")) as site:
+            import_site.stage_archive(site, archive)
+            member = site.source.members[site.source_dir / "posts" / "hello.txt"]
+            # Uncompressed tars are read again by offset
+            assert (member.data is None) == (suffix == ".tar")
+
+
+def test_skipped_members_are_listed(tmp_path):
+    archive = tmp_path / "mysite.tar"
+    write_tar(archive, MEMBERS, "")
+    with import_site.Site(import_site.ImportConfig(source=archive, target=tmp_path / "myblog")) as site:
+        import_site.stage_archive(site, archive)
+        template = site.source_dir / "themes" / "mine" / "templates" / "base.tmpl"
+        assert site.source.exists(template)
+        assert site.source.stat(template).st_size == len("themes/mine/templates/base.tmpl")
+        with pytest.raises(FileNotFoundError):
+            site.source.read_bytes(template)
+
+
+def test_harvest_reads_rendered_pages(tmp_path):
+    archive = tmp_path / "mysite.tar"
+    write_tar(archive, MEMBERS, "")
+    _, indexed = read_members(tmp_path, archive, harvest_output=True)
+    assert "output/posts/hello.html" in indexed
+    assert "output/assets/css/theme.css" not in indexed
+
+
+def test_members_outside_the_site_are_skipped(tmp_path):
+    archive = tmp_path / "mysite.tar"
+    write_tar(archive, ["posts/hello.txt", "../evil.txt", "posts/../../evil.txt"], "")
+    unpacked, indexed = read_members(tmp_path, archive)
+    assert not unpacked
+    assert set(indexed) == {"posts/hello.txt"}
+    assert not (tmp_path / "evil.txt").exists()
+
+
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz", ".zip"])
+def test_archive_import_matches_folder_import(nikola_site, tmp_path, suffix):
+    archive = tmp_path / f"mysite{suffix}"
+    if suffix == ".zip":
+        with zipfile.ZipFile(archive, "w") as zf:
+            for path in sorted(nikola_site.rglob("*")):
+                if path.is_file():
+                    zf.write(path, "mysite/" + path.relative_to(nikola_site).as_posix())
+    else:
+        with tarfile.open(archive, "w:gz" if suffix == ".tar.gz" else "w") as tar:
+            tar.add(nikola_site, arcname="mysite")
+    assert import_site.run_import(import_site.ImportConfig(source=archive, target=tmp_path / "from-archive"))
+    assert import_site.run_import(import_site.ImportConfig(source=nikola_site, target=tmp_path / "from-folder"))
+
+    def content(root):
+        return {path.relative_to(root).as_posix(): path.read_bytes()
+                for path in sorted((root / "content").rglob("*")) if path.is_file()}
+    assert content(tmp_path / "from-archive") == content(tmp_path / "from-folder")
+    assert not (tmp_path / "from-archive" / import_site.ARCHIVE_STAGING_NAME).exists()
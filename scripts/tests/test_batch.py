@@ -0,0 +1,49 @@
+"""Batches of sites (--batch), imported side by side."""
+
+import contextlib
+import io
+import sys
+
+import import_site
+from conftest import write_site
+
+
+def content_files(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes()
+            for path in sorted((root / "content").rglob("*")) if path.is_file()}
+
+
+def test_batch_matches_separate_imports(nikola_site, tmp_path, capsys):
+    other = write_site(tmp_path / "othersite", posts=3)
+    configs = [
+        import_site.ImportConfig(source=nikola_site, target=tmp_path / "batch-1", convert_rst="html"),
+        import_site.ImportConfig(source=other, target=tmp_path / "batch-2", harvest_output=True),
+        import_site.ImportConfig(source=tmp_path / "missing", target=tmp_path / "batch-3"),
+    ]
+    assert not import_site.run_batch(configs)
+    out = capsys.readouterr().out
+
+    # Each site's output is printed whole, in batch order
+    sources = [line for line in out.splitlines() if line.startswith("Source: ")]
+    assert sources == [f"Source: {config.source.absolute()}" for config in configs]
+    assert out.index("Error: Source directory not found") > out.index(f"Source: {other.absolute()}")
+    assert "missing source" in out
+
+    for number, config in enumerate(configs[:2], 1):
+        assert import_site.run_import(config._replace(target=tmp_path / f"single-{number}"))
+        assert content_files(tmp_path / f"batch-{number}") == content_files(tmp_path / f"single-{number}")
+
+
+def test_pool_output_goes_to_the_site_buffer(capsys):
+    output = import_site.ThreadOutput(sys.stdout)
+    # As run_buffered does for each site's thread
+    output.share(io.StringIO())
+    try:
+        with contextlib.redirect_stdout(output):
+            assert list(import_site.pool_map(print, ["from a process"])) == [None]
+            with import_site.thread_pool() as pool:
+                list(pool.map(print, ["from a thread"]))
+    finally:
+        import_site.close_pool()
+    assert output.buffer().getvalue() == "from a process\nfrom a thread\n"
+    assert capsys.readouterr().out == ""
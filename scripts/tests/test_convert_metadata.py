@@ -0,0 +1,61 @@
+"""Nikola to YAML metadata conversion (convert_metadata.py) and the catalog's view of it."""
+
+import sys
+
+import pytest
+
+import catalog
+import convert_metadata
+
+COMMENT = "<!--\n.. title: Late\n.. slug: late\n-->\n"
+
+# Texts convert_metadata.py converts (True) or leaves alone (False)
+SAMPLES = [
+    (COMMENT + "Body\n", True),
+    ("Preamble\n\n" + COMMENT + "Body\n", True),
+    ("<!-- .. title: One line -->\nBody\n", False),
+    ("<!--\n.. title: \n-->\nBody\n", False),
+    ("<!--\nA note\n-->\n" + COMMENT + "Body\n", False),
+    ("---\ntitle: YAML\n" + COMMENT, False),
+    ("----\n" + COMMENT, False),
+    ("Body\n", False),
+]
+
+
+@pytest.mark.parametrize("text, converts", SAMPLES)
+def test_catalog_classifies_like_the_converter(text, converts):
+    assert (convert_metadata.convert_content(text)[0] is not None) == converts
+    if not text.startswith("---\n"):
+        assert (catalog.metadata_status(text) == "nikola") == converts
+
+
+def test_comment_past_the_head_is_found(tmp_path):
+    post = tmp_path / "late.md"
+    post.write_text("x" * convert_metadata.HEAD_SIZE + "\n" + COMMENT + "Body\n", encoding="utf-8")
+    converted, _ = convert_metadata.convert_path(post)
+    assert converted
+    assert post.read_text(encoding="utf-8").startswith("---\n")
+
+
+def test_directories_convert_files_with_a_late_comment(tmp_path, monkeypatch, capsys):
+    posts = tmp_path / "content" / "posts"
+    posts.mkdir(parents=True)
+    (posts / "late.md").write_text("x" * convert_metadata.HEAD_SIZE + "\n" + COMMENT + "Body\n", encoding="utf-8")
+    (posts / "plain.md").write_text("Body\n", encoding="utf-8")
+    monkeypatch.setattr(sys, "argv", ["convert_metadata.py", "--jobs", "1", str(posts)])
+    convert_metadata.main()
+    assert "Converted: 1" in capsys.readouterr().out
+    assert (posts / "late.md").read_text(encoding="utf-8").startswith("---\n")
+
+
+def test_catalogs_from_an_older_classifier_are_reread(tmp_path):
+    posts = tmp_path / "content" / "posts"
+    posts.mkdir(parents=True)
+    (posts / "late.md").write_text("Preamble\n\n" + COMMENT, encoding="utf-8")
+    with catalog.Catalog(tmp_path) as db:
+        db.refresh()
+        db.db.execute("UPDATE files SET metadata = 'none'")
+        db.db.execute("PRAGMA user_version = 1")
+    with catalog.Catalog(tmp_path) as db:
+        assert db.refresh()["changed"] == 1
+        assert db.files(posts, metadata=("nikola",)) == [posts / "late.md"]
@@ -0,0 +1,81 @@
+"""The listings highlight cache (--prerender-listings) Nicolino's Listings module reads."""
+
+import html
+import os
+import sys
+
+import pytest
+
+import import_site
+
+# Pinned in spec/listings_spec.cr too; keep both in sync
+SETTINGS = f"{import_site.LISTINGS_HIGHLIGHTER}\ntartrazine 0.20.1\n"
+KEY = "f6e882771da1a43ded3421fa681f928ff3cdfb5eab3c246ce0702eb664e0eec6"
+
+# Stands in for the tartrazine CLI: knows .py and .rb, like a real lexer list
+FAKE_TARTRAZINE = f"""#!{sys.executable}
+import html, sys
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("0.20.1")
+    sys.exit()
+source = args[0]
+if not source.endswith((".py", ".rb")):
+    sys.exit("no lexer")
+with open(source, encoding="utf-8") as f:
+    code = html.escape(f.read())
+with open(args[args.index("-o") + 1], "w", encoding="utf-8") as f:
+    f.write(f'<pre class="b"><code>{{code}}</code></pre>')
+"""
+
+
+@pytest.fixture(autouse=True)
+def tartrazine(tmp_path_factory, monkeypatch):
+    bin_dir = tmp_path_factory.mktemp("bin")
+    script = bin_dir / "tartrazine"
+    script.write_text(FAKE_TARTRAZINE, encoding="utf-8")
+    script.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_key_matches_the_build(tmp_path):
+    listing = tmp_path / "hello.py"
+    listing.write_text("print('hello')\n", encoding="utf-8")
+    assert import_site.highlight_listing((listing, SETTINGS, tmp_path)) == (listing, KEY, True)
+    assert (tmp_path / f"{KEY}.html").read_text(encoding="utf-8") == (
+        f'<pre class="b"><code>{html.escape(listing.read_text(encoding="utf-8"))}</code></pre>')
+    assert import_site.highlight_listing((listing, SETTINGS, tmp_path)) == (listing, KEY, False)
+
+
+def test_file_name_is_part_of_the_key(tmp_path):
+    keys = set()
+    for name in ("a.py", "a.rb"):
+        listing = tmp_path / name
+        listing.write_text("x = 1\n", encoding="utf-8")
+        keys.add(import_site.highlight_listing((listing, SETTINGS, tmp_path))[1])
+    assert len(keys) == 2
+
+
+def test_files_without_a_lexer_are_left_to_the_build(tmp_path):
+    listing = tmp_path / "notes.unknown-extension"
+    listing.write_text("x = 1\n", encoding="utf-8")
+    assert import_site.highlight_listing((listing, SETTINGS, tmp_path)) == (listing, None, False)
+    assert not list(tmp_path.glob("*.html")) and not list(tmp_path.glob(".*.tmp"))
+
+
+def test_settings_name_the_build_highlighter_and_its_version():
+    assert import_site.listing_settings() == SETTINGS
+
+
+def test_no_cache_without_tartrazine(monkeypatch):
+    monkeypatch.setenv("PATH", "")
+    assert import_site.listing_settings() is None
+
+
+def test_prerender_fills_the_cache(nikola_site, tmp_path):
+    config = import_site.ImportConfig(source=nikola_site, target=tmp_path / "myblog", prerender_listings=True)
+    assert import_site.run_import(config)
+    cache = tmp_path / "myblog" / ".listings-cache"
+    assert (cache / "settings.txt").read_text(encoding="utf-8") == SETTINGS
+    assert not (cache / "listings.css").exists()
+    assert len(list(cache.glob("*.html"))) == 1
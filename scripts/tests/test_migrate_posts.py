@@ -0,0 +1,26 @@
+"""Frontmatter conversion in migrate_posts.py and the shared migrate_common helpers."""
+
+import migrate_common
+import migrate_posts
+
+POST = """<!--
+.. title: Bold tags
+.. date: 2012/03/04 17:40
+.. tags: **python**, *nikola*, **
+-->
+
+Some text.
+"""
+
+
+def test_migrate_posts_strips_emphasis_from_tags(tmp_path):
+    source = tmp_path / "1001.txt"
+    source.write_text(POST, encoding="utf-8")
+    target = migrate_posts.process_file(source, tmp_path)
+    metadata, _ = migrate_common.parse_frontmatter(target.read_text(encoding="utf-8"))
+    assert metadata["tags"] == ["python", "nikola"]
+
+
+def test_tags_are_kept_verbatim_by_default():
+    metadata, _ = migrate_common.parse_frontmatter(POST)
+    assert migrate_common.nicolino_frontmatter(metadata)["tags"] == ["**python**", "*nikola*", "**"]
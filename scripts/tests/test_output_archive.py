@@ -0,0 +1,40 @@
+"""Output archives (--output-archive) written by import_site.py."""
+
+import tarfile
+
+import import_site
+
+
+def test_archive_source_to_output_archive(nikola_site, tmp_path):
+    source = tmp_path / "mysite.tar"
+    with tarfile.open(source, "w") as tar:
+        tar.add(nikola_site, arcname="mysite")
+    output = tmp_path / "site.tar"
+    config = import_site.ImportConfig(source=source, target=tmp_path / "myblog", output_archive=output)
+    assert import_site.run_import(config)
+
+    with tarfile.open(output) as tar:
+        names = tar.getnames()
+    assert "myblog/content/posts/post-1.rst" in names
+    assert not [name for name in names if import_site.ARCHIVE_STAGING_NAME in name]
+    # Nothing left behind: the tree only existed in a temporary folder
+    assert not (tmp_path / "myblog").exists()
+
+
+def test_files_not_read_back_skip_the_tree(nikola_site, tmp_path):
+    output = tmp_path / "site.tar"
+    config = import_site.ImportConfig(source=nikola_site, target=tmp_path / "myblog", output_archive=output)
+    with import_site.Site(config) as site:
+        assert import_site.migrate_site(site)
+        on_disk = {path.relative_to(site.target_dir).as_posix()
+                   for path in site.target_dir.rglob("*") if path.is_file()}
+        streamed = {path.relative_to(site.target_dir).as_posix()
+                    for path, member in site.output.members.items() if member is not None}
+
+    assert {"content/posts/post-1.rst", "assets/docs/guide.pdf", "content/listings/hello.py"} <= streamed
+    assert not [name for name in on_disk if name.startswith(("content/posts/", "content/pages/", "assets/"))]
+    with tarfile.open(output) as tar:
+        names = set(tar.getnames())
+        assert tar.extractfile("myblog/assets/docs/guide.pdf").read() == b"%PDF"
+    assert {f"myblog/{name}" for name in on_disk | streamed} <= names
+    assert "myblog/assets/docs" in names
@@ -0,0 +1,43 @@
+"""The single-pass post-import conversions (convert_pipeline.py)."""
+
+import convert_pipeline
+import fix_yaml
+import fix_yaml2
+from catalog import Catalog
+
+# Parses as YAML, but fix_yaml2 still rewrites the title
+PARSING_POST = """---
+title: 'It''s here'
+date: 2020-01-01
+---
+Body
+"""
+
+
+def run_pipeline(site):
+    (site / "conf.yml").write_text("site:\n  title: test\n", encoding="utf-8")
+    content = site / "content"
+    pipeline = convert_pipeline.Pipeline(content, [])
+    with Catalog.for_path(content) as catalog:
+        files = convert_pipeline.find_files(catalog, content, pipeline)
+    return [pipeline.run(path) for path in files]
+
+
+def test_posts_that_parse_still_get_the_yaml_fixes(tmp_path):
+    post = tmp_path / "content" / "posts" / "quoted.md"
+    post.parent.mkdir(parents=True)
+    post.write_text(PARSING_POST, encoding="utf-8")
+
+    docs = run_pipeline(tmp_path)
+    assert [doc.source for doc in docs] == [post]
+    assert post.read_text(encoding="utf-8") == fix_yaml2.fix_content(fix_yaml.fix_content(PARSING_POST))
+    assert post.read_text(encoding="utf-8") != PARSING_POST
+
+
+def test_pages_are_not_yaml_fixed(tmp_path):
+    page = tmp_path / "content" / "pages" / "quoted.md"
+    page.parent.mkdir(parents=True)
+    page.write_text(PARSING_POST, encoding="utf-8")
+
+    assert not run_pipeline(tmp_path)
+    assert page.read_text(encoding="utf-8") == PARSING_POST
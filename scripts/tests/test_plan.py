@@ -0,0 +1,89 @@
+"""Dry-run plans (--dry-run, --save-plan, --run-plan)."""
+
+import tarfile
+import zipfile
+
+import pytest
+
+import import_site
+from conftest import POST
+
+
+def plan(source, target, **options):
+    with import_site.Site(import_site.ImportConfig(source=source, target=target, **options)) as site:
+        return import_site.plan_import(site)
+
+
+def test_plan_matches_the_import(nikola_site, tmp_path):
+    target = tmp_path / "myblog"
+    actions = plan(nikola_site, target)
+    assert not import_site.plan_collisions(actions)
+    assert {action.action for action in actions} == {"convert", "copy"}
+
+    assert import_site.run_import(import_site.ImportConfig(source=nikola_site, target=target))
+    written = {path.relative_to(target).as_posix() for path in target.rglob("*") if path.is_file()}
+    planned = {action.target for action in actions if action.action in ("convert", "copy")}
+    assert planned <= written
+    # Whatever else the import wrote is an index or manifest it generates
+    assert all(name.startswith(".nicolino-") or name.startswith("redirects.") or name.endswith("/index.json")
+               for name in written - planned)
+
+
+def test_plan_writes_nothing(nikola_site, tmp_path):
+    plan_file = tmp_path / "plan.json"
+    assert import_site.dry_run(import_site.ImportConfig(source=nikola_site, target=tmp_path / "myblog"), plan_file)
+    assert plan_file.exists()
+    assert not (tmp_path / "myblog").exists()
+
+
+def test_plan_flags_pages_written_to_the_same_target(nikola_site, tmp_path):
+    (nikola_site / "pages" / "about-us.txt").write_text(
+        POST.format(title="About us", slug="about", day=2, tags=""), encoding="utf-8")
+    collisions = import_site.plan_collisions(plan(nikola_site, tmp_path / "myblog"))
+    assert collisions == {"content/pages/about.rst": ["pages/about-us.txt", "pages/about.txt"]}
+
+
+def test_plan_skips_other_shards(nikola_site, tmp_path):
+    sources = set()
+    for index in (1, 2):
+        actions = plan(nikola_site, tmp_path / "myblog", shard=(index, 2))
+        skipped = {action.source for action in actions if action.note == "other shard"}
+        imported = {action.source for action in actions if action.action in ("convert", "copy")}
+        assert not skipped & imported
+        sources |= imported
+    assert sources == {action.source for action in plan(nikola_site, tmp_path / "myblog")}
+
+
+def archive_of(site, path):
+    if path.suffix == ".zip":
+        with zipfile.ZipFile(path, "w") as archive:
+            for file in sorted(site.rglob("*")):
+                if file.is_file():
+                    archive.write(file, "mysite/" + file.relative_to(site).as_posix())
+    else:
+        with tarfile.open(path, "w:gz" if path.name.endswith(".gz") else "w") as archive:
+            archive.add(site, arcname="mysite")
+    return path
+
+
+@pytest.mark.parametrize("name", ["mysite.tar", "mysite.tar.gz", "mysite.zip"])
+def test_archive_plan_matches_the_folder_plan(nikola_site, tmp_path, name):
+    archive = archive_of(nikola_site, tmp_path / name)
+    for options in ({}, {"shard": (1, 2)}):
+        from_folder = plan(nikola_site, tmp_path / "myblog", **options)
+        from_archive = plan(archive, tmp_path / "myblog", **options)
+        # Archives keep whole-second (zip: two-second) timestamps
+        assert [action._replace(mtime_ns=0) for action in from_archive] == \
+            [action._replace(mtime_ns=0) for action in from_folder]
+    assert not (tmp_path / "myblog").exists()
+
+
+def test_archive_plan_runs(nikola_site, tmp_path, capsys):
+    archive = archive_of(nikola_site, tmp_path / "mysite.tar.gz")
+    plan_file = tmp_path / "plan.json"
+    config = import_site.ImportConfig(source=archive, target=tmp_path / "myblog", downscale=100)
+    assert import_site.dry_run(config, plan_file)
+    assert not (tmp_path / "myblog").exists()
+    assert f"Source: {archive.absolute()}" in capsys.readouterr().out
+    assert import_site.run_plan(plan_file)
+    assert (tmp_path / "myblog" / "content" / "posts" / "post-1.rst").exists()
@@ -0,0 +1,73 @@
+"""Sharded imports (--shard) and merging them (--merge-shards)."""
+
+import json
+
+import import_site
+
+
+def test_shard_of_is_stable_and_in_range():
+    keys = [f"posts/post-{number}" for number in range(200)]
+    shards = [import_site.shard_of(key, 4) for key in keys]
+    assert shards == [import_site.shard_of(key, 4) for key in keys]
+    assert set(shards) == {1, 2, 3, 4}
+    assert all(import_site.shard_of(key, 1) == 1 for key in keys)
+
+
+def test_translations_share_a_shard(nikola_site, tmp_path):
+    site = import_site.Site(import_site.ImportConfig(source=nikola_site, target=tmp_path / "myblog"))
+    original = import_site.shard_key(site, nikola_site / "posts" / "post-1.txt")
+    assert original == "posts/post-1"
+    assert import_site.shard_key(site, nikola_site / "posts" / "post-1.es.txt") == original
+
+
+def test_each_source_lands_in_exactly_one_shard(nikola_site, tmp_path):
+    sources = sorted((nikola_site / "posts").iterdir())
+    owners = []
+    for index in (1, 2, 3):
+        site = import_site.Site(import_site.ImportConfig(source=nikola_site, target=tmp_path / "myblog", shard=(index, 3)))
+        owners.append({source for source in sources if import_site.in_shard(site, source)})
+    assert sorted(source for owned in owners for source in owned) == sources
+
+
+def jsonl_records(data):
+    """The records of a JSONL index, in a canonical order and without mtimes."""
+    records = []
+    for line in data.decode("utf-8").splitlines():
+        record = json.loads(line)
+        record.pop("mtime_ns", None)
+        records.append(json.dumps(record, sort_keys=True))
+    return sorted(records)
+
+
+def site_files(root):
+    """Relative path -> contents of every file. Index records are unordered."""
+    files = {}
+    for path in sorted(root.rglob("*")):
+        if not path.is_file():
+            continue
+        rel = path.relative_to(root).as_posix()
+        data = path.read_bytes()
+        files[rel] = jsonl_records(data) if rel.endswith(".jsonl") else data
+    return files
+
+
+def test_merged_shards_match_a_single_import(nikola_site, tmp_path):
+    options = dict(source=nikola_site, search_index=True)
+    assert import_site.run_import(import_site.ImportConfig(target=tmp_path / "single", **options))
+    for index in (1, 2):
+        assert import_site.run_import(import_site.ImportConfig(target=tmp_path / "merged", shard=(index, 2), **options))
+
+    assert import_site.merge_shards(tmp_path / "merged")
+    assert site_files(tmp_path / "merged") == site_files(tmp_path / "single")
+
+
+def test_merge_refuses_missing_shards(nikola_site, tmp_path, capsys):
+    assert import_site.run_import(import_site.ImportConfig(source=nikola_site, target=tmp_path / "merged", shard=(1, 2)))
+    assert not import_site.merge_shards(tmp_path / "merged")
+    assert "Missing shards [2] of 2" in capsys.readouterr().out
+    assert not (tmp_path / "merged").exists()
+
+
+def test_merge_without_shards(tmp_path, capsys):
+    assert not import_site.merge_shards(tmp_path / "merged")
+    assert "No shards found" in capsys.readouterr().out
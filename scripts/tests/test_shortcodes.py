@@ -0,0 +1,31 @@
+"""Static shortcode templates (--expand-shortcodes) and the shortcode usage index."""
+
+import import_site
+
+
+def test_named_and_string_key_lookups_are_static():
+    assert import_site.static_template('<a href="{{ args.url }}">{{ args["0"] }}</a>\n') == [
+        '<a href="', "url", '">', "0", "</a>"]
+
+
+def test_numeric_subscripts_are_left_to_the_build():
+    # Crinja looks these up by integer and renders nothing
+    assert import_site.static_template("<b>{{ args[0] }}</b>") is None
+    assert import_site.static_template("<b>{{ args.0 }}</b>") is None
+
+
+def test_statements_and_filters_are_not_static():
+    assert import_site.static_template("{% if args.x %}x{% endif %}") is None
+    assert import_site.static_template("{{ args.x | upper }}") is None
+
+
+def test_only_static_calls_are_expanded(tmp_path):
+    templates = tmp_path / "shortcodes"
+    templates.mkdir()
+    (templates / "quoted.tmpl").write_text('<q>{{ args["0"] }}</q>\n', encoding="utf-8")
+    (templates / "first.tmpl").write_text("<b>{{ args[0] }}</b>\n", encoding="utf-8")
+    index = import_site.ShortcodeIndex(templates, True, tmp_path)
+
+    body = index.process(tmp_path / "post.md", "{{% quoted hi %}} {{% first hi %}}")
+    assert body == "<q>hi</q> {{% first hi %}}"
+    assert index.files == {"post.md": ["first"]}